@@ -3,14 +3,21 @@ import time
 import uuid
 import json
 import os
-from collections import defaultdict
 
+# SNS limits, see https://docs.aws.amazon.com/sns/latest/api/API_PublishBatch.html
+MAX_BATCH_ENTRIES = 10
+# Max size of a message, and of all the messages of a batch together.
+MAX_MESSAGE_BYTES = 256 * 1024
+
+_sns_client = None
 
 def lambda_handler(event, context):
     """
     AWS Lambda function to process events from SQS and publish them to SNS.
     
     The events are batched based on file path prefixes before published to an SNS topic.
+    The consecutive events of the records with the same prefix and sender are merged, and published in as few
+    requests as possible (see `BatchPublisher`), keeping the order of the events of each message group.
 
     Expected message body format:
     ```
@@ -38,34 +45,39 @@ def lambda_handler(event, context):
     Expected Env Vars:
      - SNS_TOPIC_ARN: The ARN of the SNS topic to publish to
     """
-    try:
-        if 'Records' not in event:
-            raise ValueError('No records')
-
-        sns = boto3.client('sns')
-
-        for message in event['Records']:
-            payload = json.loads(message['body'])
-            events_by_group_id = defaultdict(list)
-            if 'events' in payload:
-                for event in payload['events']:
-                    message = process_event(event)
-                    message_group_id = get_message_group_id(event)
-                    events_by_group_id[message_group_id].append(message)
-                for message_group_id, events in events_by_group_id.items():
-                    message_attributes = {
-                        'messageGroupId': {
-                            'DataType': 'String',
-                            'StringValue': message_group_id
-                        },
-                        'sender': {
-                            'DataType': 'String',
-                            'StringValue': payload['sender']
-                        }
-                    }
-                    publish(sns, json.dumps({'events': events}), message_group_id, message_attributes)
-    except (ValueError, json.JSONDecodeError) as e:
-        print('Error: ', e)
+    if 'Records' not in event:
+        print('Error: ', ValueError('No records'))
+        return
+
+    # Runs of consecutive messages of the same group and sender: (message group id, sender, messages), in the order
+    # they were received. The events of a run are published together, even if they came in different records, but
+    # not across the events of another sender in the same group, which would reorder the group.
+    runs = []
+    # message group id -> its last run
+    last_runs = {}
+    for record in event['Records']:
+        try:
+            payload = json.loads(record['body'])
+            messages = []
+            for evt in payload.get('events', []):
+                message = process_event(evt)
+                messages.append((get_message_group_id(evt), message))
+            sender = payload['sender'] if messages else None
+        except (ValueError, KeyError, json.JSONDecodeError) as e:
+            print('Error: ', e)
+            continue
+        for message_group_id, message in messages:
+            run = last_runs.get(message_group_id)
+            if run is None or run[1] != sender:
+                run = (message_group_id, sender, [])
+                runs.append(run)
+                last_runs[message_group_id] = run
+            run[2].append(message)
+
+    publisher = BatchPublisher(get_sns_client(), os.environ['SNS_TOPIC_ARN'])
+    for message_group_id, sender, messages in runs:
+        publisher.add(messages, message_group_id, sender)
+    publisher.flush()
 
 
 def process_event(event):
@@ -109,12 +121,91 @@ def get_path_prefix(path: str):
         path = path[len('albums/'):]
     return path.split('/')[0]
 
-def publish(sns_client, message: str, message_group_id: str, message_attributes):
+def get_sns_client():
+    """
+    Returns the SNS client, created once and reused by the invocations of a warm Lambda.
+    """
+    global _sns_client
+    if _sns_client is None:
+        _sns_client = boto3.client('sns')
+    return _sns_client
+
+class BatchPublisher:
+    """
+    Publishes events to the SNS topic with as few requests as possible.
+
+    The events of a group are split into as few messages as fit the SNS size limit,
+    and the messages are published up to 10 per request with `publish_batch`.
+    """
+    def __init__(self, sns_client, topic_arn: str):
+        self.sns_client = sns_client
+        self.topic_arn = topic_arn
+        self.entries = []
+        self.batch_bytes = 0
+
+    def add(self, events: list[dict], message_group_id: str, sender: str):
+        """
+        Queues the events of a group to be published, publishing the queued messages when a batch is full.
+        """
+        message_attributes = {
+            'messageGroupId': {
+                'DataType': 'String',
+                'StringValue': message_group_id
+            },
+            'sender': {
+                'DataType': 'String',
+                'StringValue': sender
+            }
+        }
+        # The message attributes count towards the size of the message.
+        attributes_bytes = sum(
+            len(name) + len(attr['DataType']) + len(attr['StringValue'].encode())
+            for name, attr in message_attributes.items()
+        )
+        for message in split_messages(events, MAX_MESSAGE_BYTES - attributes_bytes):
+            entry_bytes = len(message.encode()) + attributes_bytes
+            if len(self.entries) == MAX_BATCH_ENTRIES or self.batch_bytes + entry_bytes > MAX_MESSAGE_BYTES:
+                self.flush()
+            self.entries.append({
+                'Id': str(len(self.entries)),
+                'Message': message,
+                'MessageGroupId': message_group_id,
+                'MessageAttributes': message_attributes
+            })
+            self.batch_bytes += entry_bytes
+
+    def flush(self, max_retries: int = 2):
+        """
+        Publishes the queued messages. Raises an exception if some of them still fail after the retries,
+        so the Lambda fails and the records are processed again.
+        """
+        entries = self.entries
+        self.entries, self.batch_bytes = [], 0
+        for _ in range(max_retries + 1):
+            if not entries:
+                return
+            response = self.sns_client.publish_batch(TopicArn=self.topic_arn, PublishBatchRequestEntries=entries)
+            failed_ids = {failure['Id'] for failure in response.get('Failed', [])}
+            if failed_ids:
+                print('Failed to publish: ', response['Failed'])
+            entries = [entry for entry in entries if entry['Id'] in failed_ids]
+        if entries:
+            raise RuntimeError(f'Failed to publish {len(entries)} messages')
+
+def split_messages(events: list[dict], max_bytes: int) -> list[str]:
     """
-    Publish a message to the SNS topic.
+    Splits the events into as few `{"events": [...]}` messages as possible of at most `max_bytes` each.
     """
-    sns_client.publish(
-        TopicArn=os.environ['SNS_TOPIC_ARN'], 
-        Message=message, 
-        MessageGroupId=message_group_id,
-        MessageAttributes=message_attributes)
\ No newline at end of file
+    messages = []
+    chunk, chunk_bytes = [], 0
+    empty_bytes = len(json.dumps({'events': []}))
+    for event in events:
+        event_bytes = len(json.dumps(event).encode()) + 2 # ", " separator
+        if chunk and empty_bytes + chunk_bytes + event_bytes > max_bytes:
+            messages.append(json.dumps({'events': chunk}))
+            chunk, chunk_bytes = [], 0
+        chunk.append(event)
+        chunk_bytes += event_bytes
+    if chunk:
+        messages.append(json.dumps({'events': chunk}))
+    return messages
@@ -6,6 +6,7 @@
       "Action": [
         "sqs:ReceiveMessage",
         "sqs:DeleteMessage",
+        "sqs:ChangeMessageVisibility",
         "sqs:GetQueueAttributes"
       ],
       "Resource": "${queue_arn}"
@@ -21,6 +21,7 @@
         "Action": [
             "sqs:ReceiveMessage",
             "sqs:DeleteMessage",
+            "sqs:ChangeMessageVisibility",
             "sqs:GetQueueAttributes"
         ],
         "Principal": {
@@ -0,0 +1,196 @@
+import copy
+import heapq
+import os
+import threading
+from typing import Callable
+
+from app.utils import filesystem
+
+class AlbumIndex:
+    """
+    In-memory mirror of the album tree on disk.
+
+    The tree is walked once with `build()` and then kept up to date by the routes that change the filesystem,
+    so serving it doesn't require walking the albums directory.
+
+    Listeners are notified of the changes with `(action, key, new key)`, where action is "add", "remove" or "move",
+    and the new key is only set for "move".
+
+    Tree format (same as `filesystem.get_file_structure`): `{folderName: {...} | fileName: "", ...}`
+    """
+    def __init__(self, root_dir: str):
+        self.root_dir = root_dir.rstrip(os.sep)
+        self.root_name = os.path.basename(self.root_dir)
+        self.tree: dict = {}
+        self.lock = threading.RLock()
+        self.listeners: list[Callable[[str, str, str | None], None]] = []
+
+    def build(self):
+        """
+        (Re)builds the index by walking the albums directory.
+        """
+        tree = filesystem.get_file_structure(self.root_dir).get(self.root_name, {})
+        with self.lock:
+            self.tree = tree
+
+    def get_file_structure(self) -> dict:
+        """
+        Returns a copy of the indexed tree, including the root folder (e.g. `{"albums": {...}}`).
+        """
+        with self.lock:
+            return {self.root_name: copy.deepcopy(self.tree)}
+
+    def list_album(self, key: str, cursor: str = "", limit: int = 100, depth: int = 0) -> tuple[dict, str | None]:
+        """
+        Lists one page of the direct children of an album, ordered by name.
+
+        - `cursor` is the name of the last item of the previous page ("" for the first page).
+        - `depth` is how many levels of sub-albums to include. Sub-albums past the depth are returned as `{}`.
+
+        Returns the page of items and the cursor for the next page (None if this is the last page).
+        Raises KeyError if the album doesn't exist.
+        """
+        with self.lock:
+            loc = self.tree
+            for part in self._split(key):
+                loc = loc.get(part)
+                if not isinstance(loc, dict):
+                    raise KeyError(key)
+            # Only the requested page is sorted, so listing an album with n items is O(n log(limit)) per page.
+            names = heapq.nsmallest(limit + 1, (name for name in loc if name > cursor))
+            has_more = len(names) > limit
+            names = names[:limit]
+            items = {name: self._copy(loc[name], depth) for name in names}
+        return items, names[-1] if has_more else None
+
+    def list_files(self, key: str) -> list[str]:
+        """
+        Lists the keys ("albums/...") of all the files in an album and its sub-albums.
+        Returns an empty list if the album doesn't exist.
+        """
+        parts = self._split(key)
+        with self.lock:
+            loc = self.tree
+            for part in parts:
+                loc = loc.get(part)
+                if not isinstance(loc, dict):
+                    return []
+            files = []
+            stack = [("/".join([self.root_name, *parts]), loc)]
+            while stack:
+                path, node = stack.pop()
+                for name, child in node.items():
+                    if isinstance(child, dict):
+                        stack.append((f"{path}/{name}", child))
+                    else:
+                        files.append(f"{path}/{name}")
+        return files
+
+    def list_album_paths(self) -> list[str]:
+        """
+        Lists the paths of all the albums and sub-albums, without the "albums/" prefix (e.g. "Shared/a"), sorted.
+        """
+        with self.lock:
+            paths = []
+            stack = [("", self.tree)]
+            while stack:
+                path, node = stack.pop()
+                for name, child in node.items():
+                    if isinstance(child, dict):
+                        child_path = f"{path}/{name}" if path else name
+                        paths.append(child_path)
+                        stack.append((child_path, child))
+        return sorted(paths)
+
+    def subscribe(self, listener: Callable[[str, str, str | None], None]):
+        self.listeners.append(listener)
+
+    def add(self, key: str):
+        """
+        Adds a file to the index, creating any missing folders.
+
+        `key` can optionally include the prefix "albums/".
+        """
+        self._add(key)
+        self._notify("add", key)
+
+    def remove(self, key: str):
+        """
+        Removes a file from the index along with any folders left empty by the removal.
+
+        Mirrors `filesystem.remove_dirs`, so the top level folders ([Shared|username]) are never removed.
+        """
+        self._remove(key)
+        self._notify("remove", key)
+
+    def move(self, src_key: str, dest_key: str):
+        self._add(dest_key)
+        self._remove(src_key)
+        self._notify("move", src_key, dest_key)
+
+    def _notify(self, action: str, key: str, new_key: str | None = None):
+        for listener in list(self.listeners):
+            try:
+                listener(action, key, new_key)
+            except Exception as e:
+                print(f"Error in album index listener: {e}")
+
+    def _add(self, key: str):
+        parts = self._split(key)
+        if not parts:
+            return
+        with self.lock:
+            loc = self.tree
+            for part in parts[:-1]:
+                if not isinstance(loc.get(part), dict):
+                    loc[part] = {}
+                loc = loc[part]
+            if not isinstance(loc.get(parts[-1]), dict):
+                loc[parts[-1]] = ""
+
+    def _remove(self, key: str):
+        parts = self._split(key)
+        if not parts:
+            return
+        with self.lock:
+            locs = [self.tree]
+            for part in parts[:-1]:
+                loc = locs[-1].get(part)
+                if not isinstance(loc, dict):
+                    return
+                locs.append(loc)
+            if locs[-1].get(parts[-1]) != "":
+                return
+            del locs[-1][parts[-1]]
+
+            # Delete empty folders, stopping at the top level folder.
+            for i in range(len(locs) - 1, 1, -1):
+                if locs[i]:
+                    break
+                del locs[i - 1][parts[i - 1]]
+
+    def _copy(self, node: dict | str, depth: int) -> dict | str:
+        if not isinstance(node, dict):
+            return ""
+        if depth <= 0:
+            return {}
+        return {name: self._copy(child, depth - 1) for name, child in node.items()}
+
+    def _split(self, key: str) -> list[str]:
+        if key.strip('/') == self.root_name:
+            return []
+        return [p for p in filesystem.remove_albums_prefix(key).split('/') if p]
+
+_ALBUM_INDEX = None
+
+def init_album_index(root_dir: str):
+    global _ALBUM_INDEX
+    if _ALBUM_INDEX is not None:
+        return # Already initialized
+    _ALBUM_INDEX = AlbumIndex(root_dir)
+    _ALBUM_INDEX.build()
+
+def album_index():
+    if _ALBUM_INDEX is None:
+        raise RuntimeError("Album index not initialized. Run init_album_index() first.")
+    return _ALBUM_INDEX
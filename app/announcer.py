@@ -4,7 +4,7 @@ class EventAnnouncer:
     def __init__(self):
         self.subscribers: list[queue.Queue[str]] = []
 
-    def subscribe(self, queue_size = 10):
+    def subscribe(self, queue_size = 100):
         q = queue.Queue(queue_size)
         self.subscribers.append(q)
         # With JS EventSource, need to send a message on connection request to complete the connection. 
@@ -0,0 +1,199 @@
+import collections
+import os
+import threading
+import time
+import uuid
+from typing import Callable
+
+from app.utils import filesystem
+
+class BlobStore:
+    """
+    Content-addressed store of the album images, so that an image copied into several albums is stored once.
+
+    Each distinct content is stored once as `<blobs_dir>/<digest[:2]>/<digest>`, where `digest` is the SHA-256 of the
+    content. The album entries are hardlinks (or reflinks, see `copy()`) to their blob, so the copies of an image share
+    its bytes on disk.
+    Images are never modified in place (rotations and downloads write a new file and rename it over the entry),
+    which detaches the entry from its blob instead of changing the other copies.
+
+    A blob that no album entry links to anymore is deleted by `collect_garbage()`, which calls `on_collect` with its
+    digest, e.g. to delete its thumbnails.
+
+    The store must be on the same filesystem as the albums. If an entry can't be linked (e.g. the filesystem doesn't
+    support hardlinks, or the blob has too many links), it's kept as a plain file.
+    """
+    def __init__(
+        self,
+        blobs_dir: str,
+        content_digest: Callable[[str], str],
+        on_collect: Callable[[str], None] | None = None
+    ):
+        """
+        Args:
+            blobs_dir (str): Where the blobs are stored.
+            content_digest (Callable[[str], str]): Returns the SHA-256 hex digest of the image at the given path.
+            on_collect (Callable[[str], None] | None): Called with the digest of each blob deleted by `collect_garbage()`.
+        """
+        self.blobs_dir = blobs_dir
+        self.content_digest = content_digest
+        self.on_collect = on_collect
+        self.lock = threading.Lock()
+
+    def add(self, image_path: str) -> str:
+        """
+        Adds the image to the store. If the content is already stored, the image is replaced by a link to its blob.
+        Returns the digest of the image.
+        """
+        digest = self.content_digest(image_path)
+        blob_path = self.blob_path(digest)
+        with self.lock:
+            if _same_file(image_path, blob_path):
+                return digest
+            os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+            try:
+                # The first copy of a content becomes its blob.
+                os.link(image_path, blob_path)
+                return digest
+            except FileExistsError:
+                pass
+            except OSError as e:
+                print(f"Error adding {image_path} to the blob store: {e}")
+                return digest
+            try:
+                _replace_with_link(blob_path, image_path)
+            except OSError as e:
+                print(f"Error linking {image_path} to its blob: {e}")
+        return digest
+
+    def copy(self, path_pairs: list[tuple[str, str]]) -> tuple[dict[str, str], list[str]]:
+        """
+        Copies the images without copying their bytes: each copy is a reflink of the blob of its image if the
+        filesystem supports it, or a link to the blob. See `filesystem.copy_files`.
+
+        Returns the digests of the copied images by destination path, and the destination paths that failed.
+        """
+        digests = {}
+        sources = []
+        failure = []
+        for src_path, dest_path in path_pairs:
+            try:
+                digest = self.add(src_path)
+            except OSError as e:
+                print(f"Error adding {src_path} to the blob store: {e}")
+                failure.append(dest_path)
+                continue
+            blob_path = self.blob_path(digest)
+            # The image is copied itself if it couldn't be added to the store.
+            sources.append((blob_path if _same_file(src_path, blob_path) else src_path, dest_path))
+            digests[dest_path] = digest
+
+        methods, failed = filesystem.copy_files(sources)
+        print(f"Copied {len(methods)} images: {dict(collections.Counter(methods.values()))}")
+        failure.extend(failed)
+        for dest_path in failed:
+            digests.pop(dest_path, None)
+        return digests, failure
+
+    def migrate(self, albums_dir: str) -> dict:
+        """
+        Adds the images of an existing library to the store, replacing the duplicates by links to a single blob.
+        Safe to run again, the images already in the store are skipped after a stat.
+
+        Returns `{"images": int, "deduplicated": int, "savedBytes": int}`
+        """
+        stats = {"images": 0, "deduplicated": 0, "savedBytes": 0}
+        for root, _, files in os.walk(albums_dir):
+            for file in files:
+                if file.startswith('.'):
+                    continue # Partial downloads and links being created.
+                image_path = os.path.join(root, file)
+                try:
+                    st = os.stat(image_path)
+                    self.add(image_path)
+                    replaced = os.stat(image_path).st_ino != st.st_ino
+                except OSError as e:
+                    print(f"Error adding {image_path} to the blob store: {e}")
+                    continue
+                stats["images"] += 1
+                if replaced:
+                    stats["deduplicated"] += 1
+                    # The bytes are only freed if no other entry linked to the old file.
+                    if st.st_nlink == 1:
+                        stats["savedBytes"] += st.st_size
+        return stats
+
+    def collect_garbage(self) -> tuple[int, int]:
+        """
+        Deletes the blobs no album entry links to anymore. Returns the number of blobs deleted, and their total size.
+        """
+        deleted = 0
+        freed = 0
+        for root, _, files in os.walk(self.blobs_dir):
+            for file in files:
+                blob_path = os.path.join(root, file)
+                with self.lock:
+                    try:
+                        st = os.stat(blob_path)
+                    except FileNotFoundError:
+                        continue
+                    if st.st_nlink > 1:
+                        continue
+                    filesystem.silentremove(blob_path)
+                deleted += 1
+                freed += st.st_size
+                if self.on_collect is not None:
+                    self.on_collect(file)
+        return deleted, freed
+
+    def start_garbage_collection(self, interval: float):
+        """
+        Collects the garbage every `interval` seconds in the background.
+        """
+        def run():
+            while True:
+                try:
+                    deleted, freed = self.collect_garbage()
+                    if deleted:
+                        print(f"Deleted {deleted} unused blobs ({freed} bytes).")
+                except Exception as e:
+                    print(f"Error collecting unused blobs: {e}")
+                time.sleep(interval)
+
+        thread = threading.Thread(target=run, name="blob-garbage-collection", daemon=True)
+        thread.start()
+        return thread
+
+    def blob_path(self, digest: str) -> str:
+        return f"{self.blobs_dir}/{digest[:2]}/{digest}"
+
+def _same_file(path: str, other_path: str) -> bool:
+    try:
+        return os.path.samefile(path, other_path)
+    except FileNotFoundError:
+        return False
+
+def _replace_with_link(blob_path: str, path: str):
+    """
+    Atomically replaces `path` by a link to the blob, so `path` is never missing or partial.
+    """
+    tmp_path = f"{os.path.dirname(path)}/.{uuid.uuid4()}.link"
+    os.link(blob_path, tmp_path)
+    try:
+        os.replace(tmp_path, path)
+    except BaseException:
+        filesystem.silentremove(tmp_path)
+        raise
+
+_BLOB_STORE = None
+
+def init_blob_store(blobs_dir: str, content_digest: Callable[[str], str], on_collect: Callable[[str], None] | None = None):
+    global _BLOB_STORE
+    if _BLOB_STORE is not None:
+        return # Already initialized
+    _BLOB_STORE = BlobStore(blobs_dir, content_digest, on_collect)
+
+def blob_store():
+    if _BLOB_STORE is None:
+        raise RuntimeError("Blob store not initialized. Run init_blob_store() first.")
+    return _BLOB_STORE
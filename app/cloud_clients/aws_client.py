@@ -1,14 +1,20 @@
 from typing import List, Tuple
 import boto3
+import boto3.s3.transfer
 import botocore
 import os
+import collections
 import concurrent.futures
+import threading
 import time
 import functools
+import uuid
 
 import botocore.config
 import botocore.exceptions
 
+from app.config.config import config
+from app.utils import filesystem, utils
 from app.utils.aws import get_aws_autorefresh_session
 from app.cloud_clients.cloud_client import CloudClient
 from app.cloud_clients.exceptions import CloudClientException
@@ -29,13 +35,69 @@ def retry(max_retries=3, exceptions=(Exception,)):
         return wrapper
     return decorator
 
+MB = 1024 * 1024
+DOWNLOAD_CHUNK_SIZE = 1 * MB
+# Max size of an object copied in one request, allowed by S3. Larger objects are copied in parts.
+MAX_SINGLE_COPY_BYTES = 5 * 1024 * MB
+COPY_CHUNK_SIZE = 512 * MB
+# Max number of keys in one delete request, allowed by S3.
+MAX_DELETE_KEYS = 1000
+# Errors of a delete request worth retrying the key for.
+RETRYABLE_DELETE_ERRORS = {'InternalError', 'SlowDown', 'ServiceUnavailable', 'RequestTimeout'}
+# Object metadata holding the SHA-256 of the image, used to skip uploading content the bucket already has.
+DIGEST_METADATA = 'sha256'
+# Max number of digests remembered with the key of an object holding that content.
+MAX_KNOWN_DIGESTS = 10_000
+
 class AWSClient(CloudClient):
-    def __init__(self, bucket_name: str):
+    def __init__(
+        self,
+        bucket_name: str,
+        max_workers: int = 4,
+        multipart_threshold: int = 8 * MB,
+        multipart_chunksize: int = 8 * MB,
+        max_concurrency: int = 4,
+        max_attempts: int = 5,
+        max_inflight_bytes: int = 64 * MB,
+        tmp_dir: str | None = None
+    ):
+        """
+        Args:
+            bucket_name (str): The S3 bucket holding the albums.
+            max_workers (int): Max number of images transferred at the same time by the bulk operations.
+            multipart_threshold (int): Images larger than this are uploaded in parts.
+            multipart_chunksize (int): Size of each part.
+            max_concurrency (int): Max number of parts of an image transferred at the same time.
+            max_attempts (int): Max attempts of each request (part) of a transfer, with exponential backoff.
+            max_inflight_bytes (int): Max total size of the images being downloaded at the same time.
+            tmp_dir (str | None): Where partial downloads are written. Defaults to the directory of the image.
+                Must be on the same filesystem as the albums for the final rename to be atomic.
+        """
         self.bucket_name = bucket_name
+        self.tmp_dir = tmp_dir
+        self.download_budget = utils.ByteBudget(max_inflight_bytes)
 
         self.s3_client = self._create_s3_client()
+        self.transfer_client = self._create_transfer_client(max_workers * max_concurrency, max_attempts)
         self.sqs_client = self._create_sqs_client()
 
+        self.transfer_config = boto3.s3.transfer.TransferConfig(
+            multipart_threshold=multipart_threshold,
+            multipart_chunksize=multipart_chunksize,
+            max_concurrency=max_concurrency
+        )
+        self.copy_config = boto3.s3.transfer.TransferConfig(
+            multipart_threshold=MAX_SINGLE_COPY_BYTES,
+            multipart_chunksize=COPY_CHUNK_SIZE,
+            max_concurrency=max_concurrency
+        )
+        # Shared by the bulk operations, so that a burst of requests doesn't start a burst of threads and connections.
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="s3-transfer")
+
+        self.digests_lock = threading.Lock()
+        # LRU of digest -> key of an object uploaded (or found) with that content. Most recently used last.
+        self.known_digests: collections.OrderedDict[str, str] = collections.OrderedDict()
+
     def _create_s3_client(self):
         return boto3.client(
             's3',
@@ -49,6 +111,24 @@ class AWSClient(CloudClient):
             )
         )
 
+    def _create_transfer_client(self, max_pool_connections: int, max_attempts: int):
+        """
+        Client for the image transfers. Unlike the s3 client, a slow request doesn't time out quickly, and
+        each request is retried, so a failed part of a multipart upload is retried without restarting the upload.
+        """
+        return boto3.client(
+            's3',
+            aws_access_key_id=os.getenv('AWS_ACCESS_KEY_ID'),
+            aws_secret_access_key=os.getenv('AWS_SECRET_ACCESS_KEY'),
+            region_name=os.getenv('AWS_REGION'),
+            config=botocore.config.Config(
+                connect_timeout=5,
+                read_timeout=60,
+                max_pool_connections=max_pool_connections,
+                retries={'total_max_attempts': max_attempts, 'mode': 'standard'}
+            )
+        )
+
     def _create_sqs_client(self):
         try:
             autorefresh_session, _ = get_aws_autorefresh_session(os.getenv('PUSH_QUEUE_ROLE'), "push-queue-session")
@@ -70,6 +150,23 @@ class AWSClient(CloudClient):
 
         return image_keys
 
+    @retry()
+    def list_objects(self, album_path: str) -> List[dict]:
+        paginator = self.s3_client.get_paginator('list_objects_v2')
+        page_iterator = paginator.paginate(
+            Bucket=self.bucket_name,
+            Prefix=album_path
+        )
+        objects = []
+        # Each page is limited to 1000 objects
+        for page in page_iterator:
+            objects.extend([
+                {"key": obj['Key'], "size": obj['Size'], "etag": obj['ETag'].strip('"')}
+                for obj in page.get('Contents', [])
+            ])
+
+        return objects
+
     @retry()
     def get(self, image_key: str) -> bytes:
         try:
@@ -79,21 +176,69 @@ class AWSClient(CloudClient):
             CloudClientException(f"Error getting image from S3: {e}")
         return bytes()
 
+    @retry(exceptions=(botocore.exceptions.ResponseStreamingError, botocore.exceptions.ReadTimeoutError))
+    def download(self, image_key: str, image_path: str):
+        try:
+            obj = self.transfer_client.get_object(Bucket=self.bucket_name, Key=image_key)
+        except botocore.exceptions.ClientError as e:
+            raise CloudClientException(f"Error downloading image from S3: {e}")
+
+        tmp_dir = self.tmp_dir or os.path.dirname(image_path)
+        tmp_path = f"{tmp_dir}/.{uuid.uuid4()}.download"
+        os.makedirs(tmp_dir, exist_ok=True)
+        os.makedirs(os.path.dirname(image_path), exist_ok=True)
+        with self.download_budget.reserve(obj['ContentLength']):
+            try:
+                with open(tmp_path, 'wb') as f:
+                    for chunk in obj['Body'].iter_chunks(DOWNLOAD_CHUNK_SIZE):
+                        f.write(chunk)
+                os.replace(tmp_path, image_path)
+            except BaseException:
+                obj['Body'].close()
+                filesystem.silentremove(tmp_path)
+                raise
+
     @retry()
-    def insert(self, image_path: str, image_key: str):
+    def insert(self, image_path: str, image_key: str, digest: str | None = None):
+        """
+        If `digest` is given, it's stored in the object metadata so later uploads of the same content can be skipped.
+        """
         try:
-            self.s3_client.upload_file(Bucket=self.bucket_name, Filename=image_path, Key=image_key)
+            # Streams the image from disk, in parts if it's larger than the multipart threshold.
+            self.transfer_client.upload_file(
+                Bucket=self.bucket_name,
+                Filename=image_path,
+                Key=image_key,
+                ExtraArgs={'Metadata': {DIGEST_METADATA: digest}} if digest else None,
+                Config=self.transfer_config
+            )
         except Exception as e:
             raise CloudClientException(f"Error uploading image to S3: {e}")
+        if digest:
+            self._remember_digest(digest, image_key)
 
     @retry()
-    def move(self, src_key: str, dest_key: str):
+    def copy(self, src_key: str, dest_key: str):
+        """
+        Copies the image server-side, so it isn't downloaded and uploaded again. Images too large for a single copy
+        request are copied in parts.
+        """
         try:
-            response = self.s3_client.copy_object(
-                Bucket=self.bucket_name,
+            self.transfer_client.copy(
                 CopySource={'Bucket': self.bucket_name, 'Key': src_key},
-                Key=dest_key
+                Bucket=self.bucket_name,
+                Key=dest_key,
+                Config=self.copy_config
             )
+        except Exception as e:
+            raise CloudClientException(f"Error copying image in S3: {e}")
+
+    def move(self, src_key: str, dest_key: str):
+        """
+        Not retried itself: `copy` and `delete` already retry, and a retry of the whole move would multiply them.
+        """
+        try:
+            self.copy(src_key, dest_key)
             self.delete(src_key)
         except Exception as e:
             raise CloudClientException(f"Error moving image in S3: {e}")
@@ -103,83 +248,199 @@ class AWSClient(CloudClient):
         try:
             self.s3_client.delete_object(Bucket=self.bucket_name, Key=image_key)
         except Exception as e:
-            CloudClientException(f"Error deleting image from S3: {e}")
+            raise CloudClientException(f"Error deleting image from S3: {e}")
 
     def get_bulk(self, image_paths: List[str], image_keys: List[str]) -> Tuple[List[str], List[str]]:
+        """
+        Downloads the images straight to disk. At most `max_workers` images, and `max_inflight_bytes` bytes,
+        are downloaded at the same time.
+        """
         success = []
         failure = []
         future_map = {}
-        with concurrent.futures.ThreadPoolExecutor() as executor:
-            for image_path, image_key in zip(image_paths, image_keys):
-                future = executor.submit(self.get, image_key)
-                future_map[future] = (image_path, image_key)
+        for image_path, image_key in zip(image_paths, image_keys):
+            future = self.executor.submit(self.download, image_key, image_path)
+            future_map[future] = image_key
 
-            for future in concurrent.futures.as_completed(future_map):
-                image_path, image_key = future_map[future]
-                try:
-                    image_bytes: bytes = future.result()
-                    os.makedirs(os.path.dirname(image_path), exist_ok=True)
-                    with open(image_path, "wb") as f:
-                        f.write(image_bytes)
-                    success.append(image_key)
-                except Exception as e:
-                    print(e)
-                    failure.append(image_key)
+        for future in concurrent.futures.as_completed(future_map):
+            image_key = future_map[future]
+            try:
+                _ = future.result()
+                success.append(image_key)
+            except Exception as e:
+                print(e)
+                failure.append(image_key)
 
         return success, failure
 
-    def insert_bulk(self, image_paths: List[str], image_keys: List[str]) -> Tuple[List[str], List[str]]:
+    def insert_bulk(
+        self,
+        image_paths: List[str],
+        image_keys: List[str],
+        digests: List[str] | None = None
+    ) -> Tuple[List[str], List[str]]:
+        """
+        With the digests of the images, an image isn't uploaded if the bucket already has its content: it's skipped if
+        the object at its key has the same content, or copied server-side from another object with that content.
+        """
         success = []
         failure = []
         future_map = {}
-        with concurrent.futures.ThreadPoolExecutor() as executor:
-            for image_path, image_key in zip(image_paths, image_keys):
-                future = executor.submit(self.insert, image_path, image_key)
-                future_map[future] = image_key
+        for i, (image_path, image_key) in enumerate(zip(image_paths, image_keys)):
+            if digests is not None:
+                future = self.executor.submit(self._insert_deduplicated, image_path, image_key, digests[i])
+            else:
+                future = self.executor.submit(self.insert, image_path, image_key)
+            future_map[future] = image_key
 
-            for future in concurrent.futures.as_completed(future_map):
-                image_key = future_map[future]
-                try:
-                    _ = future.result()
-                    success.append(image_key)
-                except Exception as e:
-                    print(e)
-                    failure.append(image_key)
+        for future in concurrent.futures.as_completed(future_map):
+            image_key = future_map[future]
+            try:
+                _ = future.result()
+                success.append(image_key)
+            except Exception as e:
+                print(e)
+                failure.append(image_key)
 
         return success, failure
 
-    def move_bulk(self, image_key_pairs: List[Tuple[str, str]]) -> Tuple[List[str], List[str]]:
+    def _insert_deduplicated(self, image_path: str, image_key: str, digest: str):
+        if self._object_digest(image_key) == digest:
+            print(f"Skipped uploading {image_key}, the bucket already has it.")
+            self._remember_digest(digest, image_key)
+            return
+
+        with self.digests_lock:
+            src_key = self.known_digests.get(digest)
+        # The object may have been replaced or deleted since, check it still has the content.
+        if src_key is not None and src_key != image_key and self._object_digest(src_key) == digest:
+            try:
+                # The metadata, with the digest, is copied too.
+                self.copy(src_key, image_key)
+                return
+            except CloudClientException as e:
+                print(f"{e}, uploading {image_key} instead.")
+
+        self.insert(image_path, image_key, digest)
+
+    def _object_digest(self, image_key: str) -> str | None:
+        """
+        Returns the digest stored in the metadata of the object, or None if the object doesn't exist or has no digest.
+        """
+        try:
+            head = self.s3_client.head_object(Bucket=self.bucket_name, Key=image_key)
+        except Exception:
+            return None
+        return head.get('Metadata', {}).get(DIGEST_METADATA)
+
+    def _remember_digest(self, digest: str, image_key: str):
+        with self.digests_lock:
+            self.known_digests[digest] = image_key
+            self.known_digests.move_to_end(digest)
+            while len(self.known_digests) > MAX_KNOWN_DIGESTS:
+                self.known_digests.popitem(last=False)
+
+    def copy_bulk(self, image_key_pairs: List[Tuple[str, str]]) -> Tuple[List[Tuple[str, str]], List[Tuple[str, str]]]:
+        """
+        Copies the images server-side, at most `max_workers` at the same time.
+        """
         success = []
         failure = []
         future_map = {}
-        with concurrent.futures.ThreadPoolExecutor() as executor:
-            for src_key, dest_key in image_key_pairs:
-                future = executor.submit(self.move, src_key, dest_key)
-                future_map[future] = (src_key, dest_key)
+        for src_key, dest_key in image_key_pairs:
+            future = self.executor.submit(self.copy, src_key, dest_key)
+            future_map[future] = (src_key, dest_key)
 
-            for future in concurrent.futures.as_completed(future_map):
-                key_pair = future_map[future]
-                try:
-                    _ = future.result()
-                    success.append(key_pair)
-                except Exception as e:
-                    print(e)
-                    failure.append(key_pair)
+        for future in concurrent.futures.as_completed(future_map):
+            key_pair = future_map[future]
+            try:
+                _ = future.result()
+                success.append(key_pair)
+            except Exception as e:
+                print(e)
+                failure.append(key_pair)
 
         return success, failure
 
-    @retry()
+    def move_bulk(self, image_key_pairs: List[Tuple[str, str]]) -> Tuple[List[Tuple[str, str]], List[Tuple[str, str]]]:
+        """
+        Copies the images server-side, then deletes the sources of the copied images in batches.
+        A move whose source couldn't be deleted is failed, even though the image was copied.
+        """
+        copied, failure = self.copy_bulk(image_key_pairs)
+        # A source that's also the destination of another move was just replaced, keep it.
+        dest_keys = {dest_key for _, dest_key in copied}
+        _, failed_deletes = self.delete_bulk([src_key for src_key, _ in copied if src_key not in dest_keys])
+
+        failed = set(failed_deletes)
+        for key_pair in copied:
+            if key_pair[0] in failed:
+                failure.append(key_pair)
+        success = [key_pair for key_pair in copied if key_pair[0] not in failed]
+        return success, failure
+
     def delete_bulk(self, image_keys: List[str]) -> Tuple[List[str], List[str]]:
-        resp = self.s3_client.delete_objects(
-            Bucket=self.bucket_name,
-            Delete={
-                'Objects': [{'Key': k} for k in image_keys]
-            }
-        )
-        success = [item['Key'] for item in resp.get('Deleted', [])]
-        failure = [item['Key'] for item in resp.get('Errors', [])]
+        """
+        Deletes the images in chunks of up to 1000 keys (the max of a delete request), with the chunks deleted in parallel.
+        Only the keys S3 failed to delete with a transient error are retried. When S3 throttles, the chunk is split
+        into smaller requests.
+        """
+        image_keys = list(dict.fromkeys(image_keys))
+        chunks = [image_keys[i:i + MAX_DELETE_KEYS] for i in range(0, len(image_keys), MAX_DELETE_KEYS)]
+
+        failure = []
+        for future in concurrent.futures.as_completed([self.executor.submit(self._delete_chunk, chunk) for chunk in chunks]):
+            failure.extend(future.result())
+
+        failed = set(failure)
+        success = [key for key in image_keys if key not in failed]
         return success, failure
 
+    def _delete_chunk(self, image_keys: List[str], max_attempts: int = 3) -> List[str]:
+        """
+        Returns the keys that failed to be deleted.
+        """
+        failure = []
+        pending = image_keys
+        request_size = len(image_keys)
+        for attempt in range(1, max_attempts + 1):
+            retry_keys = []
+            throttled = False
+            for i in range(0, len(pending), request_size):
+                keys = pending[i:i + request_size]
+                try:
+                    # Quiet: only the errors are returned, not every deleted key.
+                    resp = self.transfer_client.delete_objects(
+                        Bucket=self.bucket_name,
+                        Delete={'Objects': [{'Key': k} for k in keys], 'Quiet': True}
+                    )
+                except Exception as e:
+                    print(f"Error deleting images from S3: {e}")
+                    throttled = throttled or _error_code(e) == 'SlowDown'
+                    retry_keys.extend(keys)
+                    continue
+
+                for error in resp.get('Errors', []):
+                    if error.get('Code') in RETRYABLE_DELETE_ERRORS:
+                        throttled = throttled or error['Code'] == 'SlowDown'
+                        retry_keys.append(error['Key'])
+                    else:
+                        print(f"Error deleting {error['Key']} from S3: {error.get('Code')} {error.get('Message')}")
+                        failure.append(error['Key'])
+
+            pending = retry_keys
+            if not pending:
+                break
+            if throttled:
+                request_size = max(1, request_size // 2)
+            if attempt < max_attempts:
+                delay = 2 ** (attempt - 1)
+                print(f"Retrying the deletion of {len(pending)} images in {delay} seconds...")
+                time.sleep(delay)
+
+        failure.extend(pending)
+        return failure
+
     @retry()
     def insert_queue(self, message: str, message_group_id: str = "default"):
         try:
@@ -194,5 +455,20 @@ class AWSClient(CloudClient):
         except Exception as e:
             raise CloudClientException(f"Error sending message to SQS: {e}")
 
+def _error_code(e: Exception) -> str | None:
+    if isinstance(e, botocore.exceptions.ClientError):
+        return e.response.get('Error', {}).get('Code')
+    return None
+
 def new_aws_client():
-    return AWSClient(os.getenv('S3_BUCKET_NAME', 'pi-photo-album-s3'))
\ No newline at end of file
+    transfer = config()['transfer']
+    return AWSClient(
+        os.getenv('S3_BUCKET_NAME', 'pi-photo-album-s3'),
+        max_workers=transfer['max_workers'].as_int(),
+        multipart_threshold=transfer['multipart_threshold'].as_int(),
+        multipart_chunksize=transfer['multipart_chunksize'].as_int(),
+        max_concurrency=transfer['max_concurrency'].as_int(),
+        max_attempts=transfer['max_attempts'].as_int(),
+        max_inflight_bytes=transfer['max_inflight_bytes'].as_int(),
+        tmp_dir=config()['paths']['tmp_storage_dir'].as_str()
+    )
\ No newline at end of file
@@ -21,6 +21,19 @@ class CloudClient(ABC, metaclass=Singleton):
         """
         pass
 
+    @abstractmethod
+    def list_objects(self, album_path: str) -> List[dict]:
+        """
+        List all items in the specified album path including sub-albums, with their metadata.
+
+        Args:
+            album_path (str): The relative path of the album.
+        Returns:
+            List[dict]: A list of `{"key": str, "size": int, "etag": str}`.
+                `etag` changes whenever the content of the image changes.
+        """
+        pass
+
     @abstractmethod
     def get(self, image_key: str) -> bytes:
         """
@@ -36,18 +49,46 @@ class CloudClient(ABC, metaclass=Singleton):
         pass
 
     @abstractmethod
-    def insert(self, image_path: str, image_key: str):
+    def download(self, image_key: str, image_path: str):
+        """
+        Download an image straight to disk, without holding the whole image in memory.
+        The image is written to a temporary file first, so `image_path` never contains a partial image.
+
+        Args:
+            image_key (str): The relative path of the image to download.
+            image_path (str): The local path to save the image to.
+        Raises:
+            CloudClientException: If the image download fails.
+        """
+        pass
+
+    @abstractmethod
+    def insert(self, image_path: str, image_key: str, digest: str | None = None):
         """
         Upload an image.
 
         Args:
             image_path (str): The local path of the image to upload.
             image_key (str): The key/relative path to assign to the uploaded image.
+            digest (str | None, optional): The SHA-256 digest of the image, stored with the uploaded image.
         Raises:
             CloudClientException: If image upload fails.
         """
         pass
 
+    @abstractmethod
+    def copy(self, src_key: str, dest_key: str):
+        """
+        Copy an image within the cloud storage, without downloading it.
+
+        Args:
+            src_key (str): The key/relative path of the image to copy.
+            dest_key (str): The key/relative path of the copy.
+        Raises:
+            CloudClientException: If the copy fails.
+        """
+        pass
+
     @abstractmethod
     def move(self, src_key: str, dest_key: str):
         """
@@ -87,18 +128,37 @@ class CloudClient(ABC, metaclass=Singleton):
         pass
 
     @abstractmethod
-    def insert_bulk(self, image_paths: List[str], image_keys: List[str]) -> Tuple[List[str], List[str]]:
+    def insert_bulk(
+        self,
+        image_paths: List[str],
+        image_keys: List[str],
+        digests: List[str] | None = None
+    ) -> Tuple[List[str], List[str]]:
         """
         Insert multiple images in bulk.
 
         Args:
             image_paths (List[str]): The local paths of the images to upload.
             image_keys (List[str]): The keys to assign to the uploaded images.
+            digests (List[str] | None, optional): The SHA-256 digests of the images. If given, the images whose content
+                is already in the cloud storage aren't uploaded again.
         Returns:
             Tuple[List[str], List[str]]: A tuple containing lists of successfully inserted keys and failed keys.
         """
         pass
 
+    @abstractmethod
+    def copy_bulk(self, image_key_pairs: List[Tuple[str, str]]) -> Tuple[List[Tuple[str, str]], List[Tuple[str, str]]]:
+        """
+        Copy multiple images in bulk, within the cloud storage.
+
+        Args:
+            image_key_pairs (List[Tuple[str, str]]): A list of tuples containing source and destination keys.
+        Returns:
+            Tuple[List[Tuple[str, str]], List[Tuple[str, str]]]: A tuple containing lists of successfully copied key pairs and failed key pairs.
+        """
+        pass
+
     @abstractmethod
     def move_bulk(self, image_key_pairs: List[Tuple[str, str]]) -> Tuple[List[str], List[str]]:
         """
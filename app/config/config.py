@@ -132,20 +132,117 @@ def default_config():
             "last_poll_file": f"{config_dir}/last_poll.txt",
             "fs_snapshot_file": f"{config_dir}/fs_snapshot.json",
             "offline_events_file": f"{config_dir}/events.csv",
+            "ingest_jobs_dir": f"{config_dir}/ingest_jobs",
+            "sync_manifest_file": f"{config_dir}/sync_manifest.json",
+            "resync_checkpoint_file": f"{config_dir}/resync_checkpoint.json",
+            "seen_events_file": f"{config_dir}/seen_events.csv",
             "active_slideshow_file": f"{config_dir}/active_slideshow.txt",
+            "playlist_file": f"{config_dir}/playlist.json",
+            # Unix domain socket of the slideshow controller.
+            "slideshow_socket": f"{config_dir}/slideshow.sock",
             "base_dir": base_dir,
-            "tmp_storage_dir": f"{base_dir}/tmp"
+            "tmp_storage_dir": f"{base_dir}/tmp",
+            "thumbnail_cache_dir": f"{base_dir}/cache/thumbnails",
+            "render_cache_dir": f"{base_dir}/cache/renders",
+            # Must be on the same filesystem as the albums, which are hardlinks to the blobs.
+            "blobs_dir": f"{base_dir}/blobs"
         },
         "files": {
             "max_content_length": 512 * 1024 * 1024,  # 512MB
             "allowed_file_extensions": {'jpg', 'jpeg', 'png', 'webp', 'heif', 'heic'},
             "allowed_prefixes": {'Shared', os.getenv('USERNAME')} if os.getenv('USERNAME') else {'Shared'}
         },
+        "processing": {
+            # Max number of image conversion processes (heif-convert, exiftran) running at the same time.
+            "max_workers": os.cpu_count() or 1
+        },
+        "thumbnails": {
+            # name -> max width/height in px
+            "sizes": {
+                "small": 320,
+                "medium": 1280
+            },
+            "quality": 80,
+            "max_cache_size": 512 * 1024 * 1024,  # 512MB
+            "generate_on_upload": True
+        },
+        "renders": {
+            # <width>x<height> of the slideshow images. The resolution of the framebuffer if empty.
+            "resolution": os.getenv('DISPLAY_RESOLUTION', ''),
+            "quality": 90,
+            "max_cache_size": 4 * 1024 * 1024 * 1024,  # 4GB
+            # Max number of images rendered at the same time, in the background.
+            "max_workers": 1
+        },
+        "slideshow": {
+            # The changes to the album are applied to the playlist in batches, which end once no change came for
+            # `batch_delay` seconds, or `max_batch_delay` seconds after their first change.
+            "batch_delay": 2,
+            "max_batch_delay": 10,
+            "framebuffer": "/dev/fb0",
+            # Console the framebuffer is shown on, switched to graphics mode while the slideshow controller runs so the
+            # text console and its cursor aren't drawn over the frames. Left as is if empty.
+            "tty": "/dev/tty1",
+            # Max number of frames of a cross-fade between two images, computed while the first one is shown.
+            "max_blend_frames": 8,
+            # Number of images coming up that are read into the page cache ahead of time.
+            "prefetch_depth": 4,
+            # Number of images coming up that are decoded ahead of time. Each one takes a frame of memory.
+            "decode_ahead": 1
+        },
+        "blobs": {
+            # How often the blobs no album links to anymore are deleted, in seconds.
+            "gc_interval": 60 * 60
+        },
+        "transfer": {
+            # Max number of images uploaded to S3 at the same time.
+            "max_workers": 4,
+            # Images larger than the threshold are uploaded in parts, each part is retried on its own.
+            "multipart_threshold": 8 * 1024 * 1024,  # 8MB
+            "multipart_chunksize": 8 * 1024 * 1024,  # 8MB
+            # Max number of parts of an image uploaded at the same time.
+            "max_concurrency": 4,
+            "max_attempts": 5,
+            # Max total size of the images downloaded from S3 at the same time.
+            "max_inflight_bytes": 64 * 1024 * 1024  # 64MB
+        },
         "queue": {
-            "retention_days": 4
+            "retention_days": 4,
+            # Max number of ids of applied events kept, to skip the events of messages delivered again.
+            "max_seen_events": 100_000
+        },
+        "consumer": {
+            # Number of long polls of the queue in flight at the same time.
+            "pollers": 2,
+            # Max number of received batches waiting to be sent to the API.
+            "max_pending_batches": 4,
+            # How long delivered messages wait to be deleted in a batch, in seconds.
+            "delete_interval": 1,
+            # Bounds of the visibility timeout of the messages, which adapts to how long they take to deliver.
+            "min_visibility_timeout": 10,
+            "max_visibility_timeout": 5 * 60
+        },
+        "offline": {
+            # How often the offline events are compacted, in seconds.
+            "compaction_interval": 10 * 60
+        },
+        "api": {
+            # Max number of keep-alive connections from the event consumer to the API.
+            "pool_maxsize": 2,
+            "timeout": 10,
+            # How long a response from the API counts as a health check, in seconds.
+            "health_ttl": 30
+        },
+        "connectivity": {
+            # How long a successful ping is trusted, in seconds.
+            "ttl": 30,
+            # Max time between pings while a service is offline, in seconds.
+            "max_backoff": 60
         },
         "url": {
             "api_url": f"http://localhost:{os.getenv('API_PORT', 5555)}",
+            # If set, the API is also served on this Unix domain socket, and the event consumer uses it.
+            "api_socket": os.getenv('API_SOCKET', ''),
             "sqs_ping_url": f"https://sqs.{os.getenv('AWS_REGION', 'us-east-1')}.amazonaws.com/ping",
             "s3_ping_url": f"https://s3.{os.getenv('AWS_REGION', 'us-east-1')}.amazonaws.com/ping"
         }
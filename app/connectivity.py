@@ -0,0 +1,116 @@
+import threading
+import time
+from typing import Callable
+
+import requests
+import requests.adapters
+
+from app.utils import aws
+
+class ConnectivityMonitor:
+    """
+    Cached reachability of the cloud services (e.g. S3, SQS), so checking if a service is online doesn't block.
+
+    Once started, each service is probed in the background: every `ttl` seconds while it's online,
+    and with exponential backoff (1s, 2s, 4s, ... up to `max_backoff`) while it's offline.
+    If the monitor isn't started, a stale state is refreshed by probing when it's read.
+
+    Listeners are called with `(service, online)` whenever a service goes online or offline.
+    """
+    def __init__(self, urls: dict[str, str], ttl: int = 30, max_backoff: int = 60, timeout: float = 1.5):
+        self.urls = urls
+        self.ttl = ttl
+        self.max_backoff = max_backoff
+        self.timeout = timeout
+
+        # One pooled session, so probes reuse their connections.
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=max(1, len(urls)), pool_maxsize=2)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+        self.lock = threading.Lock()
+        self.online: dict[str, bool] = {}
+        self.checked_at: dict[str, float] = {}
+        self.failures: dict[str, int] = {service: 0 for service in urls}
+        self.listeners: list[Callable[[str, bool], None]] = []
+        self.wake = threading.Event()
+        self.worker: threading.Thread | None = None
+
+    def start(self):
+        """
+        Probes every service, then keeps probing them in the background.
+        """
+        if self.worker is not None:
+            return
+        for service in self.urls:
+            self.probe(service)
+        self.worker = threading.Thread(target=self._run, name="connectivity-monitor", daemon=True)
+        self.worker.start()
+
+    def is_online(self, service: str) -> bool:
+        """
+        Returns the cached state of the service. Only probes if the monitor isn't running and the state is stale.
+        """
+        with self.lock:
+            online = self.online.get(service)
+            checked_at = self.checked_at.get(service, 0)
+        if online is None or (self.worker is None and time.monotonic() - checked_at > self._interval(service)):
+            return self.probe(service)
+        return online
+
+    def probe(self, service: str) -> bool:
+        """
+        Pings the service now and updates its state.
+        """
+        online = aws.ping(self.urls[service], self.session, self.timeout)
+        with self.lock:
+            was_online = self.online.get(service)
+            self.online[service] = online
+            self.checked_at[service] = time.monotonic()
+            self.failures[service] = 0 if online else self.failures[service] + 1
+        if was_online is not None and was_online != online:
+            print(f"{service} is {'online' if online else 'offline'}")
+            for listener in list(self.listeners):
+                try:
+                    listener(service, online)
+                except Exception as e:
+                    print(f"Error in connectivity listener: {e}")
+        return online
+
+    def subscribe(self, listener: Callable[[str, bool], None]):
+        self.listeners.append(listener)
+
+    def _interval(self, service: str) -> float:
+        failures = self.failures.get(service, 0)
+        if failures == 0:
+            return self.ttl
+        return min(2 ** (failures - 1), self.max_backoff)
+
+    def _run(self):
+        while True:
+            now = time.monotonic()
+            with self.lock:
+                due = {service: self.checked_at.get(service, 0) + self._interval(service) for service in self.urls}
+            wake_up = self.wake.is_set()
+            for service, due_at in due.items():
+                if wake_up or due_at <= now:
+                    self.probe(service)
+            self.wake.clear()
+
+            with self.lock:
+                next_due = min(self.checked_at.get(service, 0) + self._interval(service) for service in self.urls)
+            self.wake.wait(max(0.0, next_due - time.monotonic()))
+
+_CONNECTIVITY_MONITOR = None
+
+def init_connectivity_monitor(urls: dict[str, str], ttl: int = 30, max_backoff: int = 60):
+    global _CONNECTIVITY_MONITOR
+    if _CONNECTIVITY_MONITOR is not None:
+        return # Already initialized
+    _CONNECTIVITY_MONITOR = ConnectivityMonitor(urls, ttl, max_backoff)
+
+def connectivity_monitor():
+    if _CONNECTIVITY_MONITOR is None:
+        raise RuntimeError("Connectivity monitor not initialized. Run init_connectivity_monitor() first.")
+    return _CONNECTIVITY_MONITOR
@@ -0,0 +1,111 @@
+import socket
+import time
+
+import requests
+import requests.adapters
+import urllib3.connection
+import urllib3.connectionpool
+
+class UnixSocketConnection(urllib3.connection.HTTPConnection):
+    def __init__(self, *args, socket_path: str, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.socket_path = socket_path
+
+    def _new_conn(self) -> socket.socket:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        if isinstance(self.timeout, (int, float)):
+            sock.settimeout(self.timeout)
+        sock.connect(self.socket_path)
+        return sock
+
+class UnixSocketConnectionPool(urllib3.connectionpool.HTTPConnectionPool):
+    ConnectionCls = UnixSocketConnection
+
+class UnixSocketAdapter(requests.adapters.HTTPAdapter):
+    """
+    Sends every request through a pool of keep-alive connections to a Unix domain socket.
+    """
+    def __init__(self, socket_path: str, pool_maxsize: int):
+        super().__init__(pool_connections=1, pool_maxsize=pool_maxsize)
+        self.pool = UnixSocketConnectionPool("localhost", maxsize=pool_maxsize, socket_path=socket_path)
+
+    def get_connection_with_tls_context(self, request, verify, proxies=None, cert=None):
+        return self.pool
+
+    def get_connection(self, url, proxies=None):
+        return self.pool
+
+    def close(self):
+        super().close()
+        self.pool.close()
+
+class APIClient:
+    """
+    Client for the API, used by the event consumer.
+
+    All requests go through one keep-alive session, over TCP or over a Unix domain socket if `socket_path` is set.
+    Any response from the API counts as a health check, so `/health` is only requested if the API
+    hasn't responded in the last `health_ttl` seconds, or if the last request couldn't reach it.
+    """
+    def __init__(self, api_url: str, socket_path: str = "", pool_maxsize: int = 2, timeout: int = 10, health_ttl: int = 30):
+        self.timeout = timeout
+        self.health_ttl = health_ttl
+        self.last_response: float | None = None
+
+        self.session = requests.Session()
+        if socket_path:
+            # The host is only used for the Host header.
+            self.api_url = "http://localhost"
+            self.session.trust_env = False # Proxies can't be used with a Unix socket.
+            self.session.mount(self.api_url, UnixSocketAdapter(socket_path, pool_maxsize))
+        else:
+            self.api_url = api_url.rstrip('/')
+            adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=pool_maxsize)
+            self.session.mount("http://", adapter)
+            self.session.mount("https://", adapter)
+
+    def is_healthy(self) -> bool:
+        """
+        Check the health of the API.
+        """
+        if self.last_response is not None and time.monotonic() - self.last_response < self.health_ttl:
+            return True
+        return self._request("GET", "/health")
+
+    def send_events(self, events: list[dict], timeout: float | None = None) -> bool:
+        """
+        Send events to the API.
+
+        timeout: float | None - How long the API may take to apply the events, e.g. to download large files.
+            Defaults to the timeout of the client.
+        """
+        return self._request("POST", "/receive-events", json={"events": events}, log_errors=True, timeout=timeout)
+
+    def send_resync_request(self) -> bool:
+        """
+        Send a resync filesystem request to the API.
+        """
+        return self._request("POST", "/resync")
+
+    def close(self):
+        self.session.close()
+
+    def _request(self, method: str, path: str, log_errors: bool = False, timeout: float | None = None, **kwargs) -> bool:
+        """
+        Returns True if the API responded with `{"status": "ok"}`.
+        """
+        try:
+            response = self.session.request(method, f"{self.api_url}{path}", timeout=timeout or self.timeout, **kwargs)
+        except Exception as e:
+            self.last_response = None
+            if log_errors:
+                print(f"Error sending request to API: {e}")
+            return False
+
+        self.last_response = time.monotonic()
+        if response.status_code != 200:
+            return False
+        try:
+            return response.json().get('status') == 'ok'
+        except ValueError:
+            return False
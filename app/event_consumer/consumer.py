@@ -9,9 +9,11 @@ import botocore.config
 
 class QueueConsumer(ABC):
     @abstractmethod
-    def receive_messages(self) -> dict | None:
+    def receive_messages(self, visibility_timeout: int | None = None) -> dict | None:
         '''
         Receives messages from the queue.
+        Args:
+            visibility_timeout (int | None): How long the messages are hidden from other receivers, in seconds.
         Returns:
             A dictionary containing the received messages or None if an error occurs.
         '''
@@ -29,6 +31,20 @@ class QueueConsumer(ABC):
         '''
         pass
 
+    @abstractmethod
+    def change_visibility(self, id_to_receipt_handles: dict[str, str], visibility_timeout: int) -> dict[str, str]:
+        '''
+        Hides messages from other receivers for `visibility_timeout` more seconds, from now.
+        Args:
+            id_to_receipt_handles (dict[str, str]): A dictionary mapping message IDs to receipt handles.
+            visibility_timeout (int): The new visibility timeout of the messages, in seconds.
+        Returns:
+            dict[str, str]: A dictionary of message IDs whose visibility timeout was not changed.
+        Raises:
+            Exception: If the request failed, so none of the visibility timeouts were changed.
+        '''
+        pass
+
 class SQSQueueConsumer(QueueConsumer):
     def __init__(self):
         self.MAX_POLLING_INTERVAL = 20 # 20 sec max allowed by sqs
@@ -47,13 +63,15 @@ class SQSQueueConsumer(QueueConsumer):
             )
         )
 
-    def receive_messages(self):
+    def receive_messages(self, visibility_timeout = None):
         try:
             return self.sqs_client.receive_message(
                 QueueUrl=os.getenv('RECEIVE_EVENT_QUEUE_URL'),
                 MessageAttributeNames=['All'],
+                # Used to measure how often messages are redelivered.
+                MessageSystemAttributeNames=['ApproximateReceiveCount'],
                 MaxNumberOfMessages=self.MAX_MESSAGES,
-                VisibilityTimeout=self.VISIBILITY_TIMEOUT,
+                VisibilityTimeout=visibility_timeout or self.VISIBILITY_TIMEOUT,
                 WaitTimeSeconds=self.MAX_POLLING_INTERVAL
             )
         except Exception as e:
@@ -80,7 +98,21 @@ class SQSQueueConsumer(QueueConsumer):
                     print(f"Failed to delete messages from queue (Attempt {retry+1}/{max_retries+1}): {failed}")
             except Exception as e:
                 print(f"Error deleting messages from queue (Attempt {retry+1}/{max_retries+1}): {e}")
-            
-            time.sleep(2 ** retry) # exponential backoff
 
-        return id_to_rh
\ No newline at end of file
+            if id_to_rh and retry < max_retries:
+                time.sleep(2 ** retry) # exponential backoff
+
+        return id_to_rh
+
+    def change_visibility(self, id_to_receipt_handles, visibility_timeout):
+        response = self.sqs_client.change_message_visibility_batch(
+            QueueUrl=os.getenv('RECEIVE_EVENT_QUEUE_URL'),
+            Entries=[
+                {'Id': ID, 'ReceiptHandle': rh, 'VisibilityTimeout': visibility_timeout}
+                for ID, rh in id_to_receipt_handles.items()
+            ]
+        )
+        failed = response.get('Failed', [])
+        if failed:
+            print(f"Failed to change the visibility of messages: {failed}")
+        return {entry['Id']: id_to_receipt_handles[entry['Id']] for entry in failed}
\ No newline at end of file
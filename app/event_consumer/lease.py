@@ -0,0 +1,202 @@
+import math
+import threading
+import time
+
+from app.event_consumer.consumer import QueueConsumer
+
+# Max number of messages in one change visibility request, allowed by sqs.
+MAX_VISIBILITY_BATCH = 10
+
+class LeaseManager:
+    """
+    Keeps the messages being processed invisible to the other receivers of the queue, so they aren't redelivered
+    while their events are still being delivered (e.g. a batch of large downloads).
+
+    A message is leased when it's received. Until it's released, its visibility timeout is extended in the background
+    when less than a third of it is left.
+
+    The visibility timeout adapts to how long the batches take to deliver: it's twice the moving average of the
+    delivery times, between `min_timeout` and `max_timeout` seconds.
+
+    Metrics: see `metrics()`.
+    """
+    def __init__(
+        self,
+        queue_consumer: QueueConsumer,
+        min_timeout: int = 10,
+        max_timeout: int = 300,
+        safety_factor: float = 2,
+        smoothing: float = 0.2,
+        metrics_interval: int = 300
+    ):
+        self.queue_consumer = queue_consumer
+        self.min_timeout = min_timeout
+        self.max_timeout = max_timeout
+        self.safety_factor = safety_factor
+        self.smoothing = smoothing
+        self.metrics_interval = metrics_interval
+
+        self.lock = threading.Lock()
+        # Message id -> {"receiptHandle": str, "receivedAt": float, "expiresAt": float, "timeout": int, "receiveCount": int}
+        self.leases: dict[str, dict] = {}
+        self.avg_processing_time: float | None = None
+        self.counters = {"received": 0, "redelivered": 0, "delivered": 0, "extended": 0, "lost": 0}
+        self.stopping = threading.Event()
+        self.worker: threading.Thread | None = None
+
+    def start(self):
+        self.worker = threading.Thread(target=self._run, name="lease-manager", daemon=True)
+        self.worker.start()
+
+    def stop(self):
+        self.stopping.set()
+        if self.worker is not None:
+            self.worker.join()
+
+    def visibility_timeout(self) -> int:
+        """
+        The visibility timeout to receive messages with, and to extend the leases by.
+        """
+        with self.lock:
+            avg = self.avg_processing_time
+        if avg is None:
+            return self.min_timeout
+        return max(self.min_timeout, min(self.max_timeout, math.ceil(avg * self.safety_factor)))
+
+    def acquire(self, messages: list[dict], visibility_timeout: int):
+        """
+        Leases messages that were just received with the given visibility timeout.
+        """
+        now = time.monotonic()
+        with self.lock:
+            for message in messages:
+                receive_count = int(message.get('Attributes', {}).get('ApproximateReceiveCount', 1))
+                self.leases[message['MessageId']] = {
+                    "receiptHandle": message['ReceiptHandle'],
+                    "receivedAt": now,
+                    "expiresAt": now + visibility_timeout,
+                    "timeout": visibility_timeout,
+                    "receiveCount": receive_count
+                }
+                self.counters["received"] += 1
+                if receive_count > 1:
+                    self.counters["redelivered"] += 1
+
+    def delivered(self, message_ids: list[str]):
+        """
+        Records how long the messages took to deliver, to adapt the visibility timeout. They stay leased until released.
+        """
+        now = time.monotonic()
+        with self.lock:
+            received_at = [self.leases[msg_id]["receivedAt"] for msg_id in message_ids if msg_id in self.leases]
+            if not received_at:
+                return
+            self.counters["delivered"] += len(received_at)
+            processing_time = now - min(received_at)
+            if self.avg_processing_time is None:
+                self.avg_processing_time = processing_time
+            else:
+                self.avg_processing_time += self.smoothing * (processing_time - self.avg_processing_time)
+
+    def delivery_timeout(self, message_ids: list[str]) -> float:
+        """
+        How long the delivery of the messages may take: what's left of `max_timeout` since the first of them was
+        received, so the delivery gives up before the leases stop covering it. At least `min_timeout`.
+        """
+        now = time.monotonic()
+        with self.lock:
+            received_at = [self.leases[msg_id]["receivedAt"] for msg_id in message_ids if msg_id in self.leases]
+        elapsed = now - min(received_at) if received_at else 0
+        return max(self.min_timeout, self.max_timeout - elapsed)
+
+    def retry_timeout(self, receive_count: int) -> int:
+        """
+        How long an abandoned message stays invisible before it's received again: `min_timeout` doubled with each
+        time it was received, up to `max_timeout`, so a failing delivery isn't retried in a tight loop.
+        """
+        return min(self.max_timeout, self.min_timeout * 2 ** max(0, receive_count - 1))
+
+    def abandon(self, message_ids: list[str]):
+        """
+        Releases the messages and cuts their visibility timeout down to `retry_timeout()`, e.g. after their delivery
+        failed, so they're received again without waiting for their extended visibility timeout to expire.
+        """
+        # Retry timeout -> {message id -> receipt handle}
+        abandoned: dict[int, dict[str, str]] = {}
+        with self.lock:
+            for msg_id in message_ids:
+                lease = self.leases.pop(msg_id, None)
+                if lease is not None:
+                    timeout = self.retry_timeout(lease["receiveCount"])
+                    abandoned.setdefault(timeout, {})[msg_id] = lease["receiptHandle"]
+
+        for timeout, receipts in abandoned.items():
+            ids = list(receipts)
+            for i in range(0, len(ids), MAX_VISIBILITY_BATCH):
+                batch = {msg_id: receipts[msg_id] for msg_id in ids[i:i + MAX_VISIBILITY_BATCH]}
+                try:
+                    self.queue_consumer.change_visibility(batch, timeout)
+                except Exception as e:
+                    # Received again once their visibility timeout expires.
+                    print(f"Error making messages visible again: {e}")
+
+    def release(self, message_ids: list[str]):
+        """
+        Stops extending the visibility timeout of the messages, e.g. once they're deleted.
+        """
+        with self.lock:
+            for msg_id in message_ids:
+                self.leases.pop(msg_id, None)
+
+    def metrics(self) -> dict:
+        with self.lock:
+            metrics = dict(self.counters)
+            metrics["leased"] = len(self.leases)
+            metrics["avgProcessingTime"] = self.avg_processing_time
+        metrics["redeliveryRate"] = metrics["redelivered"] / metrics["received"] if metrics["received"] else 0.0
+        metrics["visibilityTimeout"] = self.visibility_timeout()
+        return metrics
+
+    def extend_expiring(self):
+        """
+        Extends the visibility timeout of the leases with less than a third of it left.
+        """
+        timeout = self.visibility_timeout()
+        now = time.monotonic()
+        with self.lock:
+            expiring = {
+                msg_id: lease["receiptHandle"] for msg_id, lease in self.leases.items()
+                if lease["expiresAt"] - now <= lease["timeout"] / 3
+            }
+
+        ids = list(expiring)
+        for i in range(0, len(ids), MAX_VISIBILITY_BATCH):
+            batch = {msg_id: expiring[msg_id] for msg_id in ids[i:i + MAX_VISIBILITY_BATCH]}
+            extended_at = time.monotonic()
+            failed = self.queue_consumer.change_visibility(batch, timeout)
+            with self.lock:
+                for msg_id in batch:
+                    lease = self.leases.get(msg_id)
+                    if lease is None:
+                        continue # Released meanwhile.
+                    if msg_id in failed:
+                        # E.g. the lease already expired and the message was received again.
+                        print(f"Lost the lease of message {msg_id}.")
+                        self.counters["lost"] += 1
+                        del self.leases[msg_id]
+                        continue
+                    lease["expiresAt"] = extended_at + timeout
+                    lease["timeout"] = timeout
+                    self.counters["extended"] += 1
+
+    def _run(self):
+        last_report = time.monotonic()
+        while not self.stopping.wait(1):
+            try:
+                # Failed requests are retried on the next tick, the leases still have a third of their timeout left.
+                self.extend_expiring()
+            except Exception as e:
+                print(f"Error extending message visibility: {e}")
+            if time.monotonic() - last_report >= self.metrics_interval:
+                last_report = time.monotonic()
+                print(f"Lease metrics: {self.metrics()}")
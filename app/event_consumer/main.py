@@ -1,129 +1,46 @@
-import botocore.exceptions
-import requests
-import time
-import json
-import botocore
 import os
 
 from app.config.config import config, load_config
-from app.utils import utils, aws, offline
+from app.connectivity import init_connectivity_monitor, connectivity_monitor
+from app.utils import utils
+from app.event_consumer.api_client import APIClient
 from app.event_consumer.consumer import SQSQueueConsumer
+from app.event_consumer.lease import LeaseManager
+from app.event_consumer.pipeline import ConsumerPipeline
 
 utils.load_env([".env", os.path.abspath(os.path.expandvars('$HOME/.config/pi-photo-album/.env'))])
 load_config()
+init_connectivity_monitor(
+    {"sqs": config()['url']['sqs_ping_url'].as_str()},
+    config()['connectivity']['ttl'].as_int(),
+    config()['connectivity']['max_backoff'].as_int()
+)
 
 def main():
     sqs_consumer = SQSQueueConsumer()
-    failed_health_checks = 0
-    while True:
-        if not is_api_healthy():
-            if failed_health_checks == 0:
-                print("API is not healthy. Waiting for it to come back online...")
-            failed_health_checks += 1
-            time.sleep(2 ** min(failed_health_checks, 5)) # exponential backoff
-            continue
-
-        if not offline.is_within_retention_period():
-            print("Retention period expired. Sending resync request...")
-            if not send_resync_request():
-                print("Error sending resync request.")
-                continue
-            offline.write_poll_time()
-            time.sleep(30) # Wait for the resync to complete
-            continue
-
-        try:
-            # Check if the SQS queue is healthy
-            if not aws.ping(config()['url']['sqs_ping_url'].as_str()):
-                handle_consumer_offline()
-                failed_health_checks += 1
-                time.sleep(2 ** min(failed_health_checks, 5))
-                continue
-        
-            response = sqs_consumer.receive_messages()
-            if response:
-                events = []
-                # mapping (msg id -> receipt handle) required to delete messages from queue
-                id_to_receipt_handles: dict[str, str] = {}
-
-                messages = response.get('Messages', [])
-                if len(messages) > 0:
-                    print(f"Received {len(response.get('Messages', []))} messages.")
-
-                # We can receive multiple messages in one response
-                for sqs_message in messages:
-                    id_to_receipt_handles[sqs_message['MessageId']] = sqs_message['ReceiptHandle']
-
-                    body = json.loads(sqs_message['Body'])
-                    message = json.loads(body['Message'])
-                    events.extend(message['events'])
-
-                if events:
-                    if not send_events(events):
-                        time.sleep(10) # Wait for the full length of sqs VISIBILITY_TIMEOUT
-                        continue
-                    sqs_consumer.delete_messages(id_to_receipt_handles)
-            offline.write_poll_time()
-        except botocore.exceptions.ConnectionError as e:
-            print("Connection error.")
-            handle_consumer_offline()
-        failed_health_checks = 0
-
-
-def is_api_healthy():
-    """
-    Check the health of the API.
-    """
-    try:
-        api_url = config()['url']['api_url'].as_str()
-        response = requests.get(f"{api_url}/health", timeout=10)
-        if response.status_code != 200:
-            return False
-        status = response.json().get('status')
-        if status != 'ok':
-            return False
-    except Exception:
-        return False
-    return True
-
-def send_events(events):
-    """
-    Send events to the API.
-    """
-    try:
-        api_url = config()['url']['api_url'].as_str()
-        response = requests.post(f"{api_url}/receive-events", json={"events": events}, timeout=10)
-        if response.status_code != 200:
-            return False
-        status = response.json().get('status')
-        if status != 'ok':
-            return False
-    except Exception as e:
-        print(f"Error sending messages to API: {e}")
-        return False
-    return True
-
-def send_resync_request():
-    """
-    Send a resync filesystem request to the API.
-    """
-    try:
-        api_url = config()['url']['api_url'].as_str()
-        response = requests.post(f"{api_url}/resync", timeout=10)
-        if response.status_code != 200:
-            return False
-        status = response.json().get('status')
-        if status != 'ok':
-            return False
-    except Exception:
-        return False
-    return True
-
-def handle_consumer_offline():
-    if offline.get_last_poll() != offline.get_snapshot_time():
-        print("Went offline. Saving file system snapshot.")
-        fs_snapshot_file = config()['paths']['fs_snapshot_file'].as_str()
-        offline.save_simple_fs_snapshot(fs_snapshot_file)
+    api_client = APIClient(
+        config()['url']['api_url'].as_str(),
+        config()['url']['api_socket'].as_str(),
+        config()['api']['pool_maxsize'].as_int(),
+        config()['api']['timeout'].as_int(),
+        config()['api']['health_ttl'].as_int()
+    )
+    connectivity_monitor().start()
+    lease_manager = LeaseManager(
+        sqs_consumer,
+        config()['consumer']['min_visibility_timeout'].as_int(),
+        config()['consumer']['max_visibility_timeout'].as_int()
+    )
+    pipeline = ConsumerPipeline(
+        sqs_consumer,
+        api_client,
+        lease_manager,
+        config()['consumer']['pollers'].as_int(),
+        config()['consumer']['max_pending_batches'].as_int(),
+        config()['consumer']['delete_interval'].as_int()
+    )
+    pipeline.start()
+    pipeline.join()
 
 if __name__ == "__main__":
     os.makedirs(config()['paths']['config_dir'].as_str(), exist_ok=True)
@@ -0,0 +1,229 @@
+import json
+import queue
+import threading
+import time
+
+from app.config.config import config
+from app.connectivity import connectivity_monitor
+from app.event_consumer.api_client import APIClient
+from app.event_consumer.consumer import QueueConsumer
+from app.event_consumer.lease import LeaseManager
+from app.utils import offline
+
+# Max number of messages in one delete request, allowed by sqs.
+MAX_DELETE_BATCH = 10
+
+class ConsumerPipeline:
+    """
+    Consumes the queue in three stages running at the same time, so the backlog drains as fast as the API can take it:
+    1. Pollers: each one keeps a long poll in flight, and turns the messages it receives into a batch.
+    2. Delivery: sends the batches to the API. Its queue is bounded, so the pollers wait when the API falls behind.
+       The batches that piled up meanwhile are sent to the API in one request.
+    3. Deleter: deletes the delivered messages from the queue in the background, in batches.
+
+    The messages are leased until they're deleted, so they aren't redelivered while they're in the pipeline.
+    See `LeaseManager`.
+
+    Batch format: `{"events": [...], "receipts": {message id: receipt handle}}`
+    """
+    def __init__(
+        self,
+        queue_consumer: QueueConsumer,
+        api_client: APIClient,
+        lease_manager: LeaseManager | None = None,
+        pollers: int = 2,
+        max_pending_batches: int = 4,
+        delete_interval: float = 1,
+        max_delete_retries: int = 2
+    ):
+        self.queue_consumer = queue_consumer
+        self.api_client = api_client
+        self.leases = lease_manager or LeaseManager(queue_consumer)
+        self.pollers = pollers
+        self.max_pending_batches = max_pending_batches
+        self.delete_interval = delete_interval
+        self.max_delete_retries = max_delete_retries
+
+        self.delivery_queue: queue.Queue[dict] = queue.Queue(maxsize=max_pending_batches)
+        self.delete_queue: queue.Queue[dict[str, str]] = queue.Queue()
+        # Only one poller checks the health of the API and the queue at a time.
+        self.gate_lock = threading.Lock()
+        self.poll_time_lock = threading.Lock()
+        self.stopping = threading.Event()
+        self.delivered = threading.Event()
+        self.poller_threads: list[threading.Thread] = []
+        self.delivery_thread: threading.Thread | None = None
+        self.deleter_thread: threading.Thread | None = None
+
+    def start(self):
+        self.poller_threads = [
+            threading.Thread(target=self._poll, name=f"poller-{i}", daemon=True) for i in range(self.pollers)
+        ]
+        self.delivery_thread = threading.Thread(target=self._deliver, name="delivery", daemon=True)
+        self.deleter_thread = threading.Thread(target=self._delete, name="deleter", daemon=True)
+        self.leases.start()
+        for thread in [*self.poller_threads, self.delivery_thread, self.deleter_thread]:
+            thread.start()
+
+    def join(self):
+        for thread in [*self.poller_threads, self.delivery_thread, self.deleter_thread]:
+            thread.join()
+
+    def stop(self):
+        """
+        Stops polling, then delivers the batches already received and deletes their messages.
+        """
+        self.stopping.set()
+        for thread in self.poller_threads:
+            thread.join()
+        self.delivery_thread.join()
+        self.delivered.set()
+        self.deleter_thread.join()
+        self.leases.stop()
+
+    def _poll(self):
+        failures = 0
+        while not self.stopping.is_set():
+            if not self._can_poll():
+                failures += 1
+                self.stopping.wait(2 ** min(failures, 5)) # exponential backoff
+                continue
+
+            visibility_timeout = self.leases.visibility_timeout()
+            response = self.queue_consumer.receive_messages(visibility_timeout)
+            if response is None:
+                failures += 1
+                self.stopping.wait(2 ** min(failures, 5))
+                continue
+            failures = 0
+            with self.poll_time_lock:
+                offline.write_poll_time()
+
+            messages = response.get('Messages', [])
+            if not messages:
+                continue
+            print(f"Received {len(messages)} messages.")
+            self.leases.acquire(messages, visibility_timeout)
+            batch = {"events": [], "receipts": {}}
+            # We can receive multiple messages in one response
+            for sqs_message in messages:
+                try:
+                    body = json.loads(sqs_message['Body'])
+                    message = json.loads(body['Message'])
+                    message_events = message['events']
+                except (ValueError, KeyError, TypeError) as e:
+                    # Deleted, as it would never parse and would block the rest of its message group meanwhile.
+                    print(f"Error parsing message {sqs_message.get('MessageId')}, dropping it: {e}")
+                    self.delete_queue.put({sqs_message['MessageId']: sqs_message['ReceiptHandle']})
+                    continue
+                # mapping (msg id -> receipt handle) required to delete messages from queue
+                batch["receipts"][sqs_message['MessageId']] = sqs_message['ReceiptHandle']
+                batch["events"].extend(message_events)
+            if not batch["receipts"]:
+                continue
+
+            # Waits for the delivery stage to catch up, if it's behind.
+            while not _put(self.delivery_queue, batch):
+                if self.stopping.is_set():
+                    return
+
+    def _can_poll(self) -> bool:
+        """
+        Returns True if the API and the queue are healthy. Sends a resync request if the queue retention period expired.
+        """
+        with self.gate_lock:
+            # Only requests /health if the API didn't respond recently, e.g. to the last events sent.
+            if not self.api_client.is_healthy():
+                print("API is not healthy. Waiting for it to come back online...")
+                return False
+
+            if not offline.is_within_retention_period():
+                print("Retention period expired. Sending resync request...")
+                if not self.api_client.send_resync_request():
+                    print("Error sending resync request.")
+                    return False
+                with self.poll_time_lock:
+                    offline.write_poll_time()
+                self.stopping.wait(30) # Wait for the resync to complete
+
+            if not connectivity_monitor().is_online("sqs"):
+                handle_consumer_offline()
+                return False
+        return True
+
+    def _deliver(self):
+        while True:
+            try:
+                batches = [self.delivery_queue.get(timeout=0.5)]
+            except queue.Empty:
+                if self.stopping.is_set() and not any(t.is_alive() for t in self.poller_threads):
+                    return
+                continue
+            # Sends the batches that piled up while the last request was in flight together.
+            while len(batches) < self.max_pending_batches:
+                try:
+                    batches.append(self.delivery_queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            events = [event for batch in batches for event in batch["events"]]
+            receipts = {msg_id: rh for batch in batches for msg_id, rh in batch["receipts"].items()}
+            # The leases keep the messages invisible for as long as the delivery may take.
+            timeout = self.leases.delivery_timeout(list(receipts))
+            if events and not self.api_client.send_events(events, timeout):
+                # Not deleted, and made visible again after a backoff so the messages are retried.
+                print(f"Error delivering {len(receipts)} messages to the API.")
+                self.leases.abandon(list(receipts))
+                continue
+            self.leases.delivered(list(receipts))
+            self.delete_queue.put(receipts)
+
+    def _delete(self):
+        pending: dict[str, str] = {}
+        attempts: dict[str, int] = {}
+        while True:
+            done = self.delivered.is_set()
+            # Waits for a full batch, or for the interval to pass.
+            deadline = time.monotonic() + self.delete_interval
+            while len(pending) < MAX_DELETE_BATCH:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    pending.update(self.delete_queue.get(timeout=timeout))
+                except queue.Empty:
+                    break
+
+            ids = list(pending)
+            for i in range(0, len(ids), MAX_DELETE_BATCH):
+                batch = {msg_id: pending[msg_id] for msg_id in ids[i:i + MAX_DELETE_BATCH]}
+                failed = self.queue_consumer.delete_messages(batch, max_retries=0)
+                for msg_id in batch:
+                    if msg_id not in failed:
+                        pending.pop(msg_id)
+                        attempts.pop(msg_id, None)
+                        self.leases.release([msg_id])
+                        continue
+                    # Retried with the next batch.
+                    attempts[msg_id] = attempts.get(msg_id, 0) + 1
+                    if attempts[msg_id] > self.max_delete_retries:
+                        print(f"Giving up deleting message {msg_id}. It will be received again.")
+                        pending.pop(msg_id)
+                        attempts.pop(msg_id)
+                        self.leases.release([msg_id])
+
+            if done and self.delete_queue.empty() and not pending:
+                return
+
+def handle_consumer_offline():
+    if offline.get_last_poll() != offline.get_snapshot_time():
+        print("Went offline. Saving file system snapshot.")
+        fs_snapshot_file = config()['paths']['fs_snapshot_file'].as_str()
+        offline.save_simple_fs_snapshot(fs_snapshot_file)
+
+def _put(q: queue.Queue, item, timeout: float = 0.5) -> bool:
+    try:
+        q.put(item, timeout=timeout)
+        return True
+    except queue.Full:
+        return False
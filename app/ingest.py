@@ -0,0 +1,307 @@
+import json
+import os
+import queue
+import shutil
+import threading
+import uuid
+
+from app.album_index import album_index
+from app.announcer import event_announcer
+from app.blob_store import blob_store
+from app.cloud_clients.cloud_client import cloud_client
+from app.config.config import config
+from app.connectivity import connectivity_monitor
+from app.playlist import playlist
+from app.render_cache import render_cache
+from app.thumbnails import thumbnail_cache
+from app.utils import utils, offline, filesystem
+
+class SavedFile:
+    """Represents a file that has been saved to disk."""
+    def __init__(self, guid: str, file_path: str):
+        self.guid = guid
+        self.file_path = file_path
+
+    def get_file_path(self) -> str:
+        """Get the full file path."""
+        return self.file_path
+
+    def get_guid(self) -> str:
+        """Get the file GUID."""
+        return self.guid
+
+    def get_stripped_path(self) -> str:
+        """Get the file path with base directory stripped."""
+        return filesystem.strip_base_dir(self.file_path)
+
+    def is_jpg(self) -> bool:
+        """Check if the file is a JPG/JPEG."""
+        return utils.get_file_extension(self.file_path) in {'jpg', 'jpeg'}
+
+
+class HeifFile:
+    """Represents a HEIF/HEIC file that needs to be converted to JPG."""
+    def __init__(self, guid: str, album_path: str, image_name: str):
+        self.guid = guid
+        self.album_path = album_path
+        # Format: <name>.<ext>
+        self.image_name = image_name
+
+    def get_guid(self) -> str:
+        """Get the file GUID."""
+        return self.guid
+
+    def get_heif_path(self, tmp_storage_dir: str) -> str:
+        """Get the full path to the temporary HEIF file."""
+        return f"{tmp_storage_dir}/{self.image_name}"
+
+    def get_jpg_path(self, base_dir: str) -> str:
+        """Get the full path where the converted JPG should be saved."""
+        jpg_name = self.image_name.rsplit('.', 1)[0] + '.jpg'
+        return f"{base_dir}/albums/{self.album_path}/{jpg_name}"
+
+
+class IngestQueue:
+    """
+    Durable queue of upload jobs, processed one at a time by a background worker.
+
+    An upload is saved to a staging directory and a job file is written before the upload request returns.
+    The worker then converts, rotates and saves the images to their albums, and uploads them to the cloud.
+    The job file is checkpointed after every step, so pending jobs are resumed if the app restarts.
+
+    Progress is pushed to the clients with `UPLOAD` events:
+    - `{"event": "UPLOAD", "jobId": str, "guid": str, "status": "saved", "path": str}`: the image was saved to its album.
+    - `{"event": "UPLOAD", "jobId": str, "guid": str, "status": "failed"}`: the image failed to be saved or uploaded.
+    - `{"event": "UPLOAD", "jobId": str, "status": "complete", "failed": [guid, ...]}`: the job is done.
+
+    Job file format:
+    ```
+    {
+        "id": str,
+        "files": [
+            {
+                "guid": str,
+                "albumPath": str,
+                "imageName": str,
+                "status": "pending" | "saved" | "uploaded" | "failed",
+                "path": str  # abs path of the saved image, once it is saved.
+            }
+        ]
+    }
+    ```
+    """
+    def __init__(self, jobs_dir: str, staging_dir: str):
+        self.jobs_dir = jobs_dir
+        self.staging_dir = staging_dir
+        self.queue: queue.Queue[str] = queue.Queue()
+        self.worker: threading.Thread | None = None
+        # Guards the job file, HEIF conversions checkpoint from several threads.
+        self.lock = threading.Lock()
+
+    def start(self):
+        """
+        Queues the jobs left over from a previous run and starts the worker.
+        """
+        os.makedirs(self.jobs_dir, exist_ok=True)
+        os.makedirs(self.staging_dir, exist_ok=True)
+        if self.worker is not None:
+            return
+
+        pending = [f for f in os.listdir(self.jobs_dir) if f.endswith('.json')]
+        pending.sort(key=lambda f: os.path.getmtime(os.path.join(self.jobs_dir, f)))
+        for f in pending:
+            print(f"Resuming upload job {f.removesuffix('.json')}")
+            self.queue.put(f.removesuffix('.json'))
+
+        self.worker = threading.Thread(target=self._run, name="ingest-worker", daemon=True)
+        self.worker.start()
+
+    def new_job(self) -> str:
+        """
+        Creates a staging directory for a new job and returns the job id.
+        """
+        job_id = str(uuid.uuid4())
+        os.makedirs(self.get_staging_dir(job_id), exist_ok=True)
+        return job_id
+
+    def get_staging_dir(self, job_id: str) -> str:
+        return f"{self.staging_dir}/{job_id}"
+
+    def submit(self, job_id: str, files: list[dict[str, str]]):
+        """
+        Queues a job. The files of the job must already be in the job's staging directory.
+
+        files: List of {"guid": str, "albumPath": str, "imageName": str}
+        """
+        job = {
+            "id": job_id,
+            "files": [{**f, "status": "pending"} for f in files]
+        }
+        self._save_job(job)
+        self.queue.put(job_id)
+
+    def _run(self):
+        while True:
+            job_id = self.queue.get()
+            try:
+                job = self._load_job(job_id)
+                if job is not None:
+                    self._process(job)
+            except Exception as e:
+                print(f"Error processing upload job {job_id}: {e}")
+
+    def _process(self, job: dict):
+        job_id = job["id"]
+        base_dir = config()['paths']['base_dir'].as_str()
+        max_workers = config()['processing']['max_workers'].as_int()
+        staging_dir = self.get_staging_dir(job_id)
+        files_by_guid = {f["guid"]: f for f in job["files"]}
+
+        # 1. Save the images to their albums.
+        pending = [f for f in job["files"] if f["status"] == "pending"]
+        saved_events = []
+        heif_files: list[HeifFile] = []
+        for f in pending:
+            if utils.get_file_extension(f["imageName"]) in {'heif', 'heic'}:
+                heif_file = HeifFile(f["guid"], f["albumPath"], f["imageName"])
+                if os.path.exists(heif_file.get_heif_path(staging_dir)):
+                    heif_files.append(heif_file)
+                elif os.path.exists(heif_file.get_jpg_path(base_dir)):
+                    # Converted before the app stopped, but the job wasn't checkpointed.
+                    f["status"], f["path"] = "saved", heif_file.get_jpg_path(base_dir)
+                    saved_events.append(self._file_event(job_id, f))
+                else:
+                    f["status"] = "failed"
+                    saved_events.append(self._file_event(job_id, f))
+                continue
+            staged_path = f"{staging_dir}/{f['imageName']}"
+            if not os.path.exists(staged_path):
+                f["status"] = "failed"
+                saved_events.append(self._file_event(job_id, f))
+                continue
+            album_dir = f"{base_dir}/albums/{f['albumPath']}"
+            os.makedirs(album_dir, exist_ok=True)
+            loc = utils.handle_duplicate_file(album_dir, f["imageName"])
+            os.replace(staged_path, loc)
+            f["status"], f["path"] = "saved", loc
+            saved_events.append(self._file_event(job_id, f))
+            self._save_job(job)
+
+        if heif_files:
+            jpg_paths = {heif_file.get_heif_path(staging_dir): heif_file.get_jpg_path(base_dir) for heif_file in heif_files}
+            guids = {heif_file.get_heif_path(staging_dir): heif_file.get_guid() for heif_file in heif_files}
+
+            def on_converted(result: utils.CommandResult):
+                f = files_by_guid[guids[result.path]]
+                if result.exit_code == 0:
+                    f["status"], f["path"] = "saved", jpg_paths[result.path]
+                else:
+                    f["status"] = "failed"
+                self._save_job(job)
+                self._announce([self._file_event(job_id, f)])
+
+            utils.heifs_to_jpgs(list(jpg_paths), list(jpg_paths.values()), 80, True, max_workers, on_converted)
+
+        # Includes the images saved before a restart, rotating them again is a no-op.
+        saved_files = [SavedFile(f["guid"], f["path"]) for f in job["files"] if f["status"] == "saved"]
+
+        # 2. Rotate the JPGs based on their EXIF orientation.
+        jpg_paths = [sf.get_file_path() for sf in saved_files if sf.is_jpg()]
+        if len(jpg_paths) > 0:
+            utils.rotate_jpgs(jpg_paths, max_workers)
+
+        # Replaces the images already in the albums by links, and gets the digests to skip uploading them again.
+        digests = {sf.get_guid(): blob_store().add(sf.get_file_path()) for sf in saved_files}
+        for sf in saved_files:
+            album_index().add(sf.get_stripped_path())
+        if config()['thumbnails']['generate_on_upload'].as_bool():
+            image_paths = [sf.get_file_path() for sf in saved_files]
+            thumbnail_cache().generate_async(image_paths)
+            # And the rendition of the images played by the slideshow.
+            render_cache().generate_async([path for path in image_paths if playlist().contains(path)])
+
+        self._save_job(job)
+        # The HEIF events were already announced as each conversion finished.
+        self._announce(saved_events)
+
+        # 3. Upload the images to the cloud.
+        failed_events = []
+        if not connectivity_monitor().is_online("s3"):
+            offline_events = [offline.create_offline_event('PUT', sf.get_file_path()) for sf in saved_files]
+            offline_events_file = config()['paths']['offline_events_file'].as_str()
+            offline.save_offline_events(offline_events_file, offline_events)
+            for sf in saved_files:
+                files_by_guid[sf.get_guid()]["status"] = "uploaded"
+        elif len(saved_files) > 0:
+            success, failure = cloud_client().insert_bulk(
+                [sf.get_file_path() for sf in saved_files],
+                [sf.get_stripped_path() for sf in saved_files],
+                digests=[digests[sf.get_guid()] for sf in saved_files]
+            )
+            for sf in saved_files:
+                f = files_by_guid[sf.get_guid()]
+                if sf.get_stripped_path() in failure:
+                    f["status"] = "failed"
+                    failed_events.append(self._file_event(job_id, f))
+                else:
+                    f["status"] = "uploaded"
+
+            # Push events to queue
+            message = json.dumps({"events": [{"event": "PUT", "path": sf} for sf in success], "sender": os.getenv('USERNAME')})
+            cloud_client().insert_queue(message)
+
+        failed = [f["guid"] for f in job["files"] if f["status"] == "failed"]
+        if failed:
+            print(f'failed to upload: {failed}')
+        self._announce(failed_events + [{"event": "UPLOAD", "jobId": job_id, "status": "complete", "failed": failed}])
+
+        shutil.rmtree(staging_dir, ignore_errors=True)
+        filesystem.silentremove(self._job_file(job_id))
+
+    def _file_event(self, job_id: str, f: dict) -> dict:
+        event = {"event": "UPLOAD", "jobId": job_id, "guid": f["guid"], "status": f["status"]}
+        if f["status"] == "saved":
+            event["path"] = filesystem.strip_base_dir(f["path"])
+        return event
+
+    def _announce(self, events: list[dict]):
+        if events:
+            event_announcer().announce(json.dumps({"events": events, "sender": os.getenv('USERNAME')}))
+
+    def _job_file(self, job_id: str) -> str:
+        return f"{self.jobs_dir}/{job_id}.json"
+
+    def _load_job(self, job_id: str) -> dict | None:
+        try:
+            with open(self._job_file(job_id), 'r') as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError) as e:
+            print(f"Failed to load upload job {job_id}: {e}")
+            return None
+
+    def _save_job(self, job: dict):
+        """
+        Atomically writes the job file. Resilient to crashes and restarts.
+        """
+        os.makedirs(self.jobs_dir, exist_ok=True)
+        job_file = self._job_file(job["id"])
+        tmp_file = f'{job_file}.tmp'
+        with self.lock:
+            with open(tmp_file, 'w') as f:
+                json.dump(job, f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_file, job_file)
+
+_INGEST_QUEUE = None
+
+def init_ingest_queue(jobs_dir: str, staging_dir: str):
+    global _INGEST_QUEUE
+    if _INGEST_QUEUE is not None:
+        return # Already initialized
+    _INGEST_QUEUE = IngestQueue(jobs_dir, staging_dir)
+
+def ingest_queue():
+    if _INGEST_QUEUE is None:
+        raise RuntimeError("Ingest queue not initialized. Run init_ingest_queue() first.")
+    return _INGEST_QUEUE
@@ -0,0 +1,36 @@
+"""
+Moves the images of an existing library into the blob store, so the duplicate images (e.g. copied into several albums)
+share their bytes on disk. Safe to run again, and while the app is running.
+
+Usage: python -m app.migrate_blobs
+"""
+import os
+
+from app.blob_store import init_blob_store, blob_store
+from app.config.config import config, load_config
+from app.thumbnails import init_thumbnail_cache, thumbnail_cache
+from app.utils import utils
+
+utils.load_env([".env", os.path.abspath(os.path.expandvars('$HOME/.config/pi-photo-album/.env'))])
+load_config()
+# The digests are cached in the same xattrs as the thumbnails.
+init_thumbnail_cache(
+    config()['paths']['thumbnail_cache_dir'].as_str(),
+    {name: int(size) for name, size in config()['thumbnails']['sizes']},
+    config()['thumbnails']['max_cache_size'].as_int(),
+    config()['thumbnails']['quality'].as_int()
+)
+init_blob_store(config()['paths']['blobs_dir'].as_str(), thumbnail_cache().content_digest)
+
+def main():
+    albums_dir = f"{config()['paths']['base_dir'].as_str()}/albums"
+    print(f"Migrating {albums_dir} to the blob store...")
+    stats = blob_store().migrate(albums_dir)
+    deleted, _ = blob_store().collect_garbage()
+    print(
+        f"Migrated {stats['images']} images: {stats['deduplicated']} duplicates linked, "
+        f"{stats['savedBytes'] / (1024 * 1024):.1f}MB freed, {deleted} unused blobs deleted."
+    )
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,356 @@
+import json
+import os
+import random
+import threading
+from typing import Callable
+
+from app.utils import filesystem
+
+class Playlist:
+    """
+    Order of the images of the slideshow, kept up to date incrementally instead of walking the album again.
+
+    The images are ordered album by album (the images of an album before its sub-albums, sub-albums by name), and by
+    modification time within an album. Or shuffled, with a seeded RNG so a shuffled order can be restored.
+    The modification times are cached, so an image is only stat'ed once, when it's added.
+
+    Removed images leave a hole (None) in `slots`, squeezed out once half of the slots are holes. A Fenwick tree
+    counts the images in the slots, so the position of an image, and the image at a position, are found in O(log n)
+    despite the holes.
+    - add: O(1). The Fenwick tree catches up with the added slots when it's next used.
+    - remove: O(log n)
+    - shuffle: O(n), in place.
+
+    State file format:
+    ```
+    {
+        "album": str,           # abs path of the album.
+        "recursive": bool,      # whether the images of the sub-albums are included.
+        "shuffled": bool,
+        "seed": int | null,     # seed of the shuffle, null if not shuffled or shuffled with the global RNG.
+        "images": [str, ...],   # abs paths of the images, in order.
+        "mtimes": [int, ...]    # mtime (ns) of each image.
+    }
+    ```
+    """
+    def __init__(self, state_file: str = ""):
+        """
+        Args:
+            state_file (str): Where the playlist is saved, so it's restored without walking the album. Not saved if empty.
+        """
+        self.state_file = state_file
+        self.album = ""
+        self.recursive = True
+        self.shuffled = False
+        self.seed: int | None = None
+
+        self.lock = threading.RLock()
+        self.slots: list[str | None] = []
+        # image path -> slot
+        self.positions: dict[str, int] = {}
+        # image path -> mtime (ns)
+        self.mtimes: dict[str, int] = {}
+        # 1-indexed Fenwick tree of the number of images in the slots, covering the first `len(self.tree) - 1` slots.
+        self.tree: list[int] = [0]
+        # Incremented when the images or their order change. `written` is its value when the playlist was last
+        # written, None if it wasn't written yet.
+        self.changes = 0
+        self.written: int | None = None
+
+    def __len__(self):
+        return len(self.positions)
+
+    def images(self) -> list[str]:
+        with self.lock:
+            return [path for path in self.slots if path is not None]
+
+    def contains(self, path: str) -> bool:
+        """
+        Returns True if the image at `path` belongs in the playlist, whether it's in it or not.
+        """
+        if not self.album or not path.startswith(f"{self.album}/"):
+            return False
+        return self.recursive or os.path.dirname(path) == self.album
+
+    def dirty(self) -> bool:
+        """
+        Returns True if the images changed since the playlist was last written, e.g. by the album index.
+        """
+        with self.lock:
+            return self.written != self.changes
+
+    def load(self) -> bool:
+        """
+        Restores the saved playlist. Returns False if there's no saved playlist.
+        """
+        try:
+            with open(self.state_file, 'r') as f:
+                state = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return False
+        with self.lock:
+            self.album, self.recursive = state["album"], state["recursive"]
+            self.shuffled, self.seed = state["shuffled"], state["seed"]
+            self._reset(state["images"], dict(zip(state["images"], state["mtimes"])))
+        return True
+
+    def save(self):
+        """
+        Atomically writes the state file.
+        """
+        if not self.state_file:
+            return
+        with self.lock:
+            images = self.images()
+            state = {
+                "album": self.album,
+                "recursive": self.recursive,
+                "shuffled": self.shuffled,
+                "seed": self.seed,
+                "images": images,
+                "mtimes": [self.mtimes[path] for path in images]
+            }
+            os.makedirs(os.path.dirname(self.state_file), exist_ok=True)
+            tmp_file = f'{self.state_file}.tmp'
+            with open(tmp_file, 'w') as f:
+                json.dump(state, f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_file, self.state_file)
+
+    def set_album(self, album: str, recursive: bool, image_paths: list[str] | None = None):
+        """
+        Plays the images of the album, ordered by album then by modification time. The images are listed from
+        `image_paths` if given (e.g. from the album index), otherwise by walking the album.
+
+        Only the images that aren't in the playlist yet are stat'ed.
+        """
+        album = album.rstrip('/')
+        with self.lock:
+            mtimes = self.mtimes
+            self.album, self.recursive = album, recursive
+            self.shuffled, self.seed = False, None
+            if image_paths is None:
+                image_paths = self._walk()
+            image_paths = [path for path in image_paths if self.contains(path)]
+            mtimes = {path: mtimes[path] if path in mtimes else _mtime(path) for path in image_paths}
+            images = [path for path in image_paths if mtimes[path] is not None]
+            images.sort(key=lambda path: (os.path.dirname(path).split('/'), mtimes[path], path))
+            self._reset(images, mtimes)
+
+    def sync(self, image_paths: list[str]):
+        """
+        Adds the images missing from the playlist and removes the images that aren't in `image_paths` anymore,
+        keeping the order of the others. E.g. after the playlist is loaded, with the images of the album index.
+        """
+        with self.lock:
+            image_paths = [path for path in image_paths if self.contains(path)]
+            current = set(image_paths)
+            for path in [path for path in self.positions if path not in current]:
+                self.remove(path)
+            for path in image_paths:
+                self.add(path)
+
+    def add(self, path: str) -> bool:
+        """
+        Appends an image to the playlist, if it belongs in it. An image already in the playlist keeps its position.
+        Returns True if the image was added.
+        """
+        if not self.contains(path):
+            return False
+        with self.lock:
+            if path in self.positions:
+                return False
+            mtime = _mtime(path)
+            if mtime is None:
+                return False
+            self.mtimes[path] = mtime
+            self.positions[path] = len(self.slots)
+            self.slots.append(path)
+            self.changes += 1
+            return True
+
+    def remove(self, path: str) -> bool:
+        """
+        Returns True if the image was in the playlist.
+        """
+        with self.lock:
+            slot = self.positions.pop(path, None)
+            if slot is None:
+                return False
+            self.mtimes.pop(path, None)
+            self.slots[slot] = None
+            self.changes += 1
+            if slot < len(self.tree) - 1:
+                self._update(slot + 1, -1)
+            if len(self.slots) > 2 * max(len(self.positions), 16):
+                self._reset(self.images())
+            return True
+
+    def remove_album(self, album: str) -> bool:
+        """
+        Removes the images of an album and its sub-albums, e.g. when the album is deleted.
+        Returns True if any image was in the playlist.
+        """
+        prefix = f"{album.rstrip('/')}/"
+        with self.lock:
+            paths = [path for path in self.positions if path.startswith(prefix)]
+            for path in paths:
+                self.remove(path)
+            return bool(paths)
+
+    def move(self, src_path: str, dest_path: str):
+        """
+        Renames an image, keeping its position.
+        """
+        with self.lock:
+            slot = self.positions.get(src_path)
+            if slot is None or not self.contains(dest_path):
+                self.remove(src_path)
+                self.add(dest_path)
+                return
+            if dest_path in self.positions:
+                self.remove(src_path)
+                return
+            del self.positions[src_path]
+            self.positions[dest_path] = slot
+            self.slots[slot] = dest_path
+            self.changes += 1
+            self.mtimes[dest_path] = self.mtimes.pop(src_path)
+
+    def on_album_change(self, action: str, key: str, new_key: str | None):
+        """
+        Keeps the playlist up to date with the album index. See `AlbumIndex.subscribe`.
+        """
+        match action:
+            case "add":
+                self.add(filesystem.key_to_abs_path(key))
+            case "remove":
+                self.remove(filesystem.key_to_abs_path(key))
+            case "move":
+                self.move(filesystem.key_to_abs_path(key), filesystem.key_to_abs_path(new_key))
+
+    def shuffle(self, seed: int | None = None):
+        """
+        Shuffles the playlist in place. The same seed gives the same order of the same images.
+        Without a seed, the shuffle uses the global RNG.
+        """
+        with self.lock:
+            images = self.images()
+            if seed is None:
+                random.shuffle(images)
+            else:
+                random.Random(seed).shuffle(images)
+            self.shuffled, self.seed = True, seed
+            # Same images, the cached mtimes are kept as is.
+            self._reset(images)
+
+    def index(self, path: str) -> int:
+        """
+        Returns the position of the image in the playlist. Raises KeyError if it isn't in the playlist.
+        """
+        with self.lock:
+            slot = self.positions[path]
+            self._catch_up()
+            return self._prefix(slot)
+
+    def get(self, index: int) -> str:
+        """
+        Returns the image at a position of the playlist. Raises IndexError if the position is out of range.
+        """
+        with self.lock:
+            if not 0 <= index < len(self.positions):
+                raise IndexError(index)
+            self._catch_up()
+            # Finds the slot holding the `index + 1`th image, by descending the Fenwick tree.
+            pos = 0
+            remaining = index + 1
+            step = 1 << (len(self.tree) - 1).bit_length()
+            while step:
+                if pos + step < len(self.tree) and self.tree[pos + step] < remaining:
+                    pos += step
+                    remaining -= self.tree[pos]
+                step >>= 1
+            return self.slots[pos]
+
+    def write(self, playlist_file: str, rendition: Callable[[str], str] | None = None):
+        """
+        Atomically writes the images, one path per line, e.g. for fbi.
+
+        rendition: Callable[[str], str] | None - Maps an image to the file actually played, e.g. its cached rendition
+            at the resolution of the display. See `RenderCache.rendition()`.
+        """
+        os.makedirs(os.path.dirname(playlist_file), exist_ok=True)
+        tmp_file = f'{playlist_file}.tmp'
+        # Holds the lock so that concurrent writers don't share the temporary file.
+        with self.lock:
+            images = self.images()
+            if rendition is not None:
+                images = [rendition(path) for path in images]
+            with open(tmp_file, 'w') as f:
+                f.write('\n'.join(images))
+            os.replace(tmp_file, playlist_file)
+            self.written = self.changes
+
+    def _walk(self) -> list[str]:
+        paths = []
+        for root, dirs, files in os.walk(self.album):
+            paths.extend(os.path.join(root, file) for file in files)
+            if not self.recursive:
+                break
+        return paths
+
+    def _reset(self, images: list[str], mtimes: dict[str, int] | None = None):
+        """
+        Replaces the content of the playlist, without holes. Must hold the lock.
+        """
+        self.slots = images
+        self.positions = dict(zip(images, range(len(images))))
+        self.changes += 1
+        if mtimes is not None:
+            self.mtimes = {path: mtimes[path] for path in images}
+        # All the slots hold an image: node i counts the slots in (i - lowbit(i), i].
+        self.tree = [0] + [i & -i for i in range(1, len(self.slots) + 1)]
+
+    def _catch_up(self):
+        """
+        Extends the Fenwick tree to the slots added since it was last used. Must hold the lock.
+        """
+        for i in range(len(self.tree), len(self.slots) + 1):
+            value = 1 if self.slots[i - 1] is not None else 0
+            self.tree.append(value + self._prefix(i - 1) - self._prefix(i - (i & -i)))
+
+    def _update(self, i: int, delta: int):
+        while i < len(self.tree):
+            self.tree[i] += delta
+            i += i & -i
+
+    def _prefix(self, i: int) -> int:
+        """
+        Number of images in the first `i` slots.
+        """
+        total = 0
+        while i > 0:
+            total += self.tree[i]
+            i -= i & -i
+        return total
+
+def _mtime(path: str) -> int | None:
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+_PLAYLIST = None
+
+def init_playlist(state_file: str):
+    global _PLAYLIST
+    if _PLAYLIST is not None:
+        return # Already initialized
+    _PLAYLIST = Playlist(state_file)
+    _PLAYLIST.load()
+
+def playlist():
+    if _PLAYLIST is None:
+        raise RuntimeError("Playlist not initialized. Run init_playlist() first.")
+    return _PLAYLIST
@@ -0,0 +1,151 @@
+import os
+import queue
+import subprocess
+import threading
+import time
+from typing import Callable
+
+from app.playlist import Playlist
+
+class PlaylistDaemon:
+    """
+    Keeps the slideshow playlist up to date with the album on disk, including the changes made by other processes
+    (e.g. the event consumer).
+
+    The album is watched recursively with `inotifywait`. The events are coalesced in batches: a batch ends once no event
+    came for `batch_delay` seconds, or `max_batch_delay` seconds after its first event. Each batch is applied to the
+    in-memory playlist, then the playlist file is rewritten atomically once and `on_change` is called once.
+    """
+    def __init__(
+        self,
+        album: str,
+        order: Playlist,
+        playlist_file: str,
+        on_change: Callable[[], None],
+        batch_delay: float = 2,
+        max_batch_delay: float = 10,
+        rendition: Callable[[str], str] | None = None
+    ):
+        """
+        Args:
+            album (str): The abs path of the album to watch.
+            order (Playlist): The playlist of the album.
+            playlist_file (str): Where the images are written, one path per line. See `Playlist.write()`.
+            on_change (Callable[[], None]): Called after the playlist file is rewritten, e.g. to restart the slideshow.
+            rendition (Callable[[str], str] | None): Maps an image to the file written to the playlist file.
+                See `Playlist.write()`.
+        """
+        self.album = album.rstrip('/')
+        self.order = order
+        self.playlist_file = playlist_file
+        self.on_change = on_change
+        self.batch_delay = batch_delay
+        self.max_batch_delay = max_batch_delay
+        self.rendition = rendition
+
+        self.events: queue.Queue[tuple[str, str] | None] = queue.Queue()
+        self.proc: subprocess.Popen | None = None
+        self.stopped = threading.Event()
+        self.threads: list[threading.Thread] = []
+
+    def start(self):
+        self.proc = subprocess.Popen(
+            [
+                "inotifywait", "-mrq", "-e", "create,delete,close_write,move",
+                "--format", "%e %w%f", self.album
+            ],
+            stdout=subprocess.PIPE,
+            text=True
+        )
+        self.threads = [
+            threading.Thread(target=self._read, name="playlist-daemon-reader", daemon=True),
+            threading.Thread(target=self._run, name="playlist-daemon", daemon=True)
+        ]
+        for thread in self.threads:
+            thread.start()
+
+    def stop(self):
+        """
+        Stops watching the album. The pending events are dropped, `on_change` isn't called anymore.
+        """
+        self.stopped.set()
+        self.events.put(None)
+        if self.proc is not None:
+            self.proc.terminate()
+            self.proc.wait()
+        for thread in self.threads:
+            if thread is not threading.current_thread():
+                thread.join()
+
+    def apply(self, events: list[tuple[str, str]]) -> bool:
+        """
+        Applies a batch of inotify events `(event, path)` to the playlist, in order. Returns True if the playlist file
+        must be rewritten: an event changed the images of the playlist or their content, or the playlist changed
+        since it was last written, e.g. by the album index (see `Playlist.on_album_change`).
+        """
+        changed = False
+        for event, path in events:
+            flags = event.split(',')
+            if os.path.basename(path).startswith('.'):
+                continue # Files being written, renamed to their final path once complete.
+            is_dir = "ISDIR" in flags
+            if "CREATE" in flags or "MOVED_TO" in flags:
+                if is_dir:
+                    # The images of a moved album, or created before the album was watched.
+                    for root, _, files in os.walk(path):
+                        for file in sorted(files):
+                            if not file.startswith('.'):
+                                changed |= self.order.add(os.path.join(root, file))
+                else:
+                    changed |= self.order.add(path)
+            elif "DELETE" in flags or "MOVED_FROM" in flags:
+                if is_dir:
+                    changed |= self.order.remove_album(path)
+                else:
+                    changed |= self.order.remove(path)
+            elif "CLOSE_WRITE" in flags:
+                # The content of an image of the playlist changed, e.g. it was rotated.
+                changed |= path in self.order.positions
+        return changed or self.order.dirty()
+
+    def _read(self):
+        for line in self.proc.stdout:
+            event, _, path = line.rstrip('\n').partition(' ')
+            if path:
+                self.events.put((event, path))
+        if not self.stopped.is_set():
+            print(f"inotifywait stopped watching {self.album} (exit code {self.proc.wait()}).")
+
+    def _run(self):
+        while not self.stopped.is_set():
+            batch = self._next_batch()
+            if not batch or self.stopped.is_set():
+                continue
+            try:
+                if not self.apply(batch):
+                    continue
+                self.order.write(self.playlist_file, self.rendition)
+                self.order.save()
+                print(f"Applied {len(batch)} album changes to the playlist ({len(self.order)} images).")
+                self.on_change()
+            except Exception as e:
+                print(f"Error updating the playlist: {e}")
+
+    def _next_batch(self) -> list[tuple[str, str]]:
+        """
+        Blocks until an event comes, then collects the events until the batch ends.
+        """
+        event = self.events.get()
+        if event is None:
+            return []
+        batch = [event]
+        deadline = time.monotonic() + self.max_batch_delay
+        while (remaining := deadline - time.monotonic()) > 0:
+            try:
+                event = self.events.get(timeout=min(self.batch_delay, remaining))
+            except queue.Empty:
+                break
+            if event is None:
+                return []
+            batch.append(event)
+        return batch
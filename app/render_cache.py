@@ -0,0 +1,51 @@
+from app.thumbnails import ThumbnailCache
+
+DISPLAY = "display"
+FB_VIRTUAL_SIZE_FILE = "/sys/class/graphics/fb0/virtual_size"
+DEFAULT_RESOLUTION = (1920, 1080)
+
+class RenderCache(ThumbnailCache):
+    """
+    Renditions of the slideshow images, scaled down to the resolution of the display with their EXIF orientation
+    applied, so the slideshow doesn't decode and scale the full resolution originals for every frame.
+
+    Same storage and eviction as the thumbnails, with a single `display` size. The slideshow plays the rendition of
+    an image once it's cached, and the original until then.
+    """
+    def __init__(self, cache_dir: str, resolution: tuple[int, int], max_bytes: int, quality: int = 90, max_workers: int = 1):
+        super().__init__(cache_dir, {DISPLAY: resolution}, max_bytes, quality, max_workers, name="renders")
+
+    def rendition(self, image_path: str) -> str:
+        """
+        Returns the path to the cached rendition of the image, or the image itself if it isn't rendered yet.
+        """
+        return self.cached_path(image_path, DISPLAY) or image_path
+
+def framebuffer_resolution(resolution: str = "", virtual_size_file: str = FB_VIRTUAL_SIZE_FILE) -> tuple[int, int]:
+    """
+    Parses a `<width>x<height>` resolution. If empty, reads the resolution of the framebuffer, or falls back to 1080p.
+    """
+    if resolution:
+        width, height = resolution.lower().split('x')
+        return int(width), int(height)
+    try:
+        with open(virtual_size_file, 'r') as f:
+            width, height = f.read().strip().split(',')
+        return int(width), int(height)
+    except (OSError, ValueError):
+        print(f"Failed to read the framebuffer resolution, using {DEFAULT_RESOLUTION[0]}x{DEFAULT_RESOLUTION[1]}")
+        return DEFAULT_RESOLUTION
+
+_RENDER_CACHE = None
+
+def init_render_cache(cache_dir: str, resolution: tuple[int, int], max_bytes: int, quality: int = 90, max_workers: int = 1):
+    global _RENDER_CACHE
+    if _RENDER_CACHE is not None:
+        return # Already initialized
+    _RENDER_CACHE = RenderCache(cache_dir, resolution, max_bytes, quality, max_workers)
+    _RENDER_CACHE.load()
+
+def render_cache():
+    if _RENDER_CACHE is None:
+        raise RuntimeError("Render cache not initialized. Run init_render_cache() first.")
+    return _RENDER_CACHE
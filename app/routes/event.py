@@ -3,10 +3,18 @@ import os
 import json
 import queue
 
-from app.utils import filesystem, offline, aws
+from app.utils import filesystem, events
+from app.album_index import album_index
+from app.blob_store import blob_store
 from app.announcer import event_announcer
+from app.playlist import playlist
+from app.render_cache import render_cache
+from app.thumbnails import thumbnail_cache
 from app.cloud_clients.cloud_client import cloud_client
 from app.config.config import config
+from app.connectivity import connectivity_monitor
+from app.seen_events import seen_events
+from app.sync import resyncer
 
 def receive_events(request: Request):
     payload: dict | None = request.json
@@ -14,134 +22,102 @@ def receive_events(request: Request):
         return jsonify({"status": "ok"})
 
 
+    # A message delivered again by the queue has events that were already applied, skip them.
+    new_events = seen_events().filter_unseen(payload['events'])
+    if len(new_events) < len(payload['events']):
+        print(f"Skipping {len(payload['events']) - len(new_events)} events already applied.")
+    failed_paths = set()
+
     processed_events = []
+    downloads = [] # PUT events to download, in parallel once the other events are applied.
     base_dir = config()['paths']['base_dir'].as_str()
 
     # {'events': [{"event": "PUT", "path": "albums/Shared/0eb9fc9e-757b-4c6e-95d5-d7cda4b8e802.webcam-settings.png", "timestamp": 1745101204, "id": "142b9797-a2fe-48ed-8ec1-f875b5fb82d9"}]}
     # If "event" is "MOVE", the event also contains the key "newPath"
-    # Events are expected to be in order
-    for event in payload['events']:
+    # Events are expected to be in order. They are compacted, so that each path is changed at most once.
+    for event in events.compact_events(new_events):
         try:
             match event["event"]:
                 case "PUT":
                     print(f"EVENT: Creating {event['path']}")
-                    path, abs_path = event["path"], filesystem.key_to_abs_path(event['path'])
-                    if filesystem.is_file_owner(path):
-                        image = cloud_client().get(path)
-                        os.makedirs(os.path.dirname(abs_path), exist_ok=True)
-                        with open(abs_path, 'wb') as f:
-                            f.write(image)
+                    if filesystem.is_file_owner(event["path"]):
+                        downloads.append(event)
+                        continue
                 case "DELETE":
                     print(f"EVENT: Deleting {event['path']}")
+                    thumbnail_cache().invalidate(f"{base_dir}/{event['path']}")
                     filesystem.silentremove(f"{base_dir}/{event['path']}")
+                    album_index().remove(event['path'])
                     filesystem.remove_dirs(f'{base_dir}/albums', filesystem.remove_albums_prefix(os.path.dirname(event['path'])))
                 case "MOVE":
                     old_path, abs_old_path = event['path'], filesystem.key_to_abs_path(event['path'])
                     new_path, abs_new_path = event['newPath'], filesystem.key_to_abs_path(event['newPath'])
                     print(f"EVENT: Moving {event['path']} to {event['newPath']}")
                     if filesystem.is_file_owner(old_path) and filesystem.is_file_owner(new_path):
+                        thumbnail_cache().forget(abs_old_path)
                         if os.path.exists(abs_new_path):
                             filesystem.silentremove(abs_old_path)
                         else:
                             os.makedirs(os.path.dirname(abs_new_path), exist_ok=True)
-                            os.rename(abs_old_path, abs_new_path)
+                            filesystem.move_file(abs_old_path, abs_new_path)
+                        album_index().move(old_path, new_path)
                     elif not filesystem.is_file_owner(old_path):
                         # file is moved from a private folder, download it from the cloud
-                        image = cloud_client().get(new_path)
-                        os.makedirs(os.path.dirname(abs_new_path), exist_ok=True)
-                        with open(abs_new_path, 'wb') as f:
-                            f.write(image)
-                        event["event"] = "PUT"
-                        event["path"] = new_path
-                        del event["newPath"]
+                        downloads.append({"event": "PUT", "path": new_path})
+                        continue
                     elif not filesystem.is_file_owner(new_path):
                         # file is moved to a private folder, delete the old file.
+                        thumbnail_cache().invalidate(abs_old_path)
                         filesystem.silentremove(abs_old_path)
-                        event["event"] = "DELETE"
-                        event["path"] = old_path
-                        del event["newPath"]
+                        album_index().remove(old_path)
+                        event = {"event": "DELETE", "path": old_path}
                     filesystem.remove_dirs(f'{base_dir}/albums', filesystem.remove_albums_prefix(os.path.dirname(old_path)))
             processed_events.append(event)
         except Exception as e:
             print(f"Error processing event: {e}")
+            failed_paths.update(path for path in [event['path'], event.get('newPath')] if path is not None)
             continue
 
+    if downloads:
+        keys = [event["path"] for event in downloads]
+        for key in keys:
+            # The local copy, if any, is about to be replaced.
+            thumbnail_cache().invalidate(filesystem.key_to_abs_path(key))
+        downloaded, failed = cloud_client().get_bulk([filesystem.key_to_abs_path(key) for key in keys], keys)
+        if failed:
+            print(f"Error downloading: {failed}")
+            failed_paths.update(failed)
+        for event in downloads:
+            if event["path"] in downloaded:
+                try:
+                    # Images copied into several albums are downloaded once per album, keep one copy on disk.
+                    blob_store().add(filesystem.key_to_abs_path(event["path"]))
+                except OSError as e:
+                    print(f"Error adding {event['path']} to the blob store: {e}")
+                album_index().add(event["path"])
+                processed_events.append(event)
+        # Renders the downloaded images played by the slideshow in the background.
+        image_paths = [filesystem.key_to_abs_path(key) for key in downloaded]
+        render_cache().generate_async([path for path in image_paths if playlist().contains(path)])
+
+    # The failures are per compacted path, which can't be mapped back to the events they came from (e.g. a MOVE's
+    # destination failing to download), so the events are only recorded once they all succeeded. Otherwise they're
+    # all applied again if they're delivered again.
+    if not failed_paths:
+        seen_events().add([event["id"] for event in new_events if "id" in event])
+
     event_announcer().announce(json.dumps({"events": processed_events, "sender": os.getenv('USERNAME')}))
     return jsonify({"status": "ok"})
 
 def resync():
     """
-    Resync the filesystem with the cloud storage.
+    Starts resyncing the filesystem with the cloud storage in the background. See `Resyncer`.
     """
-    event_announcer().announce(json.dumps({"events": [{"event": "LOADING", "loading": True, "message": "Resyncing photos with cloud storage..."}], "sender": os.getenv('USERNAME')}))
-
-    allowed_prefixes = config()['files']['allowed_prefixes'].as_set().as_strs()
-    s3_ping_url = config()['url']['s3_ping_url'].as_str()
-    base_dir = config()['paths']['base_dir'].as_str()
-    offline_events_file = config()['paths']['offline_events_file'].as_str()
-
-    prefixes = [f"albums/{prefix}" for prefix in allowed_prefixes]
-
-    if not aws.ping(s3_ping_url):
+    if not connectivity_monitor().is_online("s3"):
         return jsonify({"status": "error", "message": "Offline"}), 500
 
-    cloud_files = set()
-    for prefix in prefixes:
-        # trailing slash required b/c of s3 policy
-        cloud_files.update(cloud_client().list_album(f'{prefix}/'))
-
-    local_files = set(filesystem.list_files_in_dir(base_dir, prefixes))
-
-    files_not_in_cloud = local_files.difference(cloud_files)
-    files_not_in_local = cloud_files.difference(local_files)
-
-    offline_events = offline.get_offline_events(offline_events_file)
-    for evt in offline_events:
-        evt["path"] = filesystem.strip_base_dir(evt["path"])
-        if evt["event"] == "MOVE":
-            evt["newPath"] = filesystem.strip_base_dir(evt["newPath"])
-    print("Offline events:")
-    print(offline_events)
-
-    events_to_send = []
-    for evt in offline_events:
-        match evt["event"]:
-            case "PUT":
-                files_not_in_cloud.discard(evt["path"]) # Avoids deleting the file later.
-                events_to_send.append({"event": "PUT", "path": evt["path"]})
-            case "MOVE":
-                # TODO: test multiple moves of the same file while offline.
-                files_not_in_local.discard(evt["path"]) # Avoids downloading the file later.
-                files_not_in_cloud.discard(evt["newPath"]) # Avoids deleting the file later.
-                events_to_send.append({"event": "MOVE", "path": evt["path"], "newPath": evt["newPath"]})
-            case "DELETE":
-                files_not_in_local.discard(evt["path"]) # Avoids downloading the file later.
-                events_to_send.append({"event": "DELETE", "path": evt["path"]})
-
-    print("Downloading from cloud:")
-    print(files_not_in_local)
-    cloud_client().get_bulk([filesystem.key_to_abs_path(f) for f in files_not_in_local], list(files_not_in_local))
-
-    print("Deleting from local:")
-    print(files_not_in_cloud)
-    for path in files_not_in_cloud:
-        filesystem.silentremove(filesystem.key_to_abs_path(path))
-
-    cloud_client().insert_queue(json.dumps({"events": events_to_send, "sender": os.getenv('USERNAME')}))
-
-    event_announcer().announce(json.dumps(
-        {
-            "events": [
-                {"event": "RESYNC", "fileStructure": filesystem.get_file_structure(f"{base_dir}/albums")},
-                {"event": "LOADING", "loading": False}
-            ],
-            "sender": os.getenv('USERNAME')
-        }
-    ))
-
-    print("Clearing offline events")
-    offline.clear_offline_events(offline_events_file)
-
+    if not resyncer().start():
+        return jsonify({"status": "ok", "message": "Resync already running"})
     return jsonify({"status": "ok"})
 
 def stream_events():
@@ -1,63 +1,27 @@
-from flask import Request, jsonify, send_from_directory
+from flask import Request, jsonify, send_file, send_from_directory
 import os
 import json
 import shutil
 import uuid
 from urllib.parse import unquote, urlparse
+from werkzeug.security import safe_join
 from werkzeug.utils import secure_filename
 
+from app.album_index import album_index
+from app.blob_store import blob_store
 from app.config.config import config
-from app.utils import utils, offline, filesystem, aws
+from app.connectivity import connectivity_monitor
+from app.ingest import ingest_queue
+from app.thumbnails import thumbnail_cache
+from app.utils import utils, offline, filesystem
 from app.cloud_clients.cloud_client import cloud_client
 
 
-class SavedFile:
-    """Represents a file that has been saved to disk."""
-    def __init__(self, guid: str, file_path: str):
-        self.guid = guid
-        self.file_path = file_path
-
-    def get_file_path(self) -> str:
-        """Get the full file path."""
-        return self.file_path
-
-    def get_guid(self) -> str:
-        """Get the file GUID."""
-        return self.guid
-
-    def get_stripped_path(self) -> str:
-        """Get the file path with base directory stripped."""
-        return filesystem.strip_base_dir(self.file_path)
-
-    def is_jpg(self) -> bool:
-        """Check if the file is a JPG/JPEG."""
-        return utils.get_file_extension(self.file_path) in {'jpg', 'jpeg'}
-
-
-class HeifFile:
-    """Represents a HEIF/HEIC file that needs to be converted to JPG."""
-    def __init__(self, guid: str, album_path: str, image_name: str):
-        self.guid = guid
-        self.album_path = album_path
-        # Format: <name>.<ext>
-        self.image_name = image_name
-
-    def get_guid(self) -> str:
-        """Get the file GUID."""
-        return self.guid
-
-    def get_heif_path(self, tmp_storage_dir: str) -> str:
-        """Get the full path to the temporary HEIF file."""
-        return f"{tmp_storage_dir}/{self.image_name}"
-
-    def get_jpg_path(self, base_dir: str) -> str:
-        """Get the full path where the converted JPG should be saved."""
-        jpg_name = self.image_name.rsplit('.', 1)[0] + '.jpg'
-        return f"{base_dir}/albums/{self.album_path}/{jpg_name}"
-
 def upload_images(request: Request):
-    saved_files: list[SavedFile] = []
-    heif_files: list[HeifFile] = []
+    """
+    Saves the images to a staging directory and queues them for processing. Returns before the images are processed,
+    the progress of the upload is announced with `UPLOAD` events. See `IngestQueue`.
+    """
     failed_files: list[str] = [] # List[guid]
     file_ids: dict[str, str] = {} # Dict[filename: guid]
 
@@ -69,10 +33,12 @@ def upload_images(request: Request):
     except json.JSONDecodeError:
         return jsonify({"status": "error", "message": "Invalid metadata provided"}), 400
 
-    base_dir = config()['paths']['base_dir'].as_str()
-    tmp_storage_dir = config()['paths']['tmp_storage_dir'].as_str()
     allowed_file_extensions = config()['files']['allowed_file_extensions'].as_set().as_strs()
 
+    job_id = ingest_queue().new_job()
+    staging_dir = ingest_queue().get_staging_dir(job_id)
+    staged_files: list[dict[str, str]] = []
+
     album_paths = request.files.keys()
     # Sanatize file paths
     album_paths = [utils.secure_path(album_path) for album_path in album_paths]
@@ -89,51 +55,21 @@ def upload_images(request: Request):
                 failed_files.append(guid)
                 continue
 
-            if file_extension in {'heif', 'heic'}:
-                heif_files.append(HeifFile(guid, album_path, image_name))
-                image.save(f"{tmp_storage_dir}/{image_name}")
-            else:
-                loc = utils.save_image_to_disk(f'{base_dir}/albums/{album_path}', image_name, image, True)
-                saved_files.append(SavedFile(guid, loc))
-
-    # Parallelize the conversion of HEIF files to JPG.
-    if len(heif_files) > 0:
-        jpg_paths = [heif_file.get_jpg_path(base_dir) for heif_file in heif_files]
-        heif_paths = [heif_file.get_heif_path(tmp_storage_dir) for heif_file in heif_files]
-        exit_codes = utils.heifs_to_jpgs(heif_paths, jpg_paths, 80, True)
-        for i, code in enumerate(exit_codes):
-            if code == 0:
-                saved_files.append(SavedFile(heif_files[i].get_guid(), jpg_paths[i]))
-            else:
-                failed_files.append(heif_files[i].get_guid())
-
-    # Parallelize the rotation of JPG files.
-    jpg_paths = [sf.get_file_path() for sf in saved_files if sf.is_jpg()]
-    if len(jpg_paths) > 0:
-        utils.rotate_jpgs(jpg_paths)
-
-    if not aws.ping(config()['url']['s3_ping_url'].as_str()):
-        offline_events = [offline.create_offline_event('PUT', sf.get_file_path()) for sf in saved_files]
-        offline_events_file = config()['paths']['offline_events_file'].as_str()
-        offline.save_offline_events(offline_events_file, offline_events)
-    elif len(saved_files) > 0:
-        # Bulk upload to cloud
-        success, failure = cloud_client().insert_bulk(
-            [sf.get_file_path() for sf in saved_files],
-            [sf.get_stripped_path() for sf in saved_files]
-        )
-        failed_files = failed_files + [sf.get_guid() for sf in saved_files if sf.get_stripped_path() in failure]
-
-        # Push events to queue
-        message = json.dumps({"events": [{"event": "PUT", "path": sf} for sf in success], "sender": os.getenv('USERNAME')})
-        cloud_client().insert_queue(message)
+            image.save(f"{staging_dir}/{image_name}")
+            staged_files.append({"guid": guid, "albumPath": album_path, "imageName": image_name})
+
+    if len(staged_files) > 0:
+        ingest_queue().submit(job_id, staged_files)
+    else:
+        shutil.rmtree(staging_dir, ignore_errors=True)
 
-    # failed: the guids of the files that failed to upload.
-    # success: the paths of the files that were successfully uploaded.
-    # return jsonify({"status": "ok", "failed": failed_files, "success": success})
-    if failed_files:
-        print(f'failed to upload: {failed_files}')
-    return jsonify({"status": "ok", "failed": [], "success": [sf.get_stripped_path() for sf in saved_files]})
+    # failed: the guids of the files that were rejected. Files that fail during processing are announced.
+    return jsonify({
+        "status": "ok",
+        "jobId": job_id if len(staged_files) > 0 else None,
+        "queued": [f["guid"] for f in staged_files],
+        "failed": failed_files
+    })
 
 def delete_images(request: Request):
     req_json: dict | None = request.json
@@ -144,15 +80,16 @@ def delete_images(request: Request):
         return jsonify({"status": "ok", "failed": []})
 
     base_dir = config()['paths']['base_dir'].as_str()
-    s3_ping_url = config()['url']['s3_ping_url'].as_str()
     offline_events_file = config()['paths']['offline_events_file'].as_str()
 
     for f in files:
         f = utils.secure_path(f)
+        thumbnail_cache().invalidate(filesystem.key_to_abs_path(f))
         filesystem.silentremove(filesystem.key_to_abs_path(f))
+        album_index().remove(f)
         filesystem.remove_dirs(f'{base_dir}/albums', filesystem.remove_albums_prefix(os.path.dirname(f)))
 
-    if not aws.ping(s3_ping_url):
+    if not connectivity_monitor().is_online("s3"):
         offline_events = [offline.create_offline_event('DELETE', sf) for sf in files]
         offline.save_offline_events(offline_events_file, offline_events)
     elif len(files) > 0:
@@ -173,10 +110,9 @@ def move_images(request: Request):
         return jsonify({"status": "ok", "failed": []})
 
     base_dir = config()['paths']['base_dir'].as_str()
-    s3_ping_url = config()['url']['s3_ping_url'].as_str()
     offline_events_file = config()['paths']['offline_events_file'].as_str()
 
-    files_to_move = []
+    owned_files = []
     for file in files:
         file['oldPath'] = utils.secure_path(file['oldPath'])
         file['newPath'] = utils.secure_path(file['newPath'])
@@ -185,14 +121,23 @@ def move_images(request: Request):
             continue
         if filesystem.key_to_abs_path(file['oldPath']) == filesystem.key_to_abs_path(file['newPath']):
             continue
-
-        new_path = filesystem.key_to_abs_path(file['newPath'])
-        os.makedirs(os.path.dirname(new_path), exist_ok=True)
-        os.rename(filesystem.key_to_abs_path(file['oldPath']), new_path)
+        thumbnail_cache().forget(filesystem.key_to_abs_path(file['oldPath']))
+        owned_files.append(file)
+
+    # Renamed, unless the destination is on another filesystem.
+    _, not_moved = filesystem.move_files([
+        (filesystem.key_to_abs_path(f['oldPath']), filesystem.key_to_abs_path(f['newPath'])) for f in owned_files
+    ])
+    not_moved = set(not_moved)
+    files_to_move = []
+    for file in owned_files:
+        if filesystem.key_to_abs_path(file['newPath']) in not_moved:
+            continue
+        album_index().move(file['oldPath'], file['newPath'])
         filesystem.remove_dirs(f'{base_dir}/albums', filesystem.remove_albums_prefix(os.path.dirname(file['oldPath'])))
         files_to_move.append(file)
 
-    if not aws.ping(s3_ping_url):
+    if not connectivity_monitor().is_online("s3"):
         offline_events = [offline.create_offline_event('MOVE', sf['oldPath'], sf['newPath']) for sf in files_to_move]
         offline.save_offline_events(offline_events_file, offline_events)
     elif len(files_to_move) > 0:
@@ -202,7 +147,8 @@ def move_images(request: Request):
         cloud_client().insert_queue(message)
 
     # failed: List[(old_path, new_path)]
-    return jsonify({"status": "ok", "failed": []})
+    failed = [(f['oldPath'], f['newPath']) for f in owned_files if filesystem.key_to_abs_path(f['newPath']) in not_moved]
+    return jsonify({"status": "ok", "failed": failed})
 
 def copy_images(request: Request):
     req_json: dict | None = request.json
@@ -212,10 +158,9 @@ def copy_images(request: Request):
     if not files:
         return jsonify({"status": "ok", "failed": []})
 
-    s3_ping_url = config()['url']['s3_ping_url'].as_str()
     offline_events_file = config()['paths']['offline_events_file'].as_str()
 
-    files_to_copy = []
+    owned_files = []
     for file in files:
         file['oldPath'] = utils.secure_path(file['oldPath'])
         file['newPath'] = utils.secure_path(file['newPath'])
@@ -224,22 +169,75 @@ def copy_images(request: Request):
             continue
         if filesystem.key_to_abs_path(file['oldPath']) == filesystem.key_to_abs_path(file['newPath']):
             continue
+        owned_files.append(file)
 
-        new_path = filesystem.key_to_abs_path(file['newPath'])
-        os.makedirs(os.path.dirname(new_path), exist_ok=True)
-        shutil.copyfile(filesystem.key_to_abs_path(file['oldPath']), new_path)
+    # The copies are reflinks or links to the same blob as the originals, so the images aren't stored twice.
+    digests, not_copied_locally = blob_store().copy([
+        (filesystem.key_to_abs_path(f['oldPath']), filesystem.key_to_abs_path(f['newPath'])) for f in owned_files
+    ])
+    files_to_copy = []
+    for file in owned_files:
+        digest = digests.get(filesystem.key_to_abs_path(file['newPath']))
+        if digest is None:
+            continue
+        file['digest'] = digest
+        album_index().add(file['newPath'])
         files_to_copy.append(file)
 
-    if not aws.ping(s3_ping_url):
+    if not connectivity_monitor().is_online("s3"):
         offline_events = [offline.create_offline_event('PUT', sf['newPath']) for sf in files_to_copy]
         offline.save_offline_events(offline_events_file, offline_events)
     elif len(files_to_copy) > 0:
-        image_keys = [f['newPath'] for f in files_to_copy]
-        success, failure = cloud_client().insert_bulk([filesystem.key_to_abs_path(k) for k in image_keys], image_keys)
+        # Copied in the cloud, so the images aren't uploaded again.
+        copied, not_copied = cloud_client().copy_bulk([(f['oldPath'], f['newPath']) for f in files_to_copy])
+        success = [dest_key for _, dest_key in copied]
+        if not_copied:
+            # E.g. the source wasn't uploaded yet, upload the local copy instead.
+            digests = {f['newPath']: f['digest'] for f in files_to_copy}
+            image_keys = [dest_key for _, dest_key in not_copied]
+            uploaded, _ = cloud_client().insert_bulk(
+                [filesystem.key_to_abs_path(k) for k in image_keys],
+                image_keys,
+                digests=[digests[k] for k in image_keys]
+            )
+            success.extend(uploaded)
         message = json.dumps({"events": [{"event": "PUT", "path": s} for s in success], "sender": os.getenv('USERNAME')})
         cloud_client().insert_queue(message)
 
-    return jsonify({"status": "ok", "failed": []})
+    not_copied_locally = set(not_copied_locally)
+    failed = [(f['oldPath'], f['newPath']) for f in owned_files if filesystem.key_to_abs_path(f['newPath']) in not_copied_locally]
+    return jsonify({"status": "ok", "failed": failed})
+
+def list_album(request: Request):
+    """
+    Lists one page of an album's direct children (and optionally nested sub-albums up to `depth`).
+
+    Query params:
+    - path: key of the album to list, e.g. "albums/Shared/a". Defaults to the albums root.
+    - cursor: the cursor returned with the previous page.
+    - limit: the max number of items in the page.
+    - depth: the number of levels of sub-albums to include.
+    """
+    album_path = utils.secure_path(unquote(request.args.get('path', 'albums')))
+    cursor = request.args.get('cursor', '')
+    try:
+        limit = utils.clamp(int(request.args.get('limit', 200)), 1, 1000)
+        depth = utils.clamp(int(request.args.get('depth', 0)), 0, 10)
+    except ValueError:
+        return jsonify({"status": "error", "message": "Invalid limit or depth"}), 400
+
+    try:
+        items, next_cursor = album_index().list_album(album_path, cursor, limit, depth)
+    except KeyError:
+        return jsonify({"status": "error", "message": "Album not found"}), 404
+
+    return jsonify({"status": "ok", "path": album_path, "items": items, "cursor": next_cursor})
+
+def list_album_paths():
+    """
+    Lists the paths of all the albums, nested ones included, for the album pickers.
+    """
+    return jsonify({"status": "ok", "albumPaths": album_index().list_album_paths()})
 
 def preview(request: Request):
     image_path = request.args.get('image')
@@ -256,6 +254,19 @@ def preview(request: Request):
         return jsonify({"status": "error", "message": "Image not found"}), 404
 
     base_dir = config()['paths']['base_dir'].as_str()
+
+    # Serve a scaled down copy of the image if a size is requested, falling back to the original image.
+    size = request.args.get('size')
+    if size:
+        if size not in thumbnail_cache().sizes:
+            return jsonify({"status": "error", "message": "Invalid size"}), 400
+        abs_path = safe_join(base_dir, image_path)
+        if abs_path is None:
+            return jsonify({"status": "error", "message": "Invalid image path"}), 400
+        thumbnail_path = thumbnail_cache().get(abs_path, size)
+        if thumbnail_path:
+            return send_file(thumbnail_path, mimetype='image/jpeg')
+
     return send_from_directory(base_dir, image_path)
 
 def rotate_image(request: Request):
@@ -289,17 +300,18 @@ def rotate_image(request: Request):
     new_image_path = f'{album_path}/{new_filename}'
     new_abs_path = filesystem.key_to_abs_path(new_image_path)
 
-    shutil.copy(abs_path, new_abs_path)
+    # Not a hardlink, the copy is rotated in place.
+    filesystem.copy_file(abs_path, new_abs_path, hardlink=False)
     exit_code = utils.rotate_jpg_by_degree(new_abs_path, rotation)
 
     if exit_code != 0:
         filesystem.silentremove(new_abs_path)
         return jsonify({"status": "error", "message": "Failed to rotate image"}), 500
+    album_index().add(new_image_path)
 
-    s3_ping_url = config()['url']['s3_ping_url'].as_str()
     offline_events_file = config()['paths']['offline_events_file'].as_str()
 
-    if not aws.ping(s3_ping_url):
+    if not connectivity_monitor().is_online("s3"):
         offline_events = [offline.create_offline_event('MOVE', abs_path, new_abs_path)]
         offline.save_offline_events(offline_events_file, offline_events)
     else:
@@ -308,6 +320,7 @@ def rotate_image(request: Request):
         if failure:
             print(f"Failed to upload rotated image to cloud: {failure}")
             filesystem.silentremove(new_abs_path)
+            album_index().remove(new_image_path)
             return jsonify({"status": "error", "message": "Failed to upload rotated image to cloud"}), 500
         message = json.dumps({
             "events": [{"event": "MOVE", "path": image_path, "newPath": new_image_path}],
@@ -315,5 +328,7 @@ def rotate_image(request: Request):
         })
         cloud_client().insert_queue(message)
 
+    thumbnail_cache().invalidate(abs_path)
     filesystem.silentremove(abs_path)
+    album_index().remove(image_path)
     return jsonify({"status": "ok", "newPath": new_image_path})
\ No newline at end of file
@@ -1,7 +1,9 @@
 from flask import jsonify, Request
-import time
+import random
 
 from app import slideshow
+from app.playlist import playlist
+from app.render_cache import render_cache
 from app.utils import utils
 from app.config.config import config
 
@@ -33,17 +35,26 @@ def save_settings(request: Request):
     }
 
     slideshow.save_settings_to_file(cleaned_settings)
-    slideshow.stop_slideshow()
 
     base_dir = config()['paths']['base_dir'].as_str()
     album_path = f"{base_dir}/albums/{cleaned_settings['album']}"
     if (cleaned_settings["randomize"] != prev_settings["randomize"]
         or cleaned_settings["album"] != prev_settings["album"]):
         # Must be set to recursive b/c inotifywait is setup to watch recursively.
-        slideshow.set_image_order(album_path, cleaned_settings["randomize"], True)
+        slideshow.set_image_order(
+            album_path, cleaned_settings["randomize"], True, playlist(), slideshow.album_images(album_path),
+            rendition=render_cache().rendition
+        )
+    # Applied to the running slideshow, without restarting it.
     if cleaned_settings["isEnabled"]:
-        time.sleep(1)
-        slideshow.start_slideshow(album_path, cleaned_settings["blend"], cleaned_settings["speed"])
+        slideshow.start_slideshow(
+            album_path,
+            cleaned_settings["blend"],
+            cleaned_settings["speed"],
+            advance=cleaned_settings["album"] != prev_settings["album"]
+        )
+    else:
+        slideshow.stop_slideshow()
 
     return jsonify({"status": "ok"})
 
@@ -53,9 +64,10 @@ def shuffle():
         base_dir = config()['paths']['base_dir'].as_str()
         album_path = f"{base_dir}/albums/{settings['album']}"
         # Must be set to recursive b/c inotifywait is setup to watch recursively.
-        slideshow.set_image_order(album_path, True, True)
+        slideshow.set_image_order(
+            album_path, True, True, playlist(), slideshow.album_images(album_path), random.getrandbits(32),
+            render_cache().rendition
+        )
         if settings["isEnabled"]:
-            slideshow.stop_slideshow()
-            time.sleep(1)
-            slideshow.start_slideshow(album_path, settings["blend"], settings["speed"])
+            slideshow.start_slideshow(album_path, settings["blend"], settings["speed"], advance=True)
     return jsonify({"status": "ok"})
\ No newline at end of file
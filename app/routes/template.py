@@ -2,8 +2,8 @@ from flask import render_template
 import os
 
 from app import slideshow
+from app.album_index import album_index
 from app.utils import filesystem, utils
-from app.config.config import config
 
 def index():
     settings = slideshow.load_settings()
@@ -11,9 +11,12 @@ def index():
     if not username:
         raise ValueError("Environment variable 'USERNAME' must be set.")
     default_file_structure = filesystem.get_default_file_structure(username)
-    base_dir = config()['paths']['base_dir'].as_str()
-    file_structure = filesystem.get_file_structure(f"{base_dir}/albums")
+    # Only the top level albums are rendered into the page, the rest is fetched from /list-album by the client.
+    top_level_albums, _ = album_index().list_album("albums", limit=1000)
+    file_structure = {"albums": top_level_albums}
 
     # Ensure that the default file structure is always present at a minimum.
     file_structure = utils.partial_dict_merge(file_structure, default_file_structure)
-    return render_template('index.html', settings=settings, fileStructure=file_structure)
\ No newline at end of file
+    # The album pickers list the nested albums too, which aren't in the file structure yet.
+    album_paths = sorted(set(album_index().list_album_paths()) | set(default_file_structure["albums"]))
+    return render_template('index.html', settings=settings, fileStructure=file_structure, albumPaths=album_paths)
\ No newline at end of file
@@ -0,0 +1,127 @@
+import collections
+import os
+import threading
+import time
+
+class SeenEventStore:
+    """
+    Persistent set of the ids of the events received from the queue and already applied, so that a message
+    the queue delivers again doesn't apply (and download) the same events again.
+
+    An id is kept for `horizon` seconds (the queue retention period, after which the message can't be delivered again),
+    and at most `max_entries` ids are kept, forgetting the oldest first.
+
+    The ids are appended to `store_file`, one `<unix time seen>,<id>` line per event. The file is rewritten without
+    the forgotten ids once it holds twice as many lines as ids (and over 2000 lines).
+    """
+    def __init__(self, store_file: str, horizon: int, max_entries: int = 100_000):
+        self.store_file = store_file
+        self.horizon = horizon
+        self.max_entries = max_entries
+
+        self.lock = threading.Lock()
+        # id -> unix time seen. Oldest first.
+        self.entries: collections.OrderedDict[str, float] = collections.OrderedDict()
+        self.lines = 0
+
+    def load(self):
+        entries = collections.OrderedDict()
+        lines = 0
+        try:
+            with open(self.store_file, 'r') as f:
+                for line in f:
+                    lines += 1
+                    seen_at, _, event_id = line.strip().partition(',')
+                    if not event_id:
+                        continue # Torn write.
+                    try:
+                        entries[event_id] = float(seen_at)
+                    except ValueError:
+                        continue # Torn write.
+                    entries.move_to_end(event_id)
+        except FileNotFoundError:
+            pass
+
+        with self.lock:
+            self.entries = entries
+            self.lines = lines
+            self._evict()
+
+    def is_seen(self, event_id: str) -> bool:
+        with self.lock:
+            seen_at = self.entries.get(event_id)
+        return seen_at is not None and seen_at >= time.time() - self.horizon
+
+    def filter_unseen(self, events: list[dict]) -> list[dict]:
+        """
+        Returns the events that weren't seen yet, once each. Events without an id are always returned.
+        """
+        unseen = []
+        ids = set()
+        for event in events:
+            event_id = event.get("id")
+            if event_id is not None and (event_id in ids or self.is_seen(event_id)):
+                continue
+            if event_id is not None:
+                ids.add(event_id)
+            unseen.append(event)
+        return unseen
+
+    def add(self, event_ids: list[str]):
+        """
+        Marks the events as seen.
+        """
+        if not event_ids:
+            return
+        now = time.time()
+        with self.lock:
+            for event_id in event_ids:
+                self.entries[event_id] = now
+                self.entries.move_to_end(event_id)
+            os.makedirs(os.path.dirname(self.store_file), exist_ok=True)
+            with open(self.store_file, 'a') as f:
+                f.writelines(f"{now},{event_id}\n" for event_id in event_ids)
+                f.flush()
+                os.fsync(f.fileno())
+            self.lines += len(event_ids)
+            self._evict()
+
+    def _evict(self):
+        """
+        Forgets the ids past the horizon, and the oldest ids past `max_entries`. Must hold the lock.
+        """
+        cutoff = time.time() - self.horizon
+        while self.entries:
+            event_id, seen_at = next(iter(self.entries.items()))
+            if seen_at >= cutoff and len(self.entries) <= self.max_entries:
+                break
+            del self.entries[event_id]
+        if self.lines > 2 * max(len(self.entries), 1000):
+            self._rewrite()
+
+    def _rewrite(self):
+        """
+        Atomically rewrites the store file with the current ids. Must hold the lock.
+        """
+        os.makedirs(os.path.dirname(self.store_file), exist_ok=True)
+        tmp_file = f'{self.store_file}.tmp'
+        with open(tmp_file, 'w') as f:
+            f.writelines(f"{seen_at},{event_id}\n" for event_id, seen_at in self.entries.items())
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_file, self.store_file)
+        self.lines = len(self.entries)
+
+_SEEN_EVENTS = None
+
+def init_seen_events(store_file: str, horizon: int, max_entries: int):
+    global _SEEN_EVENTS
+    if _SEEN_EVENTS is not None:
+        return # Already initialized
+    _SEEN_EVENTS = SeenEventStore(store_file, horizon, max_entries)
+    _SEEN_EVENTS.load()
+
+def seen_events():
+    if _SEEN_EVENTS is None:
+        raise RuntimeError("Seen event store not initialized. Run init_seen_events() first.")
+    return _SEEN_EVENTS
@@ -1,12 +1,25 @@
+import json
 import os
+import threading
 from flask import Flask, request, jsonify
+from werkzeug.serving import make_server
 
 from app import slideshow
-from app.announcer import init_event_announcer
+from app.album_index import init_album_index, album_index
+from app.announcer import init_event_announcer, event_announcer
+from app.blob_store import init_blob_store, blob_store
+from app.connectivity import init_connectivity_monitor, connectivity_monitor
+from app.ingest import init_ingest_queue, ingest_queue
+from app.playlist import init_playlist, playlist
+from app.render_cache import framebuffer_resolution, init_render_cache, render_cache
+from app.seen_events import init_seen_events
+from app.slideshow_controller.client import init_slideshow_client
+from app.sync import init_resyncer, resyncer
+from app.thumbnails import init_thumbnail_cache, thumbnail_cache
 from app.cloud_clients.cloud_client import init_cloud_client
 from app.cloud_clients.aws_client import new_aws_client
 from app.config.config import config, load_config
-from app.utils import utils
+from app.utils import utils, offline
 from app.routes import \
     slideshow as slideshow_routes, \
     filesystem as filesystem_routes, \
@@ -19,6 +32,44 @@ utils.load_env([".env", os.path.abspath(os.path.expandvars('$HOME/.config/pi-pho
 load_config()
 init_cloud_client(new_aws_client())
 init_event_announcer()
+init_connectivity_monitor(
+    {"s3": config()['url']['s3_ping_url'].as_str(), "sqs": config()['url']['sqs_ping_url'].as_str()},
+    config()['connectivity']['ttl'].as_int(),
+    config()['connectivity']['max_backoff'].as_int()
+)
+init_album_index(f"{config()['paths']['base_dir'].as_str()}/albums")
+init_playlist(config()['paths']['playlist_file'].as_str())
+init_slideshow_client(config()['paths']['slideshow_socket'].as_str())
+album_index().subscribe(playlist().on_album_change)
+init_thumbnail_cache(
+    config()['paths']['thumbnail_cache_dir'].as_str(),
+    {name: int(size) for name, size in config()['thumbnails']['sizes']},
+    config()['thumbnails']['max_cache_size'].as_int(),
+    config()['thumbnails']['quality'].as_int()
+)
+init_render_cache(
+    config()['paths']['render_cache_dir'].as_str(),
+    framebuffer_resolution(config()['renders']['resolution'].as_str()),
+    config()['renders']['max_cache_size'].as_int(),
+    config()['renders']['quality'].as_int(),
+    config()['renders']['max_workers'].as_int()
+)
+# The thumbnails and renditions of a content are kept as long as an album entry links to its blob.
+init_blob_store(
+    config()['paths']['blobs_dir'].as_str(),
+    thumbnail_cache().content_digest,
+    lambda digest: (thumbnail_cache().invalidate_digest(digest), render_cache().invalidate_digest(digest))
+)
+init_ingest_queue(
+    config()['paths']['ingest_jobs_dir'].as_str(),
+    f"{config()['paths']['tmp_storage_dir'].as_str()}/ingest"
+)
+init_resyncer(config()['paths']['sync_manifest_file'].as_str(), config()['paths']['resync_checkpoint_file'].as_str())
+init_seen_events(
+    config()['paths']['seen_events_file'].as_str(),
+    config()['queue']['retention_days'].as_int() * 24 * 60 * 60,
+    config()['queue']['max_seen_events'].as_int()
+)
 
 app.config['MAX_CONTENT_LENGTH'] = config()['files']['max_content_length'].as_int()
 
@@ -79,6 +130,14 @@ def stream_events():
 def resync():
     return event_routes.resync()
 
+@app.route('/list-album', methods=['GET'])
+def list_album():
+    return filesystem_routes.list_album(request)
+
+@app.route('/list-album-paths', methods=['GET'])
+def list_album_paths():
+    return filesystem_routes.list_album_paths()
+
 @app.route('/preview', methods=['GET'])
 def preview():
     return filesystem_routes.preview(request)
@@ -92,6 +151,12 @@ def rotate_image():
 def health():
     return jsonify({"status": "ok"})
 
+def announce_connectivity(service: str, online: bool):
+    event_announcer().announce(json.dumps({
+        "events": [{"event": "CONNECTIVITY", "service": service, "online": online}],
+        "sender": os.getenv('USERNAME')
+    }))
+
 if __name__ == '__main__':
     base_dir = config()['paths']['base_dir'].as_str()
     tmp_storage_dir = config()['paths']['tmp_storage_dir'].as_str()
@@ -101,6 +166,11 @@ if __name__ == '__main__':
     os.makedirs(f"{base_dir}/albums", exist_ok=True)
     os.makedirs(tmp_storage_dir, exist_ok=True)
 
+    # Catches up with the changes made while the app wasn't running.
+    if playlist().album:
+        playlist().sync(slideshow.album_images(playlist().album))
+        playlist().save()
+
     # Starts slideshow on startup if it's enabled in the settings.
     settings = slideshow.load_settings()
     if settings["isEnabled"]:
@@ -109,4 +179,23 @@ if __name__ == '__main__':
 
     # Disable debug mode and reloader in production
     debug_mode = os.getenv('FLASK_DEBUG', 'false').lower() == 'true'
+
+    # With the reloader, only start the workers in the child process that serves the requests.
+    if not debug_mode or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        connectivity_monitor().subscribe(announce_connectivity)
+        connectivity_monitor().start()
+
+        # Serves the API to the event consumer over a Unix socket too, if it's configured.
+        api_socket = config()['url']['api_socket'].as_str()
+        if api_socket:
+            socket_server = make_server(f"unix://{api_socket}", 0, app, threaded=True)
+            threading.Thread(target=socket_server.serve_forever, name="api-socket", daemon=True).start()
+        ingest_queue().start()
+        blob_store().start_garbage_collection(config()['blobs']['gc_interval'].as_int())
+        resyncer().resume()
+        offline.start_offline_events_compaction(
+            config()['paths']['offline_events_file'].as_str(),
+            config()['offline']['compaction_interval'].as_int()
+        )
+
     app.run(debug=debug_mode, host='0.0.0.0', use_reloader=debug_mode, port=int(os.getenv('API_PORT', 5555)))
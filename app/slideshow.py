@@ -1,36 +1,71 @@
 import os
 import json
-import random
-import subprocess
+import threading
+from typing import Callable
 
+from app.album_index import album_index
 from app.config.config import config
+from app.playlist import Playlist, playlist
+from app.playlist_daemon import PlaylistDaemon
+from app.render_cache import render_cache
+from app.slideshow_controller.client import slideshow_client
+from app.utils import filesystem
 
-slideshow_proc: subprocess.Popen | None = None
+playlist_daemon: PlaylistDaemon | None = None
+slideshow_lock = threading.Lock()
 
-def start_slideshow(album: str, blend: int, speed: int):
+def start_slideshow(album: str, blend: int, speed: int, advance: bool = False):
     """
-    Start the slideshow with the given settings.
+    Start the slideshow with the given settings, or apply them to the running slideshow without interrupting it.
+    The slideshow controller reloads the playlist whenever the playlist daemon applies changes to the album.
+    The images not rendered at the resolution of the display yet are rendered in the background, and played once
+    the playlist is next written.
 
     album: str - The path to the album to display.
     blend: int - The blend time between images in milliseconds.
     speed: int - The time each image is displayed in seconds.
+    advance: bool - Show the first image of the playlist right away, e.g. after the album changed or was shuffled.
     """
-    global slideshow_proc
+    global playlist_daemon
+
+    if not os.path.isdir(album):
+        print(f"Album directory does not exist: {album}")
+        return
 
     active_slideshow = config()['paths']['active_slideshow_file'].as_str()
-    script_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "display_slideshow.sh")
-    cmd = [script_path, album, str(speed), str(blend), active_slideshow]
-    slideshow_proc = subprocess.Popen(cmd)
+    if playlist().album != album.rstrip('/'):
+        # E.g. on a fresh install without a saved playlist, where the daemon would only add the images changed later.
+        # Must be recursive b/c inotifywait is setup to watch recursively.
+        playlist().set_album(album, True, album_images(album))
+        playlist().save()
+    # Plays the renditions cached since the playlist was last written.
+    playlist().write(active_slideshow, render_cache().rendition)
+
+    with slideshow_lock:
+        if playlist_daemon is None or playlist_daemon.album != album.rstrip('/'):
+            if playlist_daemon is not None:
+                playlist_daemon.stop()
+            playlist_daemon = PlaylistDaemon(
+                album,
+                playlist(),
+                active_slideshow,
+                lambda: slideshow_client().send("load", playlist=active_slideshow),
+                config()['slideshow']['batch_delay'].as_int(),
+                config()['slideshow']['max_batch_delay'].as_int(),
+                render_cache().rendition
+            )
+            playlist_daemon.start()
+            render_cache().generate_async(playlist().images())
+    slideshow_client().send("play", playlist=active_slideshow, speed=speed, blend=blend, advance=advance)
 
 def stop_slideshow():
-    global slideshow_proc
+    global playlist_daemon
 
-    if slideshow_proc is not None:
-        # Killing the script doesn't seem to trigger the cleanup in the script, so we need to kill fbi explicitly.
-        os.system(f"pkill -15 -f display_slideshow.sh")
-        os.system(f"pkill -15 -f fbi")
-        slideshow_proc.terminate()
-        slideshow_proc.wait()
+    with slideshow_lock:
+        if playlist_daemon is not None:
+            playlist_daemon.stop()
+            playlist_daemon = None
+    slideshow_client().send("stop")
 
 def load_settings():
     settings_file = config()['paths']['settings_file'].as_str()
@@ -55,18 +90,40 @@ def save_settings_to_file(settings):
     with open(settings_file, 'w') as f:
         json.dump(settings, f)
 
-def set_image_order(album: str, randomize:bool, recursive: bool):
-    file_names: list[str] = []
-    
-    for root, dirs, files in os.walk(album):
-        # sorts by increasing modification time
-        file_names.extend(sorted([os.path.join(root, file) for file in files], key=os.path.getmtime))
-        if not recursive:
-            break
+def set_image_order(
+    album: str,
+    randomize: bool,
+    recursive: bool,
+    order: Playlist | None = None,
+    image_paths: list[str] | None = None,
+    seed: int | None = None,
+    rendition: Callable[[str], str] | None = None
+):
+    """
+    Orders the images of the album (see `Playlist`) and writes the order to the active slideshow file.
+
+    order: Playlist | None - The playlist to reorder, e.g. the app's playlist. It isn't rebuilt if it already plays
+        the album, since it's kept up to date incrementally.
+    image_paths: list[str] | None - The images of the album, e.g. from the album index. Lists the album on disk if not given.
+    seed: int | None - The seed of the shuffle. Shuffles with the global RNG if not given.
+    rendition: Callable[[str], str] | None - Maps an image to the file played, e.g. `RenderCache.rendition`.
+    """
+    if order is None:
+        order = Playlist()
+    if order.album != album.rstrip('/') or order.recursive != recursive:
+        order.set_album(album, recursive, image_paths)
+    elif order.shuffled and not randomize:
+        # Back to the album order, from the cached mtimes.
+        order.set_album(album, recursive, order.images())
 
     if randomize:
-        random.shuffle(file_names)
+        order.shuffle(seed)
+
+    order.write(config()['paths']['active_slideshow_file'].as_str(), rendition)
+    order.save()
 
-    active_slideshow_file = config()['paths']['active_slideshow_file'].as_str()
-    with open(active_slideshow_file, 'w') as f:
-        f.write('\n'.join(file_names))
\ No newline at end of file
+def album_images(album: str) -> list[str]:
+    """
+    Lists the abs paths of the images of an album and its sub-albums, from the album index.
+    """
+    return [filesystem.key_to_abs_path(key) for key in album_index().list_files(filesystem.strip_base_dir(album))]
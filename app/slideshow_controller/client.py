@@ -0,0 +1,77 @@
+import json
+import socket
+import threading
+
+class SlideshowClient:
+    """
+    Client of the slideshow controller, used by the API. See `SlideshowController` for the commands.
+
+    Keeps one connection to the controller's Unix domain socket, reconnecting if the controller was restarted.
+    """
+    def __init__(self, socket_path: str, timeout: float = 2):
+        self.socket_path = socket_path
+        self.timeout = timeout
+        self.lock = threading.Lock()
+        self.sock: socket.socket | None = None
+        self.reader = None
+
+    def send(self, command: str, **args) -> dict | None:
+        """
+        Sends a command and returns the response of the controller, or None if it couldn't be reached.
+        """
+        request = json.dumps({"command": command, **args}).encode() + b'\n'
+        with self.lock:
+            # Retries once on a new connection, in case the controller closed the previous one.
+            for attempt in range(2):
+                try:
+                    if self.sock is None:
+                        self._connect()
+                    self.sock.sendall(request)
+                    line = self.reader.readline()
+                    if not line:
+                        raise ConnectionError("Connection closed by the slideshow controller")
+                    response = json.loads(line)
+                    break
+                except (OSError, ValueError) as e:
+                    self._close()
+                    if attempt == 1:
+                        print(f"Error sending {command} to the slideshow controller: {e}")
+                        return None
+        if response.get("status") != "ok":
+            print(f"Slideshow controller failed to {command}: {response.get('message')}")
+        return response
+
+    def close(self):
+        with self.lock:
+            self._close()
+
+    def _connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        try:
+            sock.connect(self.socket_path)
+        except OSError:
+            sock.close()
+            raise
+        self.sock = sock
+        self.reader = sock.makefile('rb')
+
+    def _close(self):
+        if self.sock is not None:
+            self.reader.close()
+            self.sock.close()
+            self.sock = None
+            self.reader = None
+
+_SLIDESHOW_CLIENT = None
+
+def init_slideshow_client(socket_path: str):
+    global _SLIDESHOW_CLIENT
+    if _SLIDESHOW_CLIENT is not None:
+        return # Already initialized
+    _SLIDESHOW_CLIENT = SlideshowClient(socket_path)
+
+def slideshow_client():
+    if _SLIDESHOW_CLIENT is None:
+        raise RuntimeError("Slideshow client not initialized. Run init_slideshow_client() first.")
+    return _SLIDESHOW_CLIENT
@@ -0,0 +1,300 @@
+import collections
+import json
+import os
+import socketserver
+import threading
+import time
+
+from app.slideshow_controller.framebuffer import Framebuffer
+from app.slideshow_controller.prefetcher import Prefetcher
+
+class SlideshowController:
+    """
+    Owns the display loop of the slideshow, so the playlist and the settings change without restarting anything.
+
+    The images of the playlist are shown in order, each for `speed` seconds, cross-fading over `blend` ms.
+    While an image is shown, the next `decode_ahead` images are decoded and the frames of the cross-fade to the next
+    one are computed in the background, and the next `prefetch_depth` images are read ahead into the page cache
+    (see `Prefetcher`). A change that can't wait for them (e.g. a skip) cuts to the next image instead.
+
+    Commands, see `handle()`:
+    - `{"command": "play", "playlist": str, "speed": int, "blend": int, "advance": bool}`
+    - `{"command": "load", "playlist": str, "advance": bool}`: swaps the playlist file. The current image stays on
+      screen and the slideshow goes on from it if it's in the new playlist, unless `advance` is set, which shows
+      the first image of the playlist right away.
+    - `{"command": "settings", "speed": int, "blend": int}`
+    - `{"command": "skip", "count": int}`: negative to go back.
+    - `{"command": "pause"}`, `{"command": "resume"}`
+    - `{"command": "stop"}`: blanks the screen.
+    - `{"command": "status"}`
+    """
+    def __init__(self, framebuffer: Framebuffer, max_blend_frames: int = 8, prefetch_depth: int = 4, decode_ahead: int = 1):
+        self.framebuffer = framebuffer
+        self.max_blend_frames = max_blend_frames
+        self.prefetcher = Prefetcher(prefetch_depth)
+        self.decode_ahead = decode_ahead
+        # The decoded images coming up, the image on screen, and the one before it to go back to.
+        self.decoded_cache_size = decode_ahead + 2
+        # Number of images that were decoded ahead (hits) or not (misses) when they were due.
+        self.decode_hits = 0
+        self.decode_misses = 0
+
+        self.lock = threading.Condition()
+        self.images: list[str] = []
+        # Position of the image on screen, -1 if none.
+        self.position = -1
+        self.speed = 30
+        self.blend = 250
+        self.playing = False
+        self.paused = False
+        # monotonic time the image on screen was shown. 0 to show the next image right away.
+        self.shown_at = 0.0
+        # Incremented when the next image changes, e.g. on a skip, so a decode started before is discarded.
+        self.version = 0
+        # Number of images in a row that couldn't be decoded.
+        self.failures = 0
+        self.stopped = False
+
+        # Only used by the display thread.
+        self.current: tuple[str, bytes] | None = None
+        # image path -> frame, most recently used last.
+        self.decoded: collections.OrderedDict[str, bytes] = collections.OrderedDict()
+        # (from image path, to image path, blend frames)
+        self.transition: tuple[str, str, list[bytes]] | None = None
+        self.thread: threading.Thread | None = None
+
+    def start(self):
+        self.framebuffer.open()
+        self.thread = threading.Thread(target=self._run, name="slideshow-display", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """
+        Stops the display loop and blanks the screen.
+        """
+        with self.lock:
+            self.stopped = True
+            self.lock.notify_all()
+        if self.thread is not None:
+            self.thread.join()
+            self.framebuffer.clear()
+        self.framebuffer.close()
+
+    def handle(self, request: dict) -> dict:
+        """
+        Applies a command. Returns `{"status": "ok", ...status}`, or `{"status": "error", "message": str}`.
+        """
+        try:
+            match request.get("command"):
+                case "play":
+                    with self.lock:
+                        self._settings(request)
+                        self._load(request["playlist"], request.get("advance", False) or not self.playing)
+                        self.playing, self.paused = True, False
+                case "load":
+                    with self.lock:
+                        self._load(request["playlist"], request.get("advance", False))
+                case "settings":
+                    with self.lock:
+                        self._settings(request)
+                case "skip":
+                    with self.lock:
+                        if self.images:
+                            # The image on screen is already counted.
+                            self.position = (self.position + request.get("count", 1) - 1) % len(self.images)
+                            self.shown_at = 0
+                            self.version += 1
+                case "pause":
+                    with self.lock:
+                        self.paused = True
+                case "resume":
+                    with self.lock:
+                        if self.paused:
+                            # Shows the image on screen for a whole `speed` again.
+                            self.paused = False
+                            self.shown_at = time.monotonic()
+                case "stop":
+                    with self.lock:
+                        self.playing = False
+                        self.position = -1
+                        self.version += 1
+                case "status":
+                    pass
+                case command:
+                    return {"status": "error", "message": f"Unknown command: {command}"}
+        except (KeyError, TypeError, ValueError, OSError) as e:
+            return {"status": "error", "message": f"Invalid {request.get('command')} command: {e}"}
+        with self.lock:
+            self.lock.notify_all()
+            return {"status": "ok", **self._status()}
+
+    def _settings(self, request: dict):
+        if "speed" in request:
+            self.speed = max(1, int(request["speed"]))
+        if "blend" in request:
+            self.blend = max(0, int(request["blend"]))
+
+    def _load(self, playlist_file: str, advance: bool):
+        """
+        Must hold the lock.
+        """
+        with open(playlist_file, 'r') as f:
+            images = [line for line in f.read().split('\n') if line]
+        current = self.images[self.position] if 0 <= self.position < len(self.images) else None
+        positions = {path: i for i, path in enumerate(images)}
+        if advance or current is None:
+            self.position = -1
+            self.shown_at = 0
+        elif current in positions:
+            self.position = positions[current]
+        else:
+            # The image on screen was removed, goes on from the image after it.
+            self.position = min(self.position, len(images)) - 1
+        self.images = images
+        self.version += 1
+
+    def _status(self) -> dict:
+        """
+        Must hold the lock.
+        """
+        return {
+            "playing": self.playing,
+            "paused": self.paused,
+            "image": self.images[self.position] if 0 <= self.position < len(self.images) else None,
+            "position": self.position,
+            "count": len(self.images),
+            "speed": self.speed,
+            "blend": self.blend,
+            "prefetch": {
+                **self.prefetcher.stats(),
+                "decodeAhead": self.decode_ahead,
+                "decodeHits": self.decode_hits,
+                "decodeMisses": self.decode_misses
+            }
+        }
+
+    def _run(self):
+        while True:
+            with self.lock:
+                next_image = self._wait_for_next()
+                if next_image is None:
+                    return
+                position, path = next_image
+                version, blend = self.version, self.blend
+
+            if path in self.decoded:
+                self.decode_hits += 1
+            else:
+                self.decode_misses += 1
+            frame = self._decode(path)
+            with self.lock:
+                if self.stopped:
+                    return
+                if not self.playing or self.version != version:
+                    continue
+                self.position, self.shown_at = position, time.monotonic()
+                if frame is None:
+                    # Skipped, unless none of the images could be decoded.
+                    self.failures += 1
+                    if self.failures < len(self.images):
+                        self.shown_at = 0
+                else:
+                    self.failures = 0
+            if frame is not None:
+                self._show(path, frame, blend)
+            self._prepare_next()
+
+    def _wait_for_next(self) -> tuple[int, str] | None:
+        """
+        Waits until the next image is due, and returns its position and path. Returns None once stopped.
+        Must hold the lock.
+        """
+        while not self.stopped:
+            if not self.playing:
+                if self.current is not None:
+                    self.current = None
+                    self.transition = None
+                    self.framebuffer.clear()
+                self.lock.wait()
+                continue
+            if self.paused or not self.images:
+                self.lock.wait()
+                continue
+            remaining = self.shown_at + self.speed - time.monotonic()
+            if remaining > 0:
+                self.lock.wait(remaining)
+                continue
+            position = (self.position + 1) % len(self.images)
+            return position, self.images[position]
+        return None
+
+    def _show(self, path: str, frame: bytes, blend: int):
+        steps = min(self.max_blend_frames, blend // 40)
+        if self.current is not None and self.transition is not None and steps > 0:
+            from_path, to_path, frames = self.transition
+            if from_path == self.current[0] and to_path == path:
+                interval = blend / 1000 / (len(frames) + 1)
+                for blended in frames:
+                    self.framebuffer.write(blended)
+                    time.sleep(interval)
+        self.framebuffer.write(frame)
+        self.current = (path, frame)
+        self.transition = None
+
+    def _prepare_next(self):
+        """
+        Prefetches and decodes the next images, and computes the cross-fade to the next one, while the current image
+        is shown.
+        """
+        with self.lock:
+            if not self.images or self.current is None:
+                return
+            images, position, version = self.images, self.position, self.version
+            steps = min(self.max_blend_frames, self.blend // 40)
+        self.prefetcher.update(images, position)
+
+        upcoming = [images[(position + i) % len(images)] for i in range(1, min(self.decode_ahead, len(images)) + 1)]
+        for i, path in enumerate(upcoming):
+            if self.version != version:
+                return # Skipped or swapped meanwhile, the images coming up changed.
+            frame = self._decode(path)
+            if i == 0 and frame is not None and steps > 0 and path != self.current[0]:
+                self.transition = (self.current[0], path, self.framebuffer.blend(self.current[1], frame, steps))
+
+    def _decode(self, path: str) -> bytes | None:
+        if path in self.decoded:
+            self.decoded.move_to_end(path)
+            return self.decoded[path]
+        self.prefetcher.read(path)
+        frame = self.framebuffer.decode(path)
+        # The image isn't read again once it's decoded.
+        self.prefetcher.drop(path)
+        if frame is not None:
+            self.decoded[path] = frame
+            while len(self.decoded) > self.decoded_cache_size:
+                self.decoded.popitem(last=False)
+        return frame
+
+class _CommandHandler(socketserver.StreamRequestHandler):
+    """
+    One JSON command per line, answered by one JSON line.
+    """
+    def handle(self):
+        for line in self.rfile:
+            try:
+                request = json.loads(line)
+                response = self.server.controller.handle(request)
+            except (json.JSONDecodeError, AttributeError) as e:
+                response = {"status": "error", "message": f"Invalid command: {e}"}
+            self.wfile.write(json.dumps(response).encode() + b'\n')
+            self.wfile.flush()
+
+class ControllerServer(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, socket_path: str, controller: SlideshowController):
+        self.controller = controller
+        if os.path.exists(socket_path):
+            os.remove(socket_path) # Left over by a previous run.
+        os.makedirs(os.path.dirname(socket_path), exist_ok=True)
+        super().__init__(socket_path, _CommandHandler)
@@ -0,0 +1,180 @@
+import fcntl
+import os
+import subprocess
+
+# Weights of the blended frames are in 1/BLEND_SCALE of the next image.
+BLEND_SHIFT = 5
+BLEND_SCALE = 1 << BLEND_SHIFT
+
+# RGB888 -> RGB565 channel lookups, on one byte per channel.
+_R_HIGH = bytes(c & 0xF8 for c in range(256))
+_G_HIGH = bytes(c >> 5 for c in range(256))
+_G_LOW = bytes((c << 3) & 0xE0 for c in range(256))
+_B_LOW = bytes(c >> 3 for c in range(256))
+
+# linux/kd.h
+KDSETMODE = 0x4B3A
+KD_TEXT = 0x00
+KD_GRAPHICS = 0x01
+
+class Framebuffer:
+    """
+    Linux framebuffer device, written one whole frame at a time.
+
+    Frames are raw bytes in the pixel format of the device: RGB565 at 16 bpp, BGR at 24 bpp, BGRA at 32 bpp.
+    Images are decoded and scaled to the resolution of the framebuffer with ImageMagick's `convert`.
+
+    Blending is done on whole frames as big ints: the channels are masked into lanes with enough zero bits above
+    them to be multiplied by their weight without spilling into the next channel, so each blended frame is a
+    dozen C-speed operations on the frame instead of a Python loop over its pixels.
+    """
+    def __init__(self, device: str = "/dev/fb0", sysfs_dir: str = "", tty: str = ""):
+        """
+        Args:
+            device (str): The framebuffer device.
+            sysfs_dir (str): Where the geometry of the framebuffer is read. `/sys/class/graphics/<device name>` if empty.
+            tty (str): The console shown on the framebuffer, switched to graphics mode while it's open so the kernel
+                doesn't draw the text console and its cursor over the frames. Left as is if empty.
+        """
+        self.device = device
+        self.tty = tty
+        sysfs_dir = sysfs_dir or f"/sys/class/graphics/{os.path.basename(device)}"
+        self.width, self.height = (int(v) for v in _read(f"{sysfs_dir}/virtual_size").split(','))
+        self.bits_per_pixel = int(_read(f"{sysfs_dir}/bits_per_pixel"))
+        if self.bits_per_pixel not in (16, 24, 32):
+            raise ValueError(f"Unsupported framebuffer depth: {self.bits_per_pixel} bpp")
+        try:
+            self.stride = int(_read(f"{sysfs_dir}/stride"))
+        except OSError:
+            self.stride = self.width * self.bits_per_pixel // 8
+        self.frame_size = self.stride * self.height
+
+        # offset -> lane masks, see `blend()`.
+        self.lanes: dict[int, list[int]] = {}
+        self.fd: int | None = None
+        self.tty_fd: int | None = None
+
+    def open(self):
+        self.fd = os.open(self.device, os.O_WRONLY)
+        if self.tty:
+            try:
+                self.tty_fd = os.open(self.tty, os.O_RDWR | os.O_NOCTTY)
+                fcntl.ioctl(self.tty_fd, KDSETMODE, KD_GRAPHICS)
+            except OSError as e:
+                print(f"Failed to switch {self.tty} to graphics mode: {e}")
+
+    def close(self):
+        if self.tty_fd is not None:
+            try:
+                fcntl.ioctl(self.tty_fd, KDSETMODE, KD_TEXT)
+            except OSError as e:
+                print(f"Failed to switch {self.tty} back to text mode: {e}")
+            os.close(self.tty_fd)
+            self.tty_fd = None
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+    def write(self, frame: bytes):
+        os.pwrite(self.fd, frame, 0)
+
+    def clear(self):
+        self.write(bytes(self.frame_size))
+
+    def decode(self, image_path: str) -> bytes | None:
+        """
+        Decodes an image into a frame, scaled to fit the screen and centered on black. Returns None if it failed.
+        """
+        raw_format = {16: "rgb", 24: "bgr", 32: "bgra"}[self.bits_per_pixel]
+        try:
+            proc = subprocess.run([
+                "convert",
+                # Lets the JPG decoder downscale while decoding, which is much faster for large images.
+                "-define", f"jpeg:size={self.width * 2}x{self.height * 2}",
+                f"{image_path}[0]",
+                "-auto-orient",
+                "-resize", f"{self.width}x{self.height}",
+                "-background", "black", "-gravity", "center", "-extent", f"{self.width}x{self.height}",
+                "-depth", "8",
+                f"{raw_format}:-"
+            ], capture_output=True)
+        except OSError as e:
+            print(f"Error running image decode: {e}")
+            return None
+        if proc.returncode != 0:
+            print(f"Failed to decode {image_path}: {proc.stderr.decode(errors='replace').strip()}")
+            return None
+        return self.to_frame(proc.stdout)
+
+    def to_frame(self, pixels: bytes) -> bytes:
+        """
+        Converts the decoded pixels (RGB at 16 bpp) into a frame, padding each row to the stride.
+        """
+        if self.bits_per_pixel == 16:
+            pixels = _rgb_to_rgb565(pixels)
+        row_size = self.width * self.bits_per_pixel // 8
+        if len(pixels) != row_size * self.height:
+            raise ValueError(f"Expected {row_size * self.height} bytes of pixels, got {len(pixels)}")
+        if row_size == self.stride:
+            return pixels
+        padding = bytes(self.stride - row_size)
+        return b''.join(pixels[i:i + row_size] + padding for i in range(0, len(pixels), row_size))
+
+    def blend(self, frame: bytes, next_frame: bytes, steps: int) -> list[bytes]:
+        """
+        Returns the `steps` frames of a cross-fade from `frame` to `next_frame`, excluding both.
+        """
+        if steps <= 0:
+            return []
+        a = int.from_bytes(frame, 'little')
+        b = int.from_bytes(next_frame, 'little')
+        channels = [
+            (offset, mask, (a >> offset) & mask, (b >> offset) & mask)
+            for offset, masks in self._lanes().items() for mask in masks
+        ]
+        frames = []
+        for step in range(1, steps + 1):
+            weight = round(BLEND_SCALE * step / (steps + 1))
+            blended = 0
+            for offset, mask, a_channel, b_channel in channels:
+                mixed = a_channel * (BLEND_SCALE - weight) + b_channel * weight
+                blended |= ((mixed >> BLEND_SHIFT) & mask) << offset
+            frames.append(blended.to_bytes(len(frame), 'little'))
+        return frames
+
+    def _lanes(self) -> dict[int, list[int]]:
+        """
+        Masks of the channels, by offset. Each masked channel has at least BLEND_SHIFT zero bits above it.
+        - 24/32 bpp: every other byte.
+        - 16 bpp: red and blue, then green, of every other pixel.
+        """
+        if not self.lanes:
+            if self.bits_per_pixel == 16:
+                patterns = {0: [b"\x1f\xf8\x00\x00", b"\xe0\x07\x00\x00"], 16: [b"\x1f\xf8\x00\x00", b"\xe0\x07\x00\x00"]}
+            else:
+                patterns = {0: [b"\xff\x00"], 8: [b"\xff\x00"]}
+            for offset, masks in patterns.items():
+                self.lanes[offset] = [
+                    int.from_bytes((mask * (self.frame_size // len(mask) + 1))[:self.frame_size], 'little')
+                    for mask in masks
+                ]
+        return self.lanes
+
+def _rgb_to_rgb565(rgb: bytes) -> bytes:
+    """
+    Packs RGB888 pixels into little endian RGB565, a byte plane at a time.
+    """
+    r, g, b = rgb[0::3], rgb[1::3], rgb[2::3]
+    high = _or(r.translate(_R_HIGH), g.translate(_G_HIGH))
+    low = _or(g.translate(_G_LOW), b.translate(_B_LOW))
+    pixels = bytearray(2 * len(r))
+    pixels[0::2] = low
+    pixels[1::2] = high
+    return bytes(pixels)
+
+def _or(a: bytes, b: bytes) -> bytes:
+    return (int.from_bytes(a, 'little') | int.from_bytes(b, 'little')).to_bytes(len(a), 'little')
+
+def _read(path: str) -> str:
+    with open(path, 'r') as f:
+        return f.read().strip()
@@ -0,0 +1,36 @@
+import os
+import signal
+import sys
+
+from app.config.config import config, load_config
+from app.utils import utils
+from app.slideshow_controller.controller import ControllerServer, SlideshowController
+from app.slideshow_controller.framebuffer import Framebuffer
+
+utils.load_env([".env", os.path.abspath(os.path.expandvars('$HOME/.config/pi-photo-album/.env'))])
+load_config()
+
+def main():
+    controller = SlideshowController(
+        Framebuffer(config()['slideshow']['framebuffer'].as_str(), tty=config()['slideshow']['tty'].as_str()),
+        config()['slideshow']['max_blend_frames'].as_int(),
+        config()['slideshow']['prefetch_depth'].as_int(),
+        config()['slideshow']['decode_ahead'].as_int()
+    )
+    socket_path = config()['paths']['slideshow_socket'].as_str()
+    server = ControllerServer(socket_path, controller)
+    # Blanks the screen on the way out.
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    controller.start()
+    print(f"Slideshow controller listening on {socket_path}")
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        controller.stop()
+        os.remove(socket_path)
+
+if __name__ == "__main__":
+    os.makedirs(config()['paths']['config_dir'].as_str(), exist_ok=True)
+
+    main()
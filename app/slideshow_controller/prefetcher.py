@@ -0,0 +1,63 @@
+import os
+
+class Prefetcher:
+    """
+    Warms the page cache with the next `depth` images of the playlist, so the slideshow doesn't stall reading a large
+    image from a slow SD card, and drops the pages of the images behind the cursor, which are decoded already.
+
+    The kernel is asked to read the images ahead with `posix_fadvise(WILLNEED)`, which returns without waiting for
+    the reads, and to drop them with `posix_fadvise(DONTNEED)`.
+
+    Counts the images read after they were prefetched (hits) or without being prefetched (misses), e.g. after a skip,
+    to tune the depth.
+    """
+    def __init__(self, depth: int):
+        self.depth = depth
+        # Images prefetched and not dropped yet.
+        self.prefetched: set[str] = set()
+        self.hits = 0
+        self.misses = 0
+
+    def update(self, images: list[str], position: int):
+        """
+        Prefetches the images after `position` in the playlist, and drops the others that were prefetched.
+        """
+        upcoming = set()
+        if images:
+            upcoming = {images[(position + i) % len(images)] for i in range(1, min(self.depth, len(images)) + 1)}
+        for path in self.prefetched - upcoming:
+            _advise(path, os.POSIX_FADV_DONTNEED)
+        for path in upcoming - self.prefetched:
+            _advise(path, os.POSIX_FADV_WILLNEED)
+        self.prefetched = upcoming
+
+    def read(self, path: str):
+        """
+        Records that an image is read, e.g. to decode it.
+        """
+        if path in self.prefetched:
+            self.hits += 1
+        else:
+            self.misses += 1
+
+    def drop(self, path: str):
+        """
+        Drops the pages of an image that was read, unless it's coming up again.
+        """
+        if path not in self.prefetched:
+            _advise(path, os.POSIX_FADV_DONTNEED)
+
+    def stats(self) -> dict:
+        return {"depth": self.depth, "hits": self.hits, "misses": self.misses}
+
+def _advise(path: str, advice: int):
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return # Deleted since the playlist was loaded, it's skipped when it comes up.
+    try:
+        os.posix_fadvise(fd, 0, 0, advice)
+    except OSError as e:
+        print(f"Error advising the kernel about {path}: {e}")
+    finally:
+        os.close(fd)
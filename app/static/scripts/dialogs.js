@@ -187,7 +187,7 @@ const hidePreviewImageDialog = () => {
 }
 
 const populateAlbumPaths = (dialogId) => {
-    const albumPaths = removeAlbumsPrefixes(getAlbumPaths(fileSystemSnapshot, false));
+    const albumPaths = getPickerAlbumPaths();
     const select = document.getElementById(dialogId).querySelector('select');
     select.innerHTML = select.firstElementChild.outerHTML;
     for (const path of albumPaths) {
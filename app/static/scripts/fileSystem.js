@@ -15,6 +15,116 @@ const overrideFileSystem = (fileSystem) => {
     }
 };
 
+const LIST_ALBUM_PAGE_SIZE = 500;
+// Max depth of sub-albums listed by /list-album.
+const MAX_LIST_ALBUM_DEPTH = 10;
+
+// Album paths (without the 'albums/' prefix, '' for the root) whose children were fetched from the server.
+// The top level albums come with the page, the other albums are fetched when they're expanded.
+const loadedAlbums = new Set(['']);
+
+/**
+ * Fetches the children of an album from the server, one page at a time, and merges them into the file system object.
+ * Sub-albums are fetched `depth` levels deep.
+ *
+ * @param {String} albumPath album path without the 'albums/' prefix, '' for the root.
+ * @param {Number} depth number of levels of sub-albums to fetch with the album.
+ * @param {Boolean} prune removes the children that aren't on the server anymore, e.g. after a resync.
+ */
+const loadAlbum = async (albumPath, depth = 0, prune = false) => {
+    const items = {};
+    let cursor = null;
+    do {
+        const params = new URLSearchParams({
+            path: albumPath === '' ? 'albums' : `albums/${albumPath}`,
+            limit: LIST_ALBUM_PAGE_SIZE,
+            depth: depth,
+        });
+        if (cursor) params.set('cursor', cursor);
+
+        const resp = await fetch(`/list-album?${params}`);
+        if (!resp.ok) {
+            console.error(`Failed to list album: ${albumPath}`);
+            return;
+        }
+        const data = await resp.json();
+        Object.assign(items, data.items);
+        cursor = data.cursor;
+    } while (cursor);
+
+    // Merged into the current file system object, which events may have updated meanwhile.
+    let loc = fileSystemSnapshot.albums;
+    for (const part of albumPath.split('/').filter((p) => p)) {
+        if (typeof loc[part] !== 'object') return; // Deleted meanwhile.
+        loc = loc[part];
+    }
+    mergeAlbum(loc, items, albumPath, depth, prune);
+};
+
+/**
+ * Merges the items listed by /list-album into an album of the file system object.
+ * Sub-albums past the depth are listed as `{}`, so their children aren't known yet.
+ */
+const mergeAlbum = (loc, items, albumPath, depth, prune) => {
+    loadedAlbums.add(albumPath);
+    // Top level albums that are already in the file system object are kept even if they are empty on the server.
+    if (prune && albumPath !== '') {
+        for (const name of Object.keys(loc)) {
+            if (!(name in items)) delete loc[name];
+        }
+    }
+    for (const [name, val] of Object.entries(items)) {
+        const path = albumPath === '' ? name : `${albumPath}/${name}`;
+        if (typeof val === 'object') {
+            if (typeof loc[name] !== 'object') loc[name] = {};
+            if (depth > 0) mergeAlbum(loc[name], val, path, depth - 1, prune);
+        } else {
+            loc[name] = '';
+        }
+    }
+};
+
+/**
+ * Fetches the albums fetched so far again, e.g. after a resync, and removes the items that aren't on the server anymore.
+ */
+const reloadFileSystem = async () => {
+    // Parents first, so the albums removed from the server are skipped.
+    const albumPaths = [...loadedAlbums].sort(
+        (a, b) => (a === '' ? 0 : a.split('/').length) - (b === '' ? 0 : b.split('/').length)
+    );
+    loadedAlbums.clear();
+    for (const albumPath of albumPaths) {
+        await loadAlbum(albumPath, 0, true);
+    }
+    await loadAlbumPaths();
+    refreshUI();
+};
+
+/**
+ * Fetches the paths of all the albums again, e.g. after a resync.
+ */
+const loadAlbumPaths = async () => {
+    const resp = await fetch('/list-album-paths');
+    if (!resp.ok) {
+        console.error('Failed to list album paths');
+        return;
+    }
+    const data = await resp.json();
+    albumPathsSnapshot.splice(0, albumPathsSnapshot.length, ...data.albumPaths);
+};
+
+/**
+ * Returns the paths of the albums to pick from, without the 'albums/' prefix: all the albums listed by the server,
+ * nested ones included, and the ones created since, which are only in the file system object.
+ */
+const getPickerAlbumPaths = () => {
+    const albumPaths = new Set(albumPathsSnapshot);
+    for (const path of removeAlbumsPrefixes(getAlbumPaths(fileSystemSnapshot, false))) {
+        albumPaths.add(path);
+    }
+    return [...albumPaths].sort();
+};
+
 /**
  * Creates the file system UI based on the file system object.
  */
@@ -50,7 +160,15 @@ const updateFileSystemUI = () => {
                 folderName.innerHTML = key;
                 if (parent !== fsTreeRoot) {
                     // Don't allow selection of top level folders
-                    selectItem.onchange = (e) => handleSelectItem(e, currPath, false);
+                    selectItem.onchange = async (e) => {
+                        if (e.target.checked) {
+                            // All the files of the folder are selected, so its whole tree is fetched first.
+                            e.target.disabled = true;
+                            await loadAlbum(currPath, MAX_LIST_ALBUM_DEPTH);
+                            e.target.disabled = false;
+                        }
+                        handleSelectItem(e, currPath, false);
+                    };
                     folderLi.appendChild(selectItem);
                 }
                 folderLi.appendChild(folderName);
@@ -67,9 +185,14 @@ const updateFileSystemUI = () => {
                 const hideBtn = document.createElement('button');
                 hideBtn.innerHTML = folderUl.style.display === 'none' ? 'Show' : 'Hide';
                 hideBtn.classList.add('hide-album-btn');
-                hideBtn.onclick = () => {
+                hideBtn.onclick = async () => {
                     folderUl.style.display = folderUl.style.display === 'none' ? 'block' : 'none';
                     hideBtn.innerHTML = folderUl.style.display === 'none' ? 'Show' : 'Hide';
+                    if (folderUl.style.display !== 'none' && !loadedAlbums.has(currPath)) {
+                        await loadAlbum(currPath);
+                        updateFileSystemUI();
+                        updateSettingsUI(settingsState);
+                    }
                 };
 
                 folderLi.appendChild(hideBtn);
@@ -96,7 +219,7 @@ const updateFileSystemUI = () => {
 
 const getImagePreview = async (path) => {
     path = `albums/${path}`;
-    const resp = await fetch(`/preview?image=${encodeURIComponent(path)}`);
+    const resp = await fetch(`/preview?image=${encodeURIComponent(path)}&size=medium`);
 
     const contentType = resp.headers.get('Content-Type');
     if (!contentType || !contentType.startsWith('image/')) {
@@ -587,10 +710,22 @@ const handleEvent = (data) => {
                 break;
             }
             case 'RESYNC': {
-                if ('fileStructure' in message) overrideFileSystem(message.fileStructure);
-                console.log('RESYNC event:');
-                console.log(message.fileStructure);
-                refreshUI();
+                console.log('RESYNC event');
+                if ('fileStructure' in message) {
+                    overrideFileSystem(message.fileStructure);
+                    loadAlbumPaths().then(refreshUI);
+                } else {
+                    reloadFileSystem();
+                }
+                break;
+            }
+            case 'UPLOAD': {
+                console.log('UPLOAD event: ' + message.jobId + ' - ' + message.status);
+                handleUploadEvent(message);
+                break;
+            }
+            case 'CONNECTIVITY': {
+                console.log('CONNECTIVITY event: ' + message.service + ' - ' + (message.online ? 'online' : 'offline'));
                 break;
             }
             case 'LOADING': {
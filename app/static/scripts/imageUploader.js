@@ -23,7 +23,7 @@ const updateFileStagingUI = () => {
     const stagingList = document.getElementById('image-staging-list');
     stagingList.innerHTML = '';
 
-    const albumPaths = removeAlbumsPrefixes(getAlbumPaths(fileSystemSnapshot, false));
+    const albumPaths = getPickerAlbumPaths();
     for (const [id, { album, fileName }] of Object.entries(filesInStaging)) {
         const listItem = createStagedFileUI(fileName, album, albumPaths);
         listItem.querySelector('.staging-remove-btn').onclick = () => {
@@ -127,30 +127,36 @@ const handleImagesUpload = async (e) => {
         const respData = await resp.json();
         if (respData.status !== 'ok') throw new Error('Failed to upload images');
 
+        // The images are processed in the background, the progress is sent with UPLOAD events.
         const newFilesInStaging = {};
         for (const failed of respData.failed ?? []) {
             if (failed in filesInStaging) {
                 newFilesInStaging[failed] = filesInStaging[failed];
             }
         }
-        alert(
-            `Successfully uploaded ${Object.keys(filesInStaging).length - Object.keys(newFilesInStaging).length} image(s).\n\n${'failed' in respData && respData.failed.length > 0 ? 'Failed to upload:' : ''}\n${Object.keys(
-                newFilesInStaging
-            )
-                .map((id) => filesInStaging[id].fileName)
-                .join('\n')}`
-        );
-
-        // Update the file system snapshot with the new files
-        for (const success of respData.success ?? []) {
-            const filePath = removeAlbumsPrefix(success);
-            updateFileSystem(fileSystemSnapshot, '', filePath);
+        if (respData.jobId) {
+            const jobFiles = {};
+            for (const queued of respData.queued ?? []) {
+                if (queued in filesInStaging) {
+                    jobFiles[queued] = filesInStaging[queued];
+                }
+            }
+            uploadJobs[respData.jobId] = { files: jobFiles, failed: [] };
+        }
+        const earlyCompletion = earlyUploadCompletions[respData.jobId];
+        earlyUploadCompletions = {};
+        if (Object.keys(newFilesInStaging).length > 0) {
+            alert(
+                `Failed to upload:\n${Object.keys(newFilesInStaging)
+                    .map((id) => filesInStaging[id].fileName)
+                    .join('\n')}`
+            );
         }
 
         filesInStaging = newFilesInStaging;
-        updateFileSystemUI();
         updateFileStagingUI();
         updateSettingsUI(settingsState);
+        if (earlyCompletion) handleUploadEvent(earlyCompletion);
     } catch (e) {
         console.error(e);
         alert('Failed to upload images.');
@@ -159,6 +165,46 @@ const handleImagesUpload = async (e) => {
     hideLoadingSpinner();
 };
 
+const handleUploadEvent = (message) => {
+    const job = uploadJobs[message.jobId];
+    switch (message.status) {
+        case 'saved': {
+            // Every client adds the new images, not only the one that uploaded them.
+            updateFileSystem(fileSystemSnapshot, '', removeAlbumsPrefix(message.path));
+            updateFileSystemUI();
+            break;
+        }
+        case 'failed': {
+            if (job && message.guid in job.files) {
+                job.failed.push(message.guid);
+            }
+            break;
+        }
+        case 'complete': {
+            if (!job) {
+                earlyUploadCompletions[message.jobId] = message;
+                break;
+            }
+            delete uploadJobs[message.jobId];
+
+            // Put the failed images back in staging so that they can be uploaded again.
+            for (const failed of message.failed ?? job.failed) {
+                if (failed in job.files) {
+                    filesInStaging[failed] = job.files[failed];
+                }
+            }
+            const failedNames = (message.failed ?? job.failed)
+                .filter((id) => id in job.files)
+                .map((id) => job.files[id].fileName);
+            alert(
+                `Successfully uploaded ${Object.keys(job.files).length - failedNames.length} image(s).\n\n${failedNames.length > 0 ? 'Failed to upload:' : ''}\n${failedNames.join('\n')}`
+            );
+            updateFileStagingUI();
+            break;
+        }
+    }
+};
+
 const updateUploadButtonState = () => {
     const uploadBtn = document.getElementById('upload-submit-btn');
     uploadBtn.disabled = Object.keys(filesInStaging).length === 0;
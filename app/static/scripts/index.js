@@ -13,6 +13,12 @@ let settingsState = { ...DEFAULT_SETTINGS };
 // List[{id: {fileContent: File, album: str, fileName: str}]
 let filesInStaging = {};
 
+// Uploads that are being processed by the server.
+// Dict[jobId: {files: {id: {fileContent: File, album: str, fileName: str}}, failed: List[id]}]
+let uploadJobs = {};
+// Completed jobs whose UPLOAD event arrived before the response of the upload request. Dict[jobId: message]
+let earlyUploadCompletions = {};
+
 const refreshUI = () => {
     updateSettingsUI(settingsState);
     updateFileSystemUI();
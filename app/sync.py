@@ -0,0 +1,321 @@
+import json
+import os
+import threading
+import time
+
+from app.album_index import album_index
+from app.announcer import event_announcer
+from app.blob_store import blob_store
+from app.cloud_clients.cloud_client import cloud_client
+from app.config.config import config
+from app.thumbnails import thumbnail_cache
+from app.utils import filesystem, events, offline
+
+class SyncManifest:
+    """
+    The state of each image the last time it was synced with the cloud.
+
+    Manifest format:
+    ```
+    {
+        key: {
+            "size": int,
+            "etag": str,      # ETag of the image in the cloud.
+            "mtime": int,     # mtime (ns) of the local image after it was synced.
+            "lastSeen": float # Unix time the image was last seen in the cloud.
+        }
+    }
+    ```
+    """
+    def __init__(self, manifest_file: str):
+        self.manifest_file = manifest_file
+        self.entries: dict[str, dict] = {}
+        self.lock = threading.Lock()
+
+    def load(self):
+        try:
+            with open(self.manifest_file, 'r') as f:
+                entries = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            entries = {}
+        with self.lock:
+            self.entries = entries
+
+    def save(self):
+        """
+        Atomically writes the manifest. Resilient to crashes and restarts.
+        """
+        with self.lock:
+            data = json.dumps(self.entries)
+        os.makedirs(os.path.dirname(self.manifest_file), exist_ok=True)
+        tmp_file = f'{self.manifest_file}.tmp'
+        with open(tmp_file, 'w') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_file, self.manifest_file)
+
+    def get(self, key: str) -> dict | None:
+        with self.lock:
+            return self.entries.get(key)
+
+    def record(self, key: str, size: int, etag: str, mtime: int, last_seen: float):
+        with self.lock:
+            self.entries[key] = {"size": size, "etag": etag, "mtime": mtime, "lastSeen": last_seen}
+
+    def remove(self, key: str):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def keys(self) -> list[str]:
+        with self.lock:
+            return list(self.entries)
+
+
+class Resyncer:
+    """
+    Resyncs the local albums with the cloud in the background.
+
+    Only the images that changed since the last sync are downloaded: an image is up to date if its ETag in the cloud
+    matches the manifest, or if it was never synced and its local copy has the same size.
+
+    A resync is planned first, then the plan is written to a checkpoint file and carried out in batches,
+    updating the checkpoint after each batch. If the app restarts mid-sync, the resync resumes from the checkpoint.
+
+    Checkpoint format:
+    ```
+    {
+        "download": [{"key": str, "size": int, "etag": str}, ...], # Remaining images to download.
+        "delete": [key, ...],  # Remaining local images to delete.
+        "events": [...],       # Offline events to send to the queue once the images are synced.
+        "failed": [key, ...]   # Images that failed to download.
+    }
+    ```
+    """
+    def __init__(self, manifest: SyncManifest, checkpoint_file: str, batch_size: int = 50):
+        self.manifest = manifest
+        self.checkpoint_file = checkpoint_file
+        self.batch_size = batch_size
+        self.lock = threading.Lock()
+        self.worker: threading.Thread | None = None
+
+    def start(self) -> bool:
+        """
+        Starts a resync in the background. Returns False if a resync is already running.
+        """
+        with self.lock:
+            if self.is_running():
+                return False
+            self.worker = threading.Thread(target=self._run, name="resync", daemon=True)
+            self.worker.start()
+            return True
+
+    def resume(self):
+        """
+        Resumes the resync that was interrupted by a restart, if any.
+        """
+        if os.path.exists(self.checkpoint_file):
+            print("Resuming interrupted resync")
+            self.start()
+
+    def is_running(self) -> bool:
+        return self.worker is not None and self.worker.is_alive()
+
+    def _run(self):
+        self._announce([{"event": "LOADING", "loading": True, "message": "Resyncing photos with cloud storage..."}])
+        try:
+            job = self._load_checkpoint()
+            if job is None:
+                # Holds the offline events file, so no event is saved between reading and clearing it.
+                with offline.events_lock:
+                    job = self.plan()
+                    self._save_checkpoint(job)
+                    # The offline events are in the checkpoint now, so they are sent even if the app restarts.
+                    offline.clear_offline_events(config()['paths']['offline_events_file'].as_str())
+            self.sync(job)
+        except Exception as e:
+            print(f"Error resyncing: {e}")
+        self._announce([{"event": "RESYNC"}, {"event": "LOADING", "loading": False}])
+
+    def plan(self) -> dict:
+        """
+        Compares the cloud with the local albums and the manifest, and returns the resync to carry out.
+        """
+        allowed_prefixes = config()['files']['allowed_prefixes'].as_set().as_strs()
+        offline_events_file = config()['paths']['offline_events_file'].as_str()
+        prefixes = [f"albums/{prefix}" for prefix in allowed_prefixes]
+
+        cloud_objects: dict[str, dict] = {}
+        for prefix in prefixes:
+            # trailing slash required b/c of s3 policy
+            for obj in cloud_client().list_objects(f'{prefix}/'):
+                cloud_objects[obj["key"]] = obj
+
+        local_files = set()
+        for prefix in prefixes:
+            local_files.update(album_index().list_files(prefix))
+
+        files_not_in_cloud = local_files.difference(cloud_objects)
+        to_download = set()
+        now = time.time()
+        for key, obj in cloud_objects.items():
+            if self._is_synced(key, obj):
+                continue
+            to_download.add(key)
+
+        offline_events = offline.get_offline_events(offline_events_file)
+        for evt in offline_events:
+            evt["path"] = filesystem.strip_base_dir(evt["path"])
+            if evt["event"] == "MOVE":
+                evt["newPath"] = filesystem.strip_base_dir(evt["newPath"])
+        # Only the net change of each path is replayed.
+        offline_events = events.compact_events(offline_events)
+        print("Offline events:")
+        print(offline_events)
+
+        events_to_send = []
+        for evt in offline_events:
+            match evt["event"]:
+                case "PUT":
+                    files_not_in_cloud.discard(evt["path"]) # Avoids deleting the file later.
+                    events_to_send.append({"event": "PUT", "path": evt["path"]})
+                case "MOVE":
+                    # TODO: test multiple moves of the same file while offline.
+                    to_download.discard(evt["path"]) # Avoids downloading the file later.
+                    files_not_in_cloud.discard(evt["newPath"]) # Avoids deleting the file later.
+                    events_to_send.append({"event": "MOVE", "path": evt["path"], "newPath": evt["newPath"]})
+                case "DELETE":
+                    to_download.discard(evt["path"]) # Avoids downloading the file later.
+                    events_to_send.append({"event": "DELETE", "path": evt["path"]})
+
+        # Forget the images that are no longer in the cloud, and mark the rest as seen.
+        for key in self.manifest.keys():
+            if key not in cloud_objects:
+                self.manifest.remove(key)
+        for key, obj in cloud_objects.items():
+            if key in to_download:
+                continue
+            entry = self.manifest.get(key)
+            if entry is not None and entry["etag"] == obj["etag"]:
+                mtime = entry["mtime"]
+            elif os.path.exists(filesystem.key_to_abs_path(key)):
+                mtime = os.stat(filesystem.key_to_abs_path(key)).st_mtime_ns
+            else:
+                continue # Moved or deleted locally while offline.
+            self.manifest.record(key, obj["size"], obj["etag"], mtime, now)
+        self.manifest.save()
+
+        print(f"Resync: {len(to_download)} to download, {len(files_not_in_cloud)} to delete, {len(cloud_objects) - len(to_download)} up to date")
+        return {
+            "download": [cloud_objects[key] for key in sorted(to_download)],
+            "delete": sorted(files_not_in_cloud),
+            "events": events_to_send,
+            "failed": []
+        }
+
+    def sync(self, job: dict):
+        """
+        Carries out a planned resync, checkpointing after each batch.
+        """
+        total = len(job["download"])
+        while job["download"]:
+            batch, rest = job["download"][:self.batch_size], job["download"][self.batch_size:]
+            keys = [obj["key"] for obj in batch]
+            for key in keys:
+                # The local copy is about to be replaced.
+                thumbnail_cache().invalidate(filesystem.key_to_abs_path(key))
+            downloaded, failed = cloud_client().get_bulk([filesystem.key_to_abs_path(k) for k in keys], keys)
+
+            now = time.time()
+            for obj in batch:
+                if obj["key"] not in downloaded:
+                    continue
+                try:
+                    # Images copied into several albums are downloaded once per album, keep one copy on disk.
+                    blob_store().add(filesystem.key_to_abs_path(obj["key"]))
+                except OSError as e:
+                    print(f"Error adding {obj['key']} to the blob store: {e}")
+                # After it's linked to its blob, which it now shares the mtime of.
+                mtime = os.stat(filesystem.key_to_abs_path(obj["key"])).st_mtime_ns
+                self.manifest.record(obj["key"], obj["size"], obj["etag"], mtime, now)
+                album_index().add(obj["key"])
+            self.manifest.save()
+
+            job["download"] = rest
+            job["failed"].extend(failed)
+            self._save_checkpoint(job)
+            self._announce([{
+                "event": "LOADING",
+                "loading": True,
+                "message": f"Resyncing photos with cloud storage... ({total - len(rest)}/{total})"
+            }])
+
+        print("Deleting from local:")
+        print(job["delete"])
+        base_dir = config()['paths']['base_dir'].as_str()
+        for path in job["delete"]:
+            thumbnail_cache().invalidate(filesystem.key_to_abs_path(path))
+            filesystem.silentremove(filesystem.key_to_abs_path(path))
+            album_index().remove(path)
+            filesystem.remove_dirs(f'{base_dir}/albums', filesystem.remove_albums_prefix(os.path.dirname(path)))
+        job["delete"] = []
+        self._save_checkpoint(job)
+
+        if job["events"]:
+            cloud_client().insert_queue(json.dumps({"events": job["events"], "sender": os.getenv('USERNAME')}))
+        if job["failed"]:
+            print(f"Resync: failed to download {job['failed']}")
+        filesystem.silentremove(self.checkpoint_file)
+
+    def _is_synced(self, key: str, obj: dict) -> bool:
+        abs_path = filesystem.key_to_abs_path(key)
+        try:
+            st = os.stat(abs_path)
+        except FileNotFoundError:
+            return False
+
+        entry = self.manifest.get(key)
+        if entry is not None and entry["etag"] == obj["etag"]:
+            return True
+        if entry is not None and entry["mtime"] == st.st_mtime_ns:
+            # Changed in the cloud, but not locally.
+            return False
+        # Never synced, or changed on both sides (e.g. rotated and uploaded). Keep the local image if it matches.
+        return st.st_size == obj["size"]
+
+    def _announce(self, events: list[dict]):
+        event_announcer().announce(json.dumps({"events": events, "sender": os.getenv('USERNAME')}))
+
+    def _load_checkpoint(self) -> dict | None:
+        try:
+            with open(self.checkpoint_file, 'r') as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    def _save_checkpoint(self, job: dict):
+        """
+        Atomically writes the checkpoint. Resilient to crashes and restarts.
+        """
+        os.makedirs(os.path.dirname(self.checkpoint_file), exist_ok=True)
+        tmp_file = f'{self.checkpoint_file}.tmp'
+        with open(tmp_file, 'w') as f:
+            json.dump(job, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_file, self.checkpoint_file)
+
+_RESYNCER = None
+
+def init_resyncer(manifest_file: str, checkpoint_file: str):
+    global _RESYNCER
+    if _RESYNCER is not None:
+        return # Already initialized
+    manifest = SyncManifest(manifest_file)
+    manifest.load()
+    _RESYNCER = Resyncer(manifest, checkpoint_file)
+
+def resyncer():
+    if _RESYNCER is None:
+        raise RuntimeError("Resyncer not initialized. Run init_resyncer() first.")
+    return _RESYNCER
@@ -0,0 +1,183 @@
+import pytest
+from pathlib import Path
+
+from app.album_index import AlbumIndex
+from app.utils import filesystem
+from app.tests import utils
+
+class TestAlbumIndex:
+    def fs(self):
+        return {
+            "albums": {
+                "user1": {
+                    "file.png": "",
+                    "abc": {
+                        "file2.png": "",
+                        "file3.png": "",
+                    },
+                },
+                "Shared": {
+                    "file.png": "",
+                    "empty": {}
+                }
+            }
+        }
+
+    def test_build(self, tmp_path: Path):
+        fs = self.fs()
+        utils.create_fs(tmp_path, fs)
+        index = AlbumIndex(str(tmp_path / "albums"))
+        index.build()
+        assert index.get_file_structure() == fs
+
+    def test_build_missing_dir(self, tmp_path: Path):
+        index = AlbumIndex(str(tmp_path / "albums"))
+        index.build()
+        assert index.get_file_structure() == {"albums": {}}
+
+    def test_get_file_structure_is_a_copy(self, tmp_path: Path):
+        utils.create_fs(tmp_path, self.fs())
+        index = AlbumIndex(str(tmp_path / "albums"))
+        index.build()
+        index.get_file_structure()["albums"]["user1"]["new.png"] = ""
+        assert "new.png" not in index.get_file_structure()["albums"]["user1"]
+
+    def test_add(self, tmp_path: Path):
+        utils.create_fs(tmp_path, self.fs())
+        index = AlbumIndex(str(tmp_path / "albums"))
+        index.build()
+
+        index.add("albums/user1/abc/file4.png")
+        index.add("Shared/a/b/file.png")
+        index.add("albums/user1/file.png") # Already exists
+
+        expected = self.fs()
+        expected["albums"]["user1"]["abc"]["file4.png"] = ""
+        expected["albums"]["Shared"]["a"] = {"b": {"file.png": ""}}
+        assert index.get_file_structure() == expected
+
+    def test_remove(self, tmp_path: Path):
+        utils.create_fs(tmp_path, self.fs())
+        index = AlbumIndex(str(tmp_path / "albums"))
+        index.build()
+
+        index.remove("albums/user1/abc/file2.png")
+        index.remove("albums/user1/abc/file3.png")
+        index.remove("albums/Shared/file.png")
+        index.remove("albums/Shared/nonexistent.png")
+        index.remove("albums/Shared/empty") # Folders aren't removed directly
+
+        expected = self.fs()
+        del expected["albums"]["user1"]["abc"]
+        del expected["albums"]["Shared"]["file.png"]
+        assert index.get_file_structure() == expected
+
+    def test_remove_keeps_top_level_folders(self, tmp_path: Path):
+        utils.create_fs(tmp_path, self.fs())
+        index = AlbumIndex(str(tmp_path / "albums"))
+        index.build()
+
+        index.remove("albums/user1/file.png")
+        index.remove("albums/user1/abc/file2.png")
+        index.remove("albums/user1/abc/file3.png")
+        assert index.get_file_structure()["albums"]["user1"] == {}
+
+    def test_move(self, tmp_path: Path):
+        utils.create_fs(tmp_path, self.fs())
+        index = AlbumIndex(str(tmp_path / "albums"))
+        index.build()
+
+        index.move("albums/user1/abc/file2.png", "albums/Shared/x/file2.png")
+        index.move("albums/user1/abc/file3.png", "albums/Shared/x/file3.png")
+
+        expected = self.fs()
+        del expected["albums"]["user1"]["abc"]
+        expected["albums"]["Shared"]["x"] = {"file2.png": "", "file3.png": ""}
+        assert index.get_file_structure() == expected
+
+    def test_matches_disk_after_changes(self, tmp_path: Path):
+        utils.create_fs(tmp_path, self.fs())
+        albums_dir = tmp_path / "albums"
+        index = AlbumIndex(str(albums_dir))
+        index.build()
+
+        (albums_dir / "user1" / "abc" / "file2.png").unlink()
+        (albums_dir / "user1" / "abc" / "file3.png").unlink()
+        filesystem.remove_dirs(str(albums_dir), "user1/abc")
+        index.remove("albums/user1/abc/file2.png")
+        index.remove("albums/user1/abc/file3.png")
+
+        assert index.get_file_structure() == filesystem.get_file_structure(str(albums_dir))
+
+    def test_list_album(self, tmp_path: Path):
+        utils.create_fs(tmp_path, self.fs())
+        index = AlbumIndex(str(tmp_path / "albums"))
+        index.build()
+
+        items, cursor = index.list_album("albums")
+        assert items == {"Shared": {}, "user1": {}}
+        assert cursor is None
+
+        items, cursor = index.list_album("albums/user1", depth=1)
+        assert items == {"abc": {"file2.png": "", "file3.png": ""}, "file.png": ""}
+        assert cursor is None
+
+    def test_list_album_pagination(self, tmp_path: Path):
+        fs = {"albums": {"Shared": {f"file{i}.png": "" for i in range(10)}}}
+        utils.create_fs(tmp_path, fs)
+        index = AlbumIndex(str(tmp_path / "albums"))
+        index.build()
+
+        pages = []
+        cursor = ""
+        while cursor is not None:
+            items, cursor = index.list_album("albums/Shared", cursor, limit=3)
+            pages.append(list(items))
+        assert [len(p) for p in pages] == [3, 3, 3, 1]
+        assert sum(pages, []) == sorted(fs["albums"]["Shared"])
+
+    def test_list_files(self, tmp_path: Path):
+        utils.create_fs(tmp_path, self.fs())
+        index = AlbumIndex(str(tmp_path / "albums"))
+        index.build()
+
+        assert sorted(index.list_files("albums/user1")) == [
+            "albums/user1/abc/file2.png",
+            "albums/user1/abc/file3.png",
+            "albums/user1/file.png",
+        ]
+        assert sorted(index.list_files("albums")) == sorted(filesystem.list_files_in_dir(str(tmp_path), ["albums"]))
+        assert index.list_files("albums/ghost") == []
+
+    def test_list_album_paths(self, tmp_path: Path):
+        utils.create_fs(tmp_path, self.fs())
+        index = AlbumIndex(str(tmp_path / "albums"))
+        index.build()
+
+        assert index.list_album_paths() == ["Shared", "Shared/empty", "user1", "user1/abc"]
+
+    def test_list_album_not_found(self, tmp_path: Path):
+        utils.create_fs(tmp_path, self.fs())
+        index = AlbumIndex(str(tmp_path / "albums"))
+        index.build()
+
+        with pytest.raises(KeyError):
+            index.list_album("albums/ghost")
+        with pytest.raises(KeyError):
+            index.list_album("albums/Shared/file.png")
+
+    def test_listeners(self, tmp_path: Path):
+        utils.create_fs(tmp_path, self.fs())
+        index = AlbumIndex(str(tmp_path / "albums"))
+        index.build()
+        changes = []
+        index.subscribe(lambda action, key, new_key: changes.append((action, key, new_key)))
+
+        index.add("albums/Shared/new.png")
+        index.move("albums/Shared/new.png", "albums/user1/new.png")
+        index.remove("albums/user1/new.png")
+        assert changes == [
+            ("add", "albums/Shared/new.png", None),
+            ("move", "albums/Shared/new.png", "albums/user1/new.png"),
+            ("remove", "albums/user1/new.png", None),
+        ]
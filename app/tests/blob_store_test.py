@@ -0,0 +1,96 @@
+import hashlib
+import os
+from pathlib import Path
+from unittest.mock import patch
+
+from app.blob_store import BlobStore
+
+def sha256(path: str) -> str:
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+class TestBlobStore:
+    def create_image(self, path: Path, content: bytes = b"image"):
+        os.makedirs(path.parent, exist_ok=True)
+        path.write_bytes(content)
+        return str(path)
+
+    def new_store(self, tmp_path: Path):
+        return BlobStore(str(tmp_path / "blobs"), sha256)
+
+    def test_add(self, tmp_path: Path):
+        store = self.new_store(tmp_path)
+        image = self.create_image(tmp_path / "albums" / "a.jpg")
+
+        digest = store.add(image)
+        assert digest == hashlib.sha256(b"image").hexdigest()
+        assert os.path.samefile(image, store.blob_path(digest))
+        # Adding it again is a no-op.
+        assert store.add(image) == digest
+        assert os.stat(image).st_nlink == 2
+
+    def test_duplicates_share_a_blob(self, tmp_path: Path):
+        store = self.new_store(tmp_path)
+        image = self.create_image(tmp_path / "albums" / "a.jpg")
+        duplicate = self.create_image(tmp_path / "albums" / "b" / "a.jpg")
+        other = self.create_image(tmp_path / "albums" / "c.jpg", b"other image")
+
+        assert store.add(image) == store.add(duplicate)
+        store.add(other)
+        assert os.path.samefile(image, duplicate)
+        assert not os.path.samefile(image, other)
+        assert Path(duplicate).read_bytes() == b"image"
+
+    def test_copy(self, tmp_path: Path):
+        store = self.new_store(tmp_path)
+        image = self.create_image(tmp_path / "albums" / "a.jpg")
+        copies = [str(tmp_path / "albums" / "b" / "a.jpg"), str(tmp_path / "albums" / "c" / "a.jpg")]
+        missing = str(tmp_path / "albums" / "missing.jpg")
+
+        with patch("app.utils.filesystem._reflink", return_value=False):
+            digests, failure = store.copy([(image, copies[0]), (image, copies[1]), (missing, copies[0] + ".2")])
+        digest = hashlib.sha256(b"image").hexdigest()
+        assert digests == {copies[0]: digest, copies[1]: digest}
+        assert failure == [copies[0] + ".2"]
+        assert os.path.samefile(copies[0], store.blob_path(digest))
+        assert os.stat(image).st_nlink == 4
+
+    def test_replaced_image_is_detached(self, tmp_path: Path):
+        store = self.new_store(tmp_path)
+        image = self.create_image(tmp_path / "albums" / "a.jpg")
+        copy = str(tmp_path / "albums" / "b" / "a.jpg")
+        store.copy([(image, copy)])
+
+        # E.g. a download, written to a temporary file and renamed over the image.
+        tmp = self.create_image(tmp_path / "albums" / ".a.jpg.download", b"new image")
+        os.replace(tmp, image)
+        assert Path(copy).read_bytes() == b"image"
+
+    def test_collect_garbage(self, tmp_path: Path):
+        store = self.new_store(tmp_path)
+        image = self.create_image(tmp_path / "albums" / "a.jpg")
+        other = self.create_image(tmp_path / "albums" / "b.jpg", b"other image")
+        kept, deleted = store.add(image), store.add(other)
+
+        os.remove(other)
+        collected = []
+        store.on_collect = collected.append
+        assert store.collect_garbage() == (1, len(b"other image"))
+        assert os.path.exists(store.blob_path(kept))
+        assert not os.path.exists(store.blob_path(deleted))
+        assert collected == [deleted]
+
+    def test_migrate(self, tmp_path: Path):
+        store = self.new_store(tmp_path)
+        albums = tmp_path / "albums"
+        self.create_image(albums / "Shared" / "a.jpg")
+        self.create_image(albums / "Shared" / "b" / "a.jpg")
+        self.create_image(albums / "user" / "a.jpg")
+        self.create_image(albums / "user" / "c.jpg", b"other image")
+        self.create_image(albums / "user" / ".partial.download", b"partial")
+
+        assert store.migrate(str(albums)) == {"images": 4, "deduplicated": 2, "savedBytes": 2 * len(b"image")}
+        assert os.stat(albums / "Shared" / "a.jpg").st_nlink == 4
+        assert os.stat(albums / "user" / ".partial.download").st_nlink == 1
+        # Nothing left to deduplicate.
+        assert store.migrate(str(albums)) == {"images": 4, "deduplicated": 0, "savedBytes": 0}
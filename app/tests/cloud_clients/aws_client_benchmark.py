@@ -0,0 +1,85 @@
+"""
+Throughput benchmark of `AWSClient.insert_bulk` against moto.
+
+Moto runs in process, so a fixed latency is added to each S3 request to stand in for the uplink.
+Not collected by pytest, run with:
+```
+python -m app.tests.cloud_clients.aws_client_benchmark [--images 20] [--size-mb 12] [--latency-ms 50]
+```
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import boto3
+from moto import mock_aws
+
+from app.cloud_clients.aws_client import AWSClient, MB
+from app.cloud_clients.cloud_client import Singleton
+
+BUCKET = "benchmark-bucket"
+
+# (max_workers, multipart_threshold, multipart_chunksize, max_concurrency)
+CONFIGS = [
+    (1, 1024 * MB, 8 * MB, 1),
+    (4, 1024 * MB, 8 * MB, 1),
+    (1, 8 * MB, 5 * MB, 4),
+    (4, 8 * MB, 5 * MB, 4),
+    (8, 8 * MB, 5 * MB, 4),
+]
+
+def new_client(max_workers: int, multipart_threshold: int, multipart_chunksize: int, max_concurrency: int, latency: float):
+    # AWSClient is a singleton, forget the previous instance to create one with a different config.
+    Singleton._instances.pop(AWSClient, None)
+    client = AWSClient(
+        BUCKET,
+        max_workers=max_workers,
+        multipart_threshold=multipart_threshold,
+        multipart_chunksize=multipart_chunksize,
+        max_concurrency=max_concurrency
+    )
+    client.transfer_client.meta.events.register('before-send.s3.*', lambda **kwargs: time.sleep(latency))
+    return client
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--images", type=int, default=20)
+    parser.add_argument("--size-mb", type=int, default=12)
+    parser.add_argument("--latency-ms", type=int, default=50)
+    args = parser.parse_args()
+
+    os.environ.setdefault("AWS_ACCESS_KEY_ID", "testing")
+    os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "testing")
+    os.environ.setdefault("AWS_REGION", "us-east-1")
+    os.environ.setdefault("PUSH_QUEUE_ROLE", "arn:aws:iam::000000000000:role/benchmark")
+
+    with tempfile.TemporaryDirectory() as tmp_dir, mock_aws():
+        boto3.client("s3", region_name="us-east-1").create_bucket(Bucket=BUCKET)
+
+        image_paths = []
+        for i in range(args.images):
+            image_path = f"{tmp_dir}/{i}.jpg"
+            with open(image_path, "wb") as f:
+                f.write(os.urandom(args.size_mb * MB))
+            image_paths.append(image_path)
+        total_mb = args.images * args.size_mb
+
+        print(f"{args.images} images of {args.size_mb}MB, {args.latency_ms}ms latency per request")
+        print(f"{'workers':>8} {'threshold':>10} {'chunk':>6} {'parts':>6} {'seconds':>8} {'MB/s':>8}")
+        for max_workers, threshold, chunksize, max_concurrency in CONFIGS:
+            client = new_client(max_workers, threshold, chunksize, max_concurrency, args.latency_ms / 1000)
+            image_keys = [f"albums/benchmark/{max_workers}-{threshold}-{max_concurrency}/{i}.jpg" for i in range(args.images)]
+
+            start = time.perf_counter()
+            _, failure = client.insert_bulk(image_paths, image_keys)
+            elapsed = time.perf_counter() - start
+            client.executor.shutdown()
+
+            print(
+                f"{max_workers:>8} {threshold // MB:>8}MB {chunksize // MB:>4}MB {max_concurrency:>6} "
+                f"{elapsed:>8.2f} {total_mb / elapsed:>8.1f}" + (f"  ({len(failure)} failed)" if failure else "")
+            )
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,16 @@
+import hashlib
 import pytest
 import os
 import boto3
 import json
 from moto import mock_aws
 from pathlib import Path
+from unittest.mock import patch
 
-from app.cloud_clients.aws_client import AWSClient
+from boto3.s3.transfer import TransferConfig
+
+from app.cloud_clients.aws_client import AWSClient, MB
+from app.cloud_clients.exceptions import CloudClientException
 from app.tests import utils
 
 #####
@@ -115,6 +120,11 @@ class TestAWSClient:
         assert len(results) == 4
         assert(set(results) == set(utils.dict_fs_to_list(fs, "albums/test-user/")))
 
+    def test_list_objects(self, fs, aws_client, test_bucket):
+        results = aws_client.list_objects("albums/test-user/")
+        assert set(obj["key"] for obj in results) == set(utils.dict_fs_to_list(fs, "albums/test-user/"))
+        assert all(obj["size"] == 4 and obj["etag"] and '"' not in obj["etag"] for obj in results)
+
     def test_get(self, aws_client, test_bucket):
         result = aws_client.get("albums/test-user/photo1.jpg")
         assert result == b"test"
@@ -123,6 +133,27 @@ class TestAWSClient:
         result = aws_client.get("albums/test-user/nonexistent.jpg")
         assert result == b""
 
+    def test_download(self, aws_client, test_bucket, tmp_path: Path):
+        image_path = tmp_path / "albums" / "test-user" / "photo1.jpg"
+        aws_client.download("albums/test-user/photo1.jpg", str(image_path))
+        assert image_path.read_bytes() == b"test"
+        # Only the image is left, the partial download was renamed.
+        assert os.listdir(image_path.parent) == ["photo1.jpg"]
+
+    def test_download_nonexistent_image(self, aws_client, test_bucket, tmp_path: Path):
+        image_path = tmp_path / "nonexistent.jpg"
+        with pytest.raises(CloudClientException):
+            aws_client.download("albums/test-user/nonexistent.jpg", str(image_path))
+        assert not image_path.exists()
+
+    def test_get_bulk(self, fs, aws_client, test_bucket, tmp_path: Path):
+        image_keys = utils.dict_fs_to_list(fs, "albums/test-user/") + ["albums/test-user/nonexistent.jpg"]
+        success, failure = aws_client.get_bulk([str(tmp_path / key) for key in image_keys], image_keys)
+        assert set(success) == set(image_keys[:-1])
+        assert failure == ["albums/test-user/nonexistent.jpg"]
+        for key in success:
+            assert (tmp_path / key).read_bytes() == b"test"
+
     def test_insert(self, aws_client, test_bucket, tmp_path: Path):
         test_image_path = tmp_path / "new_photo.jpg"
         file_content = b"test"
@@ -165,21 +196,151 @@ class TestAWSClient:
         with pytest.raises(Exception):
             aws_client.move("albums/test-user/nonexistent.jpg", "albums/test-user/should_not_exist.jpg")
 
-    # def test_insert_bulk(self, aws_client, test_bucket, tmp_path: Path):
-        # test_image_paths = []
-        # image_keys = []
-        # file_content = b"test_bulk"
-        # for i in range(5):
-        #     test_image_path = tmp_path / f"bulk_photo_{i}.jpg"
-        #     with open(test_image_path, "wb") as f:
-        #         f.write(file_content)
-        #     test_image_paths.append(str(test_image_path))
-        #     image_keys.append(f"albums/test-user/bulk_photo_{i}.jpg")
-
-        # success, failure = aws_client.insert_bulk(test_image_paths, image_keys)
-        # assert set(success) == set(image_keys)
-        # assert len(failure) == 0
-
-        # for key in image_keys:
-        #     result = aws_client.get(key)
-        #     assert result == file_content
\ No newline at end of file
+    def test_insert_bulk(self, aws_client, test_bucket, tmp_path: Path):
+        test_image_paths = []
+        image_keys = []
+        file_content = b"test_bulk"
+        for i in range(5):
+            test_image_path = tmp_path / f"bulk_photo_{i}.jpg"
+            with open(test_image_path, "wb") as f:
+                f.write(file_content)
+            test_image_paths.append(str(test_image_path))
+            image_keys.append(f"albums/test-user/bulk_photo_{i}.jpg")
+
+        success, failure = aws_client.insert_bulk(test_image_paths, image_keys)
+        assert set(success) == set(image_keys)
+        assert len(failure) == 0
+
+        for key in image_keys:
+            result = aws_client.get(key)
+            assert result == file_content
+
+    def test_insert_bulk_deduplicated(self, aws_client, test_bucket, tmp_path: Path):
+        image_path = tmp_path / "photo.jpg"
+        image_path.write_bytes(b"test_dedup")
+        digest = hashlib.sha256(b"test_dedup").hexdigest()
+        keys = ["albums/test-user/dedup.jpg", "albums/test-user/b/dedup.jpg"]
+
+        with patch.object(aws_client.transfer_client, "upload_file", wraps=aws_client.transfer_client.upload_file) as mock_upload:
+            assert aws_client.insert_bulk([str(image_path)], keys[:1], digests=[digest]) == (keys[:1], [])
+            # Already in the bucket.
+            assert aws_client.insert_bulk([str(image_path)], keys[:1], digests=[digest]) == (keys[:1], [])
+            # Copied from the object with the same content.
+            assert aws_client.insert_bulk([str(image_path)], keys[1:], digests=[digest]) == (keys[1:], [])
+        assert mock_upload.call_count == 1
+
+        for key in keys:
+            assert aws_client.get(key) == b"test_dedup"
+            assert aws_client._object_digest(key) == digest
+
+    def test_insert_bulk_known_digest_replaced(self, aws_client, test_bucket, tmp_path: Path):
+        image_path = tmp_path / "photo.jpg"
+        image_path.write_bytes(b"test_dedup")
+        digest = hashlib.sha256(b"test_dedup").hexdigest()
+        aws_client.insert(str(image_path), "albums/test-user/dedup.jpg", digest)
+        # The object with the content is replaced, so the image can't be copied from it.
+        aws_client.s3_client.put_object(Bucket=os.getenv("S3_BUCKET_NAME"), Key="albums/test-user/dedup.jpg", Body=b"other")
+
+        success, _ = aws_client.insert_bulk([str(image_path)], ["albums/test-user/b/dedup.jpg"], digests=[digest])
+        assert success == ["albums/test-user/b/dedup.jpg"]
+        assert aws_client.get("albums/test-user/b/dedup.jpg") == b"test_dedup"
+
+    def test_insert_multipart(self, aws_client, test_bucket, tmp_path: Path):
+        # S3 parts must be at least 5MB, except the last one.
+        aws_client.transfer_config = TransferConfig(multipart_threshold=5 * MB, multipart_chunksize=5 * MB)
+        test_image_path = tmp_path / "large_photo.jpg"
+        file_content = os.urandom(11 * MB)
+        with open(test_image_path, "wb") as f:
+            f.write(file_content)
+
+        aws_client.insert(str(test_image_path), "albums/test-user/large_photo.jpg")
+        head = aws_client.s3_client.head_object(Bucket=os.getenv("S3_BUCKET_NAME"), Key="albums/test-user/large_photo.jpg")
+        # Multipart uploads have an ETag of the form "<md5 of the part md5s>-<number of parts>".
+        assert head["ETag"].strip('"').endswith("-3")
+        assert head["ContentLength"] == len(file_content)
+
+    def test_delete_bulk(self, aws_client, test_bucket):
+        bucket = os.getenv("S3_BUCKET_NAME")
+        image_keys = [f"albums/test-user/many/{i}.jpg" for i in range(2100)]
+        for key in image_keys:
+            aws_client.s3_client.put_object(Bucket=bucket, Key=key, Body=b"")
+
+        request_sizes = []
+        delete_objects = aws_client.transfer_client.delete_objects
+        def record_delete_objects(**kwargs):
+            request_sizes.append(len(kwargs["Delete"]["Objects"]))
+            return delete_objects(**kwargs)
+
+        with patch.object(aws_client.transfer_client, "delete_objects", side_effect=record_delete_objects):
+            success, failure = aws_client.delete_bulk(image_keys)
+        assert sorted(request_sizes) == [100, 1000, 1000]
+        assert success == image_keys
+        assert failure == []
+        assert aws_client.list_album("albums/test-user/many/") == []
+
+    @patch("app.cloud_clients.aws_client.time.sleep")
+    def test_delete_bulk_retries_errors(self, mock_sleep, aws_client):
+        requests = []
+        def delete_objects(**kwargs):
+            keys = [obj["Key"] for obj in kwargs["Delete"]["Objects"]]
+            requests.append(keys)
+            if len(requests) > 1:
+                return {}
+            return {"Errors": [
+                {"Key": "a.jpg", "Code": "InternalError"},
+                {"Key": "b.jpg", "Code": "AccessDenied"},
+            ]}
+
+        with patch.object(aws_client.transfer_client, "delete_objects", side_effect=delete_objects):
+            success, failure = aws_client.delete_bulk(["a.jpg", "b.jpg", "c.jpg"])
+        # Only the key with a transient error is retried.
+        assert requests == [["a.jpg", "b.jpg", "c.jpg"], ["a.jpg"]]
+        assert success == ["a.jpg", "c.jpg"]
+        assert failure == ["b.jpg"]
+
+    @patch("app.cloud_clients.aws_client.time.sleep")
+    def test_delete_bulk_throttled(self, mock_sleep, aws_client):
+        requests = []
+        def delete_objects(**kwargs):
+            keys = [obj["Key"] for obj in kwargs["Delete"]["Objects"]]
+            requests.append(keys)
+            if len(requests) == 1:
+                return {"Errors": [{"Key": key, "Code": "SlowDown"} for key in keys]}
+            return {}
+
+        with patch.object(aws_client.transfer_client, "delete_objects", side_effect=delete_objects):
+            success, failure = aws_client.delete_bulk([f"{i}.jpg" for i in range(4)])
+        # Retried in smaller requests.
+        assert requests[1:] == [["0.jpg", "1.jpg"], ["2.jpg", "3.jpg"]]
+        assert failure == []
+
+    def test_copy(self, aws_client, test_bucket):
+        aws_client.copy("albums/test-user/photo1.jpg", "albums/test-user/copy.jpg")
+        assert aws_client.get("albums/test-user/photo1.jpg") == b"test"
+        assert aws_client.get("albums/test-user/copy.jpg") == b"test"
+
+    @patch("app.cloud_clients.aws_client.time.sleep")
+    def test_copy_bulk(self, mock_sleep, aws_client, test_bucket):
+        pairs = [
+            ("albums/test-user/photo1.jpg", "albums/test-user/b/photo1.jpg"),
+            ("albums/test-user/nonexistent.jpg", "albums/test-user/b/nonexistent.jpg"),
+        ]
+        success, failure = aws_client.copy_bulk(pairs)
+        assert success == [pairs[0]]
+        assert failure == [pairs[1]]
+        assert aws_client.get("albums/test-user/b/photo1.jpg") == b"test"
+
+    @patch("app.cloud_clients.aws_client.time.sleep")
+    def test_move_bulk(self, mock_sleep, aws_client, test_bucket):
+        pairs = [
+            ("albums/test-user/photo1.jpg", "albums/test-user/b/photo1.jpg"),
+            ("albums/test-user/nonexistent.jpg", "albums/test-user/b/nonexistent.jpg"),
+        ]
+        with patch.object(aws_client, "delete_bulk", wraps=aws_client.delete_bulk) as mock_delete_bulk:
+            success, failure = aws_client.move_bulk(pairs)
+        # The sources are deleted in one batch.
+        mock_delete_bulk.assert_called_once_with(["albums/test-user/photo1.jpg"])
+        assert success == [pairs[0]]
+        assert failure == [pairs[1]]
+        assert aws_client.get("albums/test-user/photo1.jpg") == b""
+        assert aws_client.get("albums/test-user/b/photo1.jpg") == b"test"
@@ -0,0 +1,65 @@
+import time
+from unittest.mock import patch, MagicMock
+
+from app.connectivity import ConnectivityMonitor
+
+@patch("app.connectivity.aws.ping")
+class TestConnectivityMonitor:
+    def test_state_is_cached(self, mock_ping: MagicMock):
+        mock_ping.return_value = True
+        monitor = ConnectivityMonitor({"s3": "s3-url"}, ttl=30)
+        assert monitor.is_online("s3")
+        assert monitor.is_online("s3")
+        mock_ping.assert_called_once()
+        assert mock_ping.call_args.args[0] == "s3-url"
+
+    def test_stale_state_is_probed(self, mock_ping: MagicMock):
+        mock_ping.return_value = True
+        monitor = ConnectivityMonitor({"s3": "s3-url"}, ttl=30)
+        monitor.is_online("s3")
+        monitor.checked_at["s3"] -= 31
+        mock_ping.return_value = False
+        assert not monitor.is_online("s3")
+        assert mock_ping.call_count == 2
+
+    def test_backoff(self, mock_ping: MagicMock):
+        mock_ping.return_value = False
+        monitor = ConnectivityMonitor({"s3": "s3-url"}, ttl=30, max_backoff=5)
+        intervals = []
+        for _ in range(5):
+            monitor.probe("s3")
+            intervals.append(monitor._interval("s3"))
+        assert intervals == [1, 2, 4, 5, 5]
+
+        mock_ping.return_value = True
+        monitor.probe("s3")
+        assert monitor._interval("s3") == 30
+
+    def test_transitions_are_announced(self, mock_ping: MagicMock):
+        listener = MagicMock()
+        monitor = ConnectivityMonitor({"s3": "s3-url", "sqs": "sqs-url"})
+        monitor.subscribe(listener)
+
+        mock_ping.return_value = True
+        monitor.probe("s3")
+        monitor.probe("s3")
+        listener.assert_not_called() # The first probe isn't a transition.
+
+        mock_ping.return_value = False
+        monitor.probe("s3")
+        monitor.probe("s3")
+        mock_ping.return_value = True
+        monitor.probe("s3")
+        assert [call.args for call in listener.call_args_list] == [("s3", False), ("s3", True)]
+
+    def test_background_probing(self, mock_ping: MagicMock):
+        mock_ping.return_value = False
+        monitor = ConnectivityMonitor({"s3": "s3-url"}, ttl=30, max_backoff=1)
+        monitor.start()
+        assert not monitor.is_online("s3")
+
+        mock_ping.return_value = True
+        deadline = time.monotonic() + 5
+        while not monitor.is_online("s3") and time.monotonic() < deadline:
+            time.sleep(0.05)
+        assert monitor.is_online("s3")
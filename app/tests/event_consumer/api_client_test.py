@@ -0,0 +1,102 @@
+import http.server
+import json
+import socketserver
+import threading
+from pathlib import Path
+
+import pytest
+
+from app.event_consumer.api_client import APIClient
+
+class FakeAPIHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1" # Keep-alive
+
+    def do_GET(self):
+        self.respond()
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        self.respond()
+
+    def respond(self):
+        self.server.api.requests.append((self.command, self.path))
+        self.server.api.connections.add(id(self.connection))
+        body = json.dumps({"status": "ok"}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+class FakeAPI:
+    """
+    Serves a minimal API with keep-alive connections in a background thread, recording the requests it receives.
+    """
+    def __init__(self, socket_path: str = ""):
+        self.requests: list[tuple[str, str]] = []
+        self.connections: set[int] = set()
+        if socket_path:
+            self.server = socketserver.ThreadingUnixStreamServer(socket_path, FakeAPIHandler)
+        else:
+            self.server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), FakeAPIHandler)
+        self.server.daemon_threads = True
+        self.server.api = self
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+@pytest.fixture
+def tcp_api():
+    api = FakeAPI()
+    yield api
+    api.stop()
+
+class TestAPIClient:
+    def test_connections_are_reused(self, tcp_api: FakeAPI):
+        client = APIClient(tcp_api.url(), health_ttl=0)
+        for _ in range(5):
+            assert client.is_healthy()
+            assert client.send_events([{"event": "PUT", "path": "albums/Shared/a.jpg"}])
+        assert len(tcp_api.requests) == 10
+        assert len(tcp_api.connections) == 1
+        client.close()
+
+    def test_health_check_is_coalesced(self, tcp_api: FakeAPI):
+        client = APIClient(tcp_api.url(), health_ttl=30)
+        assert client.send_events([])
+        assert client.is_healthy()
+        assert client.send_resync_request()
+        assert client.is_healthy()
+        assert tcp_api.requests == [("POST", "/receive-events"), ("POST", "/resync")]
+        client.close()
+
+    def test_unreachable(self, tcp_api: FakeAPI):
+        client = APIClient(tcp_api.url(), timeout=1)
+        tcp_api.stop()
+        assert not client.send_events([])
+        assert not client.is_healthy()
+        assert client.last_response is None
+        client.close()
+
+    def test_unix_socket(self, tmp_path: Path):
+        socket_path = str(tmp_path / "api.sock")
+        api = FakeAPI(socket_path)
+        try:
+            client = APIClient("http://unused:1", socket_path=socket_path, health_ttl=0)
+            assert client.is_healthy()
+            assert client.send_events([])
+            assert client.send_resync_request()
+            assert api.requests == [("GET", "/health"), ("POST", "/receive-events"), ("POST", "/resync")]
+            assert len(api.connections) == 1
+            client.close()
+        finally:
+            api.stop()
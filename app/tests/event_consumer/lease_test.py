@@ -0,0 +1,103 @@
+from unittest.mock import MagicMock
+
+from app.event_consumer.lease import LeaseManager
+
+def message(msg_id: str, receive_count: int = 1) -> dict:
+    return {"MessageId": msg_id, "ReceiptHandle": f"rh-{msg_id}", "Attributes": {"ApproximateReceiveCount": str(receive_count)}}
+
+class TestLeaseManager:
+    def test_expiring_leases_are_extended(self):
+        consumer = MagicMock()
+        consumer.change_visibility.return_value = {}
+        leases = LeaseManager(consumer, min_timeout=10)
+        leases.acquire([message("1"), message("2")], 10)
+
+        leases.extend_expiring()
+        consumer.change_visibility.assert_not_called() # Most of the timeout is left.
+
+        leases.leases["1"]["expiresAt"] -= 8
+        leases.extend_expiring()
+        consumer.change_visibility.assert_called_once_with({"1": "rh-1"}, 10)
+        assert leases.metrics()["extended"] == 1
+
+    def test_released_leases_are_not_extended(self):
+        consumer = MagicMock()
+        leases = LeaseManager(consumer)
+        leases.acquire([message("1")], 10)
+        leases.release(["1"])
+        leases.extend_expiring()
+        consumer.change_visibility.assert_not_called()
+
+    def test_lost_lease(self):
+        consumer = MagicMock()
+        consumer.change_visibility.return_value = {"1": "rh-1"}
+        leases = LeaseManager(consumer)
+        leases.acquire([message("1")], 10)
+        leases.leases["1"]["expiresAt"] -= 10
+        leases.extend_expiring()
+        assert "1" not in leases.leases
+        assert leases.metrics()["lost"] == 1
+
+    def test_failed_request_is_retried(self):
+        consumer = MagicMock()
+        consumer.change_visibility.side_effect = Exception("Network error")
+        leases = LeaseManager(consumer)
+        leases.acquire([message("1")], 10)
+        leases.leases["1"]["expiresAt"] -= 10
+        try:
+            leases.extend_expiring()
+        except Exception:
+            pass
+        assert "1" in leases.leases
+
+    def test_adaptive_timeout(self):
+        leases = LeaseManager(MagicMock(), min_timeout=10, max_timeout=60, smoothing=0.5)
+        assert leases.visibility_timeout() == 10
+
+        leases.acquire([message("1")], 10)
+        leases.leases["1"]["receivedAt"] -= 20
+        leases.delivered(["1"])
+        assert 40 <= leases.visibility_timeout() <= 41 # Twice the delivery time.
+
+        leases.acquire([message("2")], 40)
+        leases.leases["2"]["receivedAt"] -= 100
+        leases.delivered(["2"])
+        assert leases.visibility_timeout() == 60 # Capped.
+
+    def test_redelivery_rate(self):
+        leases = LeaseManager(MagicMock())
+        leases.acquire([message("1"), message("2", receive_count=2), message("3"), message("4", receive_count=3)], 10)
+        metrics = leases.metrics()
+        assert metrics["received"] == 4
+        assert metrics["redelivered"] == 2
+        assert metrics["redeliveryRate"] == 0.5
+
+    def test_delivery_timeout(self):
+        leases = LeaseManager(MagicMock(), min_timeout=10, max_timeout=300)
+        leases.acquire([message("1")], 10)
+        leases.leases["1"]["receivedAt"] -= 100
+        leases.acquire([message("2")], 10)
+        # What's left of the max timeout since the first message was received.
+        assert 199 < leases.delivery_timeout(["1", "2"]) <= 200
+        leases.leases["1"]["receivedAt"] -= 1000
+        assert leases.delivery_timeout(["1"]) == 10
+        assert leases.delivery_timeout(["unknown"]) == 300
+
+    def test_abandoned_leases_are_visible_again(self):
+        consumer = MagicMock()
+        leases = LeaseManager(consumer, min_timeout=10, max_timeout=300)
+        leases.acquire([message(str(i)) for i in range(12)], 60)
+        leases.abandon([str(i) for i in range(11)])
+        assert list(leases.leases) == ["11"]
+        assert [call.args for call in consumer.change_visibility.call_args_list] == [
+            ({str(i): f"rh-{i}" for i in range(10)}, 10), ({"10": "rh-10"}, 10)
+        ]
+
+    def test_abandoned_leases_back_off(self):
+        consumer = MagicMock()
+        leases = LeaseManager(consumer, min_timeout=10, max_timeout=300)
+        leases.acquire([message("1", 2), message("2", 3), message("3", 3), message("4", 10)], 60)
+        leases.abandon(["1", "2", "3", "4"])
+        assert [call.args for call in consumer.change_visibility.call_args_list] == [
+            ({"1": "rh-1"}, 20), ({"2": "rh-2", "3": "rh-3"}, 40), ({"4": "rh-4"}, 300)
+        ]
@@ -0,0 +1,183 @@
+import json
+import threading
+from pathlib import Path
+from unittest.mock import patch, MagicMock
+
+from app.config import config
+from app.event_consumer.consumer import SQSQueueConsumer
+from app.event_consumer.lease import LeaseManager
+from app.event_consumer.pipeline import ConsumerPipeline
+from app.utils import offline
+
+def sqs_message(msg_id: str, events: list[dict]) -> dict:
+    return {
+        "MessageId": msg_id,
+        "ReceiptHandle": f"rh-{msg_id}",
+        "Body": json.dumps({"Message": json.dumps({"events": events})})
+    }
+
+class FakeQueueConsumer:
+    """
+    Serves the given responses to the pollers, then empty responses.
+    """
+    def __init__(self, responses: list[list[dict]]):
+        self.responses = list(responses)
+        self.received = 0
+        self.deleted: list[dict[str, str]] = []
+        # Visibility timeout changes, (message id -> receipt handle, timeout).
+        self.visibility: list[tuple[dict[str, str], int]] = []
+        self.lock = threading.Lock()
+
+    def receive_messages(self, visibility_timeout=None):
+        with self.lock:
+            self.received += 1
+            if self.responses:
+                return {"Messages": self.responses.pop(0)}
+        threading.Event().wait(0.01) # Long poll of an empty queue.
+        return {}
+
+    def delete_messages(self, id_to_receipt_handles, max_retries=2):
+        self.deleted.append(dict(id_to_receipt_handles))
+        return {}
+
+    def change_visibility(self, id_to_receipt_handles, visibility_timeout):
+        self.visibility.append((dict(id_to_receipt_handles), visibility_timeout))
+        return {}
+
+@patch("app.event_consumer.pipeline.connectivity_monitor")
+class TestConsumerPipeline:
+    def setup(self, tmp_path: Path):
+        config.load_config({
+            "paths": {"last_poll_file": str(tmp_path / "last_poll.txt")},
+            "queue": {"retention_days": 4},
+        })
+        offline.write_poll_time()
+
+    def run(self, pipeline: ConsumerPipeline, until):
+        pipeline.start()
+        deadline = threading.Event()
+        for _ in range(200):
+            if until():
+                break
+            deadline.wait(0.02)
+        pipeline.stop()
+
+    def test_messages_are_delivered_and_deleted(self, mock_monitor, tmp_path: Path):
+        self.setup(tmp_path)
+        consumer = FakeQueueConsumer([
+            [sqs_message("1", [{"event": "PUT", "path": "a"}]), sqs_message("2", [{"event": "PUT", "path": "b"}])],
+            [sqs_message("3", [{"event": "DELETE", "path": "c"}])],
+        ])
+        api = MagicMock()
+        api.is_healthy.return_value = True
+        api.send_events.return_value = True
+        pipeline = ConsumerPipeline(consumer, api, pollers=2, delete_interval=0.05)
+
+        self.run(pipeline, lambda: sum(len(d) for d in consumer.deleted) == 3)
+        delivered = [event["path"] for call in api.send_events.call_args_list for event in call.args[0]]
+        assert sorted(delivered) == ["a", "b", "c"]
+        deleted = {msg_id: rh for batch in consumer.deleted for msg_id, rh in batch.items()}
+        assert deleted == {"1": "rh-1", "2": "rh-2", "3": "rh-3"}
+        assert pipeline.leases.leases == {} # Released once deleted.
+        assert pipeline.leases.metrics()["delivered"] == 3
+
+    def test_failed_delivery_is_not_deleted(self, mock_monitor, tmp_path: Path):
+        self.setup(tmp_path)
+        consumer = FakeQueueConsumer([[sqs_message("1", [{"event": "PUT", "path": "a"}])]])
+        api = MagicMock()
+        api.is_healthy.return_value = True
+        api.send_events.return_value = False
+        pipeline = ConsumerPipeline(consumer, api, pollers=1, delete_interval=0.05)
+
+        self.run(pipeline, lambda: consumer.visibility)
+        assert consumer.deleted == []
+        # Received again after the retry timeout, and not leased anymore.
+        assert consumer.visibility == [({"1": "rh-1"}, pipeline.leases.min_timeout)]
+        assert pipeline.leases.leases == {}
+
+    def test_delivery_timeout_follows_the_leases(self, mock_monitor, tmp_path: Path):
+        self.setup(tmp_path)
+        consumer = FakeQueueConsumer([[sqs_message("1", [{"event": "PUT", "path": "a"}])]])
+        api = MagicMock()
+        api.is_healthy.return_value = True
+        api.send_events.return_value = True
+        pipeline = ConsumerPipeline(consumer, api, LeaseManager(consumer, max_timeout=300), pollers=1, delete_interval=0.05)
+
+        self.run(pipeline, lambda: consumer.deleted)
+        # Longer than the API client's timeout, the leases are extended while the events are delivered.
+        assert 290 < api.send_events.call_args.args[1] <= 300
+
+    def test_malformed_message_is_skipped(self, mock_monitor, tmp_path: Path):
+        self.setup(tmp_path)
+        malformed = {"MessageId": "1", "ReceiptHandle": "rh-1", "Body": "not json"}
+        consumer = FakeQueueConsumer([
+            [malformed, sqs_message("2", [{"event": "PUT", "path": "a"}])],
+            [sqs_message("3", [{"event": "PUT", "path": "b"}])],
+        ])
+        api = MagicMock()
+        api.is_healthy.return_value = True
+        api.send_events.return_value = True
+        pipeline = ConsumerPipeline(consumer, api, pollers=1, delete_interval=0.05)
+
+        # The poller keeps polling after the malformed message.
+        self.run(pipeline, lambda: sum(len(d) for d in consumer.deleted) == 3)
+        deleted = {msg_id for batch in consumer.deleted for msg_id in batch}
+        # Dropped from the queue, so it doesn't block its message group.
+        assert deleted == {"1", "2", "3"}
+        assert "1" not in pipeline.leases.leases
+        assert [events for (events, timeout), _ in api.send_events.call_args_list] == [
+            [{"event": "PUT", "path": "a"}], [{"event": "PUT", "path": "b"}]
+        ]
+
+    def test_backpressure(self, mock_monitor, tmp_path: Path):
+        self.setup(tmp_path)
+        consumer = FakeQueueConsumer([[sqs_message(str(i), [{"event": "PUT", "path": str(i)}])] for i in range(20)])
+        api = MagicMock()
+        api.is_healthy.return_value = True
+        release = threading.Event()
+        api.send_events.side_effect = lambda events, timeout: release.wait() or True
+        pipeline = ConsumerPipeline(consumer, api, pollers=2, max_pending_batches=2, delete_interval=0.05)
+
+        pipeline.start()
+        threading.Event().wait(0.3)
+        # 1 batch in delivery, 2 waiting in the queue, and 1 batch per poller waiting to be queued.
+        assert consumer.received <= 5
+        release.set()
+        for _ in range(200):
+            if sum(len(d) for d in consumer.deleted) == 20:
+                break
+            threading.Event().wait(0.02)
+        pipeline.stop()
+        assert sum(len(d) for d in consumer.deleted) == 20
+        # The batches that piled up were sent together.
+        assert api.send_events.call_count < 20
+
+    def test_unhealthy_api_is_not_polled(self, mock_monitor, tmp_path: Path):
+        self.setup(tmp_path)
+        consumer = FakeQueueConsumer([])
+        api = MagicMock()
+        api.is_healthy.return_value = False
+        pipeline = ConsumerPipeline(consumer, api, pollers=1, delete_interval=0.05)
+
+        self.run(pipeline, lambda: api.is_healthy.called)
+        assert consumer.received == 0
+
+class TestSQSQueueConsumer:
+    @patch("app.event_consumer.consumer.time.sleep")
+    @patch("app.event_consumer.consumer.boto3.client")
+    def test_delete_messages_does_not_sleep_after_success(self, mock_client, mock_sleep):
+        consumer = SQSQueueConsumer()
+        consumer.sqs_client.delete_message_batch.return_value = {"Successful": [{"Id": "1"}, {"Id": "2"}]}
+        assert consumer.delete_messages({"1": "rh-1", "2": "rh-2"}) == {}
+        mock_sleep.assert_not_called()
+
+    @patch("app.event_consumer.consumer.time.sleep")
+    @patch("app.event_consumer.consumer.boto3.client")
+    def test_delete_messages_retries_failures(self, mock_client, mock_sleep):
+        consumer = SQSQueueConsumer()
+        consumer.sqs_client.delete_message_batch.side_effect = [
+            {"Successful": [{"Id": "1"}], "Failed": [{"Id": "2"}]},
+            {"Successful": [{"Id": "2"}]},
+        ]
+        assert consumer.delete_messages({"1": "rh-1", "2": "rh-2"}) == {}
+        assert mock_sleep.call_count == 1
@@ -0,0 +1,109 @@
+import json
+import os
+from pathlib import Path
+from unittest.mock import patch, MagicMock
+
+from app.config import config
+from app.ingest import IngestQueue
+
+@patch("app.ingest.utils.rotate_jpgs")
+@patch("app.ingest.blob_store")
+@patch("app.ingest.thumbnail_cache")
+@patch("app.ingest.album_index")
+@patch("app.ingest.event_announcer")
+@patch("app.ingest.cloud_client")
+@patch("app.ingest.connectivity_monitor")
+class TestIngestQueue:
+    def setup(self, tmp_path: Path):
+        config.load_config({
+            "paths": {
+                "base_dir": str(tmp_path / "base"),
+                "offline_events_file": str(tmp_path / "events.csv"),
+            },
+            "processing": {"max_workers": 2},
+            "thumbnails": {"generate_on_upload": False},
+        })
+        return IngestQueue(str(tmp_path / "jobs"), str(tmp_path / "staging"))
+
+    def stage(self, ingest: IngestQueue, files: dict[str, str]):
+        """
+        files: Dict[guid: image name], staged for the album "Shared".
+        """
+        job_id = ingest.new_job()
+        staged = []
+        for guid, image_name in files.items():
+            Path(ingest.get_staging_dir(job_id), image_name).write_bytes(b"image")
+            staged.append({"guid": guid, "albumPath": "Shared", "imageName": image_name})
+        return job_id, staged
+
+    def announced(self, mock_announcer: MagicMock):
+        return [e for call in mock_announcer().announce.call_args_list for e in json.loads(call.args[0])["events"]]
+
+    def test_submit_writes_job(self, mock_monitor, mock_cloud, mock_announcer, mock_index, mock_thumbnails, mock_blobs, mock_rotate, tmp_path: Path):
+        ingest = self.setup(tmp_path)
+        job_id, staged = self.stage(ingest, {"g1": "a.png"})
+        ingest.submit(job_id, staged)
+
+        with open(tmp_path / "jobs" / f"{job_id}.json") as f:
+            job = json.load(f)
+        assert job["id"] == job_id
+        assert job["files"] == [{"guid": "g1", "albumPath": "Shared", "imageName": "a.png", "status": "pending"}]
+        assert ingest.queue.get_nowait() == job_id
+
+    def test_process(self, mock_monitor, mock_cloud, mock_announcer, mock_index, mock_thumbnails, mock_blobs, mock_rotate, tmp_path: Path):
+        ingest = self.setup(tmp_path)
+        mock_cloud().insert_bulk.return_value = (["albums/Shared/a.jpg"], ["albums/Shared/b.png"])
+        job_id, staged = self.stage(ingest, {"g1": "a.jpg", "g2": "b.png"})
+        ingest.submit(job_id, staged)
+        ingest._process(ingest._load_job(ingest.queue.get_nowait()))
+
+        albums_dir = tmp_path / "base" / "albums" / "Shared"
+        assert sorted(os.listdir(albums_dir)) == ["a.jpg", "b.png"]
+        mock_rotate.assert_called_once_with([str(albums_dir / "a.jpg")], 2)
+        assert mock_index().add.call_count == 2
+
+        events = self.announced(mock_announcer)
+        assert {"event": "UPLOAD", "jobId": job_id, "guid": "g1", "status": "saved", "path": "albums/Shared/a.jpg"} in events
+        assert {"event": "UPLOAD", "jobId": job_id, "guid": "g2", "status": "failed"} in events
+        assert events[-1] == {"event": "UPLOAD", "jobId": job_id, "status": "complete", "failed": ["g2"]}
+
+        # The job and its staging directory are removed once it's done.
+        assert os.listdir(tmp_path / "jobs") == []
+        assert not os.path.exists(ingest.get_staging_dir(job_id))
+
+    def test_process_offline(self, mock_monitor, mock_cloud, mock_announcer, mock_index, mock_thumbnails, mock_blobs, mock_rotate, tmp_path: Path):
+        ingest = self.setup(tmp_path)
+        mock_monitor().is_online.return_value = False
+        job_id, staged = self.stage(ingest, {"g1": "a.png"})
+        ingest.submit(job_id, staged)
+        ingest._process(ingest._load_job(ingest.queue.get_nowait()))
+
+        mock_cloud().insert_bulk.assert_not_called()
+        with open(tmp_path / "events.csv") as f:
+            assert f.read().strip().endswith(f",PUT,{tmp_path}/base/albums/Shared/a.png")
+        assert self.announced(mock_announcer)[-1]["failed"] == []
+
+    def test_resume(self, mock_monitor, mock_cloud, mock_announcer, mock_index, mock_thumbnails, mock_blobs, mock_rotate, tmp_path: Path):
+        ingest = self.setup(tmp_path)
+        mock_cloud().insert_bulk.return_value = (["albums/Shared/a.png", "albums/Shared/b.png"], [])
+        job_id, staged = self.stage(ingest, {"g1": "a.png", "g2": "b.png"})
+        ingest.submit(job_id, staged)
+
+        # Simulate a restart after the first image was saved.
+        albums_dir = tmp_path / "base" / "albums" / "Shared"
+        os.makedirs(albums_dir)
+        os.replace(Path(ingest.get_staging_dir(job_id), "a.png"), albums_dir / "a.png")
+        job = ingest._load_job(job_id)
+        job["files"][0].update({"status": "saved", "path": str(albums_dir / "a.png")})
+        ingest._save_job(job)
+
+        resumed = IngestQueue(str(tmp_path / "jobs"), str(tmp_path / "staging"))
+        with patch.object(resumed, "_run"):
+            resumed.start()
+        assert resumed.queue.get_nowait() == job_id
+        resumed._process(resumed._load_job(job_id))
+
+        assert sorted(os.listdir(albums_dir)) == ["a.png", "b.png"]
+        paths, keys = mock_cloud().insert_bulk.call_args.args
+        assert sorted(keys) == ["albums/Shared/a.png", "albums/Shared/b.png"]
+        assert self.announced(mock_announcer)[-1]["failed"] == []
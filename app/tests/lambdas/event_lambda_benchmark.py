@@ -0,0 +1,107 @@
+"""
+Benchmark of the event Lambda publishing to SNS, driven by synthetic SQS records against a stubbed SNS client.
+
+Each SNS request sleeps for a fixed latency. Compares the batching publisher with publishing one message per group
+of each record, as the Lambda used to.
+Not collected by pytest, run with:
+```
+python -m app.tests.lambdas.event_lambda_benchmark [--records 10] [--events 20] [--senders 3] [--latency-ms 20]
+```
+"""
+import argparse
+import json
+import os
+import random
+import time
+
+from app.tests.lambdas.event_lambda_test import load_event_lambda
+
+event_lambda = load_event_lambda()
+
+class StubSNS:
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.requests = 0
+        self.messages = 0
+
+    def publish(self, **kwargs):
+        time.sleep(self.latency)
+        self.requests += 1
+        self.messages += 1
+        return {'MessageId': str(self.messages)}
+
+    def publish_batch(self, TopicArn: str, PublishBatchRequestEntries: list[dict]):
+        time.sleep(self.latency)
+        self.requests += 1
+        self.messages += len(PublishBatchRequestEntries)
+        return {'Successful': [{'Id': entry['Id']} for entry in PublishBatchRequestEntries], 'Failed': []}
+
+def publish_per_record(sns, event: dict):
+    """
+    The Lambda before batching: one publish per group of each record.
+    """
+    for record in event['Records']:
+        payload = json.loads(record['body'])
+        messages_by_group = {}
+        for evt in payload['events']:
+            messages_by_group.setdefault(event_lambda.get_message_group_id(evt), []).append(event_lambda.process_event(evt))
+        for message_group_id, messages in messages_by_group.items():
+            sns.publish(
+                TopicArn=os.environ['SNS_TOPIC_ARN'],
+                Message=json.dumps({'events': messages}),
+                MessageGroupId=message_group_id,
+                MessageAttributes={
+                    'messageGroupId': {'DataType': 'String', 'StringValue': message_group_id},
+                    'sender': {'DataType': 'String', 'StringValue': payload['sender']}
+                }
+            )
+
+def synthetic_records(rng: random.Random, records: int, events: int, senders: int) -> dict:
+    """
+    Upload bursts from several frames: each record is a batch of events from one sender, mostly to Shared.
+    """
+    result = []
+    for _ in range(records):
+        sender = f"frame{rng.randrange(senders)}"
+        albums = ["Shared", "Shared", "Shared", sender]
+        result.append({'body': json.dumps({
+            'events': [
+                {'event': 'PUT', 'path': f"albums/{rng.choice(albums)}/{rng.getrandbits(64):016x}.jpg"}
+                for _ in range(events)
+            ],
+            'sender': sender
+        })})
+    return {'Records': result}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--records", type=int, default=10)
+    parser.add_argument("--events", type=int, default=20)
+    parser.add_argument("--senders", type=int, default=3)
+    parser.add_argument("--invocations", type=int, default=20)
+    parser.add_argument("--latency-ms", type=int, default=20)
+    args = parser.parse_args()
+    os.environ.setdefault('SNS_TOPIC_ARN', 'arn:aws:sns:us-east-1:000000000000:benchmark.fifo')
+
+    rng = random.Random(0)
+    invocations = [synthetic_records(rng, args.records, args.events, args.senders) for _ in range(args.invocations)]
+    print(
+        f"{args.invocations} invocations of {args.records} records x {args.events} events from {args.senders} senders, "
+        f"{args.latency_ms}ms latency per request"
+    )
+    print(f"{'publisher':>10} {'requests':>9} {'messages':>9} {'seconds':>8} {'ms/invocation':>14}")
+
+    for name in ["per-record", "batched"]:
+        sns = StubSNS(args.latency_ms / 1000)
+        event_lambda._sns_client = sns
+        start = time.perf_counter()
+        for event in invocations:
+            if name == "per-record":
+                publish_per_record(sns, event)
+            else:
+                event_lambda.lambda_handler(event, None)
+        elapsed = time.perf_counter() - start
+        print(f"{name:>10} {sns.requests:>9} {sns.messages:>9} {elapsed:>8.2f} {elapsed * 1000 / args.invocations:>14.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+import importlib.util
+import json
+from pathlib import Path
+
+import pytest
+
+LAMBDA_PATH = Path(__file__).parents[3] / "admin" / "aws" / "lambdas" / "event_lambda" / "main.py"
+
+def load_event_lambda():
+    """
+    The Lambda isn't part of the app package, load it from its source file.
+    """
+    spec = importlib.util.spec_from_file_location("event_lambda", LAMBDA_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+event_lambda = load_event_lambda()
+
+class FakeSNS:
+    """
+    Records the published messages, checking the SNS batch limits.
+    """
+    def __init__(self, fail_ids: set[str] | None = None):
+        self.batches: list[list[dict]] = []
+        self.fail_ids = set(fail_ids or [])
+
+    def publish_batch(self, TopicArn: str, PublishBatchRequestEntries: list[dict]):
+        entries = PublishBatchRequestEntries
+        assert len(entries) <= event_lambda.MAX_BATCH_ENTRIES
+        assert sum(len(entry['Message'].encode()) for entry in entries) <= event_lambda.MAX_MESSAGE_BYTES
+        assert len({entry['Id'] for entry in entries}) == len(entries)
+        self.batches.append(entries)
+        failed_ids, self.fail_ids = self.fail_ids, set()
+        return {
+            'Successful': [{'Id': entry['Id']} for entry in entries if entry['Id'] not in failed_ids],
+            'Failed': [{'Id': entry['Id']} for entry in entries if entry['Id'] in failed_ids]
+        }
+
+    def published(self) -> list[tuple[str, str, list[str]]]:
+        """
+        (group, sender, paths) of each published message.
+        """
+        return [
+            (
+                entry['MessageGroupId'],
+                entry['MessageAttributes']['sender']['StringValue'],
+                [evt['path'] for evt in json.loads(entry['Message'])['events']]
+            )
+            for batch in self.batches for entry in batch
+        ]
+
+def record(sender: str, *paths: str) -> dict:
+    return {'body': json.dumps({'events': [{'event': 'PUT', 'path': path} for path in paths], 'sender': sender})}
+
+@pytest.fixture
+def sns(monkeypatch):
+    fake = FakeSNS()
+    monkeypatch.setenv('SNS_TOPIC_ARN', 'arn:aws:sns:us-east-1:000000000000:topic.fifo')
+    monkeypatch.setattr(event_lambda, '_sns_client', fake)
+    return fake
+
+class TestEventLambda:
+    def test_records_are_merged_by_group_and_sender(self, sns: FakeSNS):
+        event_lambda.lambda_handler({'Records': [
+            record('alice', 'albums/Shared/1.jpg', 'albums/alice/2.jpg'),
+            record('alice', 'albums/Shared/3.jpg'),
+            record('bob', 'albums/Shared/4.jpg'),
+        ]}, None)
+        assert len(sns.batches) == 1
+        assert sns.published() == [
+            ('Shared', 'alice', ['albums/Shared/1.jpg', 'albums/Shared/3.jpg']),
+            ('alice', 'alice', ['albums/alice/2.jpg']),
+            ('Shared', 'bob', ['albums/Shared/4.jpg']),
+        ]
+
+    def test_group_order_is_kept(self, sns: FakeSNS):
+        event_lambda.lambda_handler({'Records': [
+            record('alice', 'albums/Shared/1.jpg'),
+            record('bob', 'albums/Shared/2.jpg'),
+            record('alice', 'albums/Shared/3.jpg', 'albums/alice/4.jpg'),
+            record('alice', 'albums/Shared/5.jpg'),
+        ]}, None)
+        # alice's events of the Shared group aren't merged across bob's.
+        assert sns.published() == [
+            ('Shared', 'alice', ['albums/Shared/1.jpg']),
+            ('Shared', 'bob', ['albums/Shared/2.jpg']),
+            ('Shared', 'alice', ['albums/Shared/3.jpg', 'albums/Shared/5.jpg']),
+            ('alice', 'alice', ['albums/alice/4.jpg']),
+        ]
+
+    def test_events_are_stamped(self, sns: FakeSNS):
+        event_lambda.lambda_handler({'Records': [record('alice', 'albums/Shared/1.jpg')]}, None)
+        message = json.loads(sns.batches[0][0]['Message'])['events'][0]
+        assert message['id']
+        assert message['timestamp']
+
+    def test_invalid_record_is_skipped(self, sns: FakeSNS):
+        event_lambda.lambda_handler({'Records': [
+            {'body': 'not json'},
+            {'body': json.dumps({'events': [{'event': 'PUT'}], 'sender': 'alice'})},
+            record('alice', 'albums/Shared/1.jpg'),
+        ]}, None)
+        assert sns.published() == [('Shared', 'alice', ['albums/Shared/1.jpg'])]
+
+    def test_batches_are_split(self, sns: FakeSNS):
+        event_lambda.lambda_handler({'Records': [record(f'user{i}', 'albums/Shared/1.jpg') for i in range(25)]}, None)
+        assert [len(batch) for batch in sns.batches] == [10, 10, 5]
+
+    def test_large_groups_are_split(self, sns: FakeSNS):
+        paths = [f'albums/Shared/{i:05d}-{"x" * 200}.jpg' for i in range(3000)]
+        event_lambda.lambda_handler({'Records': [record('alice', *paths)]}, None)
+        published = sns.published()
+        assert len(published) > 1
+        assert [path for _, _, message_paths in published for path in message_paths] == paths
+        for batch in sns.batches:
+            for entry in batch:
+                assert len(entry['Message'].encode()) <= event_lambda.MAX_MESSAGE_BYTES
+
+    def test_failed_entries_are_retried(self, sns: FakeSNS):
+        sns.fail_ids = {'1'}
+        event_lambda.lambda_handler({'Records': [record('alice', 'albums/Shared/1.jpg'), record('bob', 'albums/Shared/2.jpg')]}, None)
+        assert [len(batch) for batch in sns.batches] == [2, 1]
+        assert sns.batches[1][0]['MessageAttributes']['sender']['StringValue'] == 'bob'
@@ -0,0 +1,60 @@
+"""
+Benchmark of reshuffling the slideshow, on a synthetic album of empty images.
+
+Compares walking the album and sorting by `os.path.getmtime` before shuffling, as `set_image_order` used to, with
+shuffling the precomputed playlist in place.
+Not collected by pytest, run with:
+```
+python -m app.tests.playlist_benchmark [--images 50000] [--albums 100] [--shuffles 10]
+```
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+
+from app.playlist import Playlist
+
+def walk_and_shuffle(album: str) -> list[str]:
+    """
+    `set_image_order` before the playlist.
+    """
+    file_names = []
+    for root, dirs, files in os.walk(album):
+        file_names.extend(sorted([os.path.join(root, file) for file in files], key=os.path.getmtime))
+    random.shuffle(file_names)
+    return file_names
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--images", type=int, default=50_000)
+    parser.add_argument("--albums", type=int, default=100)
+    parser.add_argument("--shuffles", type=int, default=10)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        album = f"{tmp_dir}/albums/Shared"
+        for i in range(args.images):
+            path = f"{album}/{i % args.albums}/{i}.jpg"
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            open(path, 'w').close()
+
+        playlist = Playlist()
+        start = time.perf_counter()
+        playlist.set_album(album, True)
+        print(f"{args.images} images in {args.albums} albums, playlist built in {time.perf_counter() - start:.2f}s")
+        print(f"{'method':>10} {'ms/shuffle':>11}")
+
+        for name in ["walk", "playlist"]:
+            start = time.perf_counter()
+            for seed in range(args.shuffles):
+                if name == "walk":
+                    walk_and_shuffle(album)
+                else:
+                    playlist.shuffle(seed)
+            elapsed = time.perf_counter() - start
+            print(f"{name:>10} {elapsed * 1000 / args.shuffles:>11.1f}")
+
+if __name__ == "__main__":
+    main()
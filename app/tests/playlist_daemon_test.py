@@ -0,0 +1,122 @@
+import os
+import threading
+from pathlib import Path
+from unittest.mock import MagicMock
+
+from app.playlist import Playlist
+from app.playlist_daemon import PlaylistDaemon
+
+class TestPlaylistDaemon:
+    def create_images(self, album: Path, names: list[str]) -> list[str]:
+        paths = []
+        for i, name in enumerate(names):
+            path = album / name
+            os.makedirs(path.parent, exist_ok=True)
+            path.write_bytes(b"")
+            os.utime(path, ns=(i * 1_000_000_000, i * 1_000_000_000))
+            paths.append(str(path))
+        return paths
+
+    def new_daemon(self, tmp_path: Path, on_change=None, batch_delay: float = 0.05, max_batch_delay: float = 1):
+        album = tmp_path / "albums" / "Shared"
+        os.makedirs(album, exist_ok=True)
+        order = Playlist(str(tmp_path / "playlist.json"))
+        order.set_album(str(album), True)
+        return PlaylistDaemon(
+            str(album), order, str(tmp_path / "active_slideshow.txt"), on_change or MagicMock(),
+            batch_delay, max_batch_delay
+        )
+
+    def test_apply(self, tmp_path: Path):
+        daemon = self.new_daemon(tmp_path)
+        album = tmp_path / "albums" / "Shared"
+        a, b = self.create_images(album, ["a.jpg", "b.jpg"])
+        moved = self.create_images(album, ["sub/c.jpg", "sub/d.jpg"])
+
+        assert daemon.apply([
+            ("CREATE", a),
+            ("CREATE", str(album / ".a.jpg.download")),
+            ("CLOSE_WRITE,CLOSE", a),
+            ("MOVED_TO", b),
+            ("MOVED_TO,ISDIR", str(album / "sub")),
+            ("DELETE", a)
+        ])
+        assert daemon.order.images() == [b, *moved]
+
+        assert daemon.apply([("DELETE,ISDIR", str(album / "sub"))])
+        assert daemon.order.images() == [b]
+
+    def test_apply_ignores_unrelated_events(self, tmp_path: Path):
+        daemon = self.new_daemon(tmp_path)
+        daemon.order.write(daemon.playlist_file)
+        album = tmp_path / "albums" / "Shared"
+        assert not daemon.apply([("CREATE", str(album / ".tmp.copy")), ("DELETE_SELF", str(album))])
+
+    def test_apply_without_changes(self, tmp_path: Path):
+        daemon = self.new_daemon(tmp_path)
+        album = tmp_path / "albums" / "Shared"
+        a, = self.create_images(album, ["a.jpg"])
+        outside, = self.create_images(tmp_path / "albums" / "Other", ["b.jpg"])
+        assert daemon.apply([("CREATE", a)])
+        daemon.order.write(daemon.playlist_file)
+
+        # Already in the playlist, or not in its album.
+        assert not daemon.apply([("CREATE", a), ("CREATE", outside), ("CLOSE_WRITE,CLOSE", outside)])
+        assert not daemon.apply([("DELETE", str(album / "missing.jpg")), ("DELETE,ISDIR", str(album / "empty"))])
+        # The content of an image of the playlist changed.
+        assert daemon.apply([("CLOSE_WRITE,CLOSE", a)])
+
+    def test_apply_after_album_index(self, tmp_path: Path):
+        daemon = self.new_daemon(tmp_path)
+        album = tmp_path / "albums" / "Shared"
+        a, b = self.create_images(album, ["a.jpg", "b.jpg"])
+        daemon.order.add(a)
+        daemon.order.write(daemon.playlist_file)
+
+        # The album index already updated the playlist, the file still has to be rewritten.
+        daemon.order.add(b)
+        assert daemon.apply([("MOVED_TO", b)])
+        daemon.order.write(daemon.playlist_file)
+        daemon.order.remove(a)
+        assert daemon.apply([("DELETE", a)])
+        daemon.order.write(daemon.playlist_file)
+        assert not daemon.apply([("DELETE", a)])
+
+    def test_apply_without_album(self, tmp_path: Path):
+        album = tmp_path / "albums" / "Shared"
+        a, = self.create_images(album, ["a.jpg"])
+        daemon = PlaylistDaemon(str(album), Playlist(), str(tmp_path / "active_slideshow.txt"), MagicMock())
+        daemon.order.write(daemon.playlist_file)
+        assert not daemon.apply([("CREATE", a)])
+
+    def test_batches(self, tmp_path: Path):
+        changed = threading.Event()
+        daemon = self.new_daemon(tmp_path, on_change=changed.set)
+        album = tmp_path / "albums" / "Shared"
+        paths = self.create_images(album, [f"{i}.jpg" for i in range(50)])
+
+        thread = threading.Thread(target=daemon._run, daemon=True)
+        thread.start()
+        for path in paths:
+            daemon.events.put(("CREATE", path))
+        for path in paths[:10]:
+            daemon.events.put(("DELETE", path))
+        assert changed.wait(5)
+
+        with open(tmp_path / "active_slideshow.txt") as f:
+            assert f.read().split('\n') == paths[10:]
+        assert Playlist(str(tmp_path / "playlist.json")).load()
+        daemon.stop()
+        thread.join()
+
+    def test_batch_ends_after_max_delay(self, tmp_path: Path):
+        daemon = self.new_daemon(tmp_path, batch_delay=10, max_batch_delay=0.1)
+        daemon.events.put(("CREATE", "a"))
+        daemon.events.put(("CREATE", "b"))
+        assert daemon._next_batch() == [("CREATE", "a"), ("CREATE", "b")]
+
+    def test_stop_drops_pending_batch(self, tmp_path: Path):
+        daemon = self.new_daemon(tmp_path)
+        daemon.events.put(("CREATE", "a"))
+        daemon.events.put(None)
+        assert daemon._next_batch() == []
@@ -0,0 +1,168 @@
+import os
+import random
+from pathlib import Path
+from unittest.mock import patch
+
+from app.config import config
+from app.playlist import Playlist
+
+class TestPlaylist:
+    def create_images(self, album: Path, names: list[str]) -> list[str]:
+        """
+        Creates the images with increasing mtimes, in the order of `names`.
+        """
+        paths = []
+        for i, name in enumerate(names):
+            path = album / name
+            os.makedirs(path.parent, exist_ok=True)
+            path.write_bytes(b"")
+            os.utime(path, ns=(i * 1_000_000_000, i * 1_000_000_000))
+            paths.append(str(path))
+        return paths
+
+    def test_set_album(self, tmp_path: Path):
+        album = tmp_path / "albums" / "Shared"
+        paths = self.create_images(album, ["c.jpg", "b/a.jpg", "a.jpg", "a/z.jpg", "b/b.jpg"])
+        playlist = Playlist()
+        playlist.set_album(str(album), True)
+
+        # Album by album, then by mtime.
+        assert playlist.images() == [paths[0], paths[2], paths[3], paths[1], paths[4]]
+
+        playlist.set_album(str(album), False)
+        assert playlist.images() == [paths[0], paths[2]]
+
+    def test_set_album_uses_cached_mtimes(self, tmp_path: Path):
+        album = tmp_path / "albums" / "Shared"
+        paths = self.create_images(album, ["a.jpg", "b.jpg"])
+        playlist = Playlist()
+        playlist.set_album(str(album), True)
+        playlist.shuffle(1)
+
+        with patch("app.playlist.os.stat") as mock_stat:
+            playlist.set_album(str(album), True, playlist.images())
+        mock_stat.assert_not_called()
+        assert playlist.images() == paths
+
+    def test_add_remove_move(self, tmp_path: Path):
+        album = tmp_path / "albums" / "Shared"
+        paths = self.create_images(album, ["a.jpg", "b.jpg", "c.jpg"])
+        playlist = Playlist()
+        playlist.set_album(str(album), True)
+
+        new_paths = self.create_images(album, ["d.jpg", "e.jpg"])
+        other = self.create_images(tmp_path / "albums" / "user", ["a.jpg"])
+        for path in new_paths + other:
+            playlist.add(path)
+        assert playlist.images() == paths + new_paths
+
+        playlist.remove(paths[1])
+        playlist.move(paths[0], str(album / "z.jpg"))
+        assert playlist.images() == [str(album / "z.jpg"), paths[2], *new_paths]
+        # Moved out of the album.
+        playlist.move(paths[2], other[0])
+        assert playlist.images() == [str(album / "z.jpg"), *new_paths]
+
+    def test_index_and_get(self, tmp_path: Path):
+        album = tmp_path / "albums" / "Shared"
+        paths = self.create_images(album, [f"{i}.jpg" for i in range(100)])
+        playlist = Playlist()
+        playlist.set_album(str(album), True, paths[:50])
+        for path in paths[50:]:
+            playlist.add(path)
+
+        removed = set(random.Random(1).sample(paths, 30))
+        for path in removed:
+            playlist.remove(path)
+        expected = [path for path in paths if path not in removed]
+        assert len(playlist) == len(expected)
+        for i, path in enumerate(expected):
+            assert playlist.get(i) == path
+            assert playlist.index(path) == i
+
+    def test_holes_are_compacted(self, tmp_path: Path):
+        album = tmp_path / "albums" / "Shared"
+        paths = self.create_images(album, [f"{i}.jpg" for i in range(100)])
+        playlist = Playlist()
+        playlist.set_album(str(album), True)
+        for path in paths[:80]:
+            playlist.remove(path)
+        assert len(playlist.slots) <= 2 * len(playlist)
+        assert playlist.images() == paths[80:]
+        assert playlist.get(0) == paths[80]
+
+    def test_shuffle_is_seeded(self, tmp_path: Path):
+        album = tmp_path / "albums" / "Shared"
+        paths = self.create_images(album, [f"{i}.jpg" for i in range(20)])
+        playlist = Playlist()
+        playlist.set_album(str(album), True)
+
+        playlist.shuffle(42)
+        shuffled = playlist.images()
+        assert shuffled != paths
+        assert sorted(shuffled) == sorted(paths)
+        assert all(playlist.index(path) == i for i, path in enumerate(shuffled))
+
+        playlist.set_album(str(album), True, paths)
+        playlist.shuffle(42)
+        assert playlist.images() == shuffled
+
+    def test_save_load(self, tmp_path: Path):
+        album = tmp_path / "albums" / "Shared"
+        self.create_images(album, [f"{i}.jpg" for i in range(5)])
+        playlist = Playlist(str(tmp_path / "playlist.json"))
+        playlist.set_album(str(album), True)
+        playlist.shuffle(7)
+        playlist.save()
+
+        loaded = Playlist(str(tmp_path / "playlist.json"))
+        assert loaded.load()
+        assert loaded.images() == playlist.images()
+        assert (loaded.album, loaded.shuffled, loaded.seed) == (str(album), True, 7)
+        assert loaded.mtimes == playlist.mtimes
+
+    def test_load_missing(self, tmp_path: Path):
+        assert not Playlist(str(tmp_path / "playlist.json")).load()
+
+    def test_sync(self, tmp_path: Path):
+        album = tmp_path / "albums" / "Shared"
+        paths = self.create_images(album, ["a.jpg", "b.jpg", "c.jpg"])
+        playlist = Playlist()
+        playlist.set_album(str(album), True)
+        playlist.shuffle(3)
+        order = playlist.images()
+
+        new_path = self.create_images(album, ["d.jpg"])[0]
+        playlist.sync([paths[0], paths[2], new_path])
+        assert playlist.images() == [path for path in order if path != paths[1]] + [new_path]
+
+    def test_on_album_change(self, tmp_path: Path):
+        config.load_config({"paths": {"base_dir": str(tmp_path)}})
+        album = tmp_path / "albums" / "Shared"
+        paths = self.create_images(album, ["a.jpg", "b.jpg"])
+        playlist = Playlist()
+        playlist.set_album(str(album), True, [])
+
+        playlist.on_album_change("add", "albums/Shared/a.jpg", None)
+        playlist.on_album_change("add", "albums/Shared/b.jpg", None)
+        playlist.on_album_change("move", "albums/Shared/a.jpg", "albums/Shared/c.jpg")
+        playlist.on_album_change("remove", "albums/Shared/b.jpg", None)
+        assert playlist.images() == [str(album / "c.jpg")]
+
+    def test_write(self, tmp_path: Path):
+        album = tmp_path / "albums" / "Shared"
+        paths = self.create_images(album, ["a.jpg", "b.jpg"])
+        playlist = Playlist()
+        playlist.set_album(str(album), True)
+        assert playlist.dirty()
+
+        playlist.write(str(tmp_path / "active_slideshow.txt"))
+        assert (tmp_path / "active_slideshow.txt").read_text().split('\n') == paths
+        assert not playlist.dirty()
+        playlist.remove(paths[1])
+        assert playlist.dirty()
+        playlist.add(paths[1])
+
+        renditions = {paths[0]: str(tmp_path / "renders" / "a.jpg")}
+        playlist.write(str(tmp_path / "active_slideshow.txt"), lambda path: renditions.get(path, path))
+        assert (tmp_path / "active_slideshow.txt").read_text().split('\n') == [renditions[paths[0]], paths[1]]
@@ -0,0 +1,61 @@
+import os
+from pathlib import Path
+from unittest.mock import patch, MagicMock
+
+from app.render_cache import RenderCache, framebuffer_resolution
+
+def fake_resize_image(image_path, out_path, size, quality):
+    os.makedirs(os.path.dirname(out_path), exist_ok=True)
+    with open(out_path, 'wb') as f:
+        f.write(b"x" * size[0])
+    proc = MagicMock()
+    proc.wait.return_value = 0
+    return proc
+
+@patch("app.thumbnails.utils.resize_image", side_effect=fake_resize_image)
+class TestRenderCache:
+    def create_image(self, path: Path, content: bytes = b"image"):
+        os.makedirs(path.parent, exist_ok=True)
+        path.write_bytes(content)
+        return str(path)
+
+    def new_cache(self, tmp_path: Path):
+        cache = RenderCache(str(tmp_path / "renders"), (192, 108), 1000)
+        cache.load()
+        return cache
+
+    def test_rendition(self, mock_resize, tmp_path: Path):
+        cache = self.new_cache(tmp_path)
+        image = self.create_image(tmp_path / "albums" / "a.jpg")
+
+        # Not rendered yet, the original is played.
+        assert cache.rendition(image) == image
+        mock_resize.assert_not_called()
+
+        rendition = cache.get(image, "display")
+        assert rendition.endswith("_192x108.jpg")
+        assert mock_resize.call_args[0][2] == (192, 108)
+        assert cache.rendition(image) == rendition
+
+    def test_rendition_of_changed_image(self, mock_resize, tmp_path: Path):
+        cache = self.new_cache(tmp_path)
+        image = self.create_image(tmp_path / "albums" / "a.jpg")
+        cache.get(image, "display")
+
+        # E.g. rotated, the rendition of the old content isn't played anymore.
+        self.create_image(tmp_path / "albums" / "a.jpg", b"rotated image")
+        assert cache.rendition(image) == image
+
+    def test_generate_async(self, mock_resize, tmp_path: Path):
+        cache = self.new_cache(tmp_path)
+        images = [self.create_image(tmp_path / "albums" / f"{i}.jpg", str(i).encode()) for i in range(3)]
+        cache.generate_async(images)
+        cache.executor.shutdown(wait=True)
+        assert all(cache.rendition(image) != image for image in images)
+
+    def test_framebuffer_resolution(self, mock_resize, tmp_path: Path):
+        virtual_size = tmp_path / "virtual_size"
+        virtual_size.write_text("800,480\n")
+        assert framebuffer_resolution("1280x720", str(virtual_size)) == (1280, 720)
+        assert framebuffer_resolution("", str(virtual_size)) == (800, 480)
+        assert framebuffer_resolution("", str(tmp_path / "missing")) == (1920, 1080)
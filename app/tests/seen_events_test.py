@@ -0,0 +1,60 @@
+from pathlib import Path
+
+from app.seen_events import SeenEventStore
+
+def event(event_id: str | None, path: str = "albums/Shared/a.jpg") -> dict:
+    evt = {"event": "PUT", "path": path}
+    if event_id is not None:
+        evt["id"] = event_id
+    return evt
+
+class TestSeenEventStore:
+    def test_seen_events_are_skipped(self, tmp_path: Path):
+        store = SeenEventStore(str(tmp_path / "seen.csv"), horizon=60)
+        assert store.filter_unseen([event("1"), event("2")]) == [event("1"), event("2")]
+        store.add(["1"])
+        assert store.filter_unseen([event("1"), event("2")]) == [event("2")]
+
+    def test_duplicates_in_batch(self, tmp_path: Path):
+        store = SeenEventStore(str(tmp_path / "seen.csv"), horizon=60)
+        assert store.filter_unseen([event("1"), event("1"), event(None), event(None)]) == [event("1"), event(None), event(None)]
+
+    def test_persisted(self, tmp_path: Path):
+        store = SeenEventStore(str(tmp_path / "config" / "seen.csv"), horizon=60)
+        store.add(["1", "2"])
+
+        loaded = SeenEventStore(str(tmp_path / "config" / "seen.csv"), horizon=60)
+        loaded.load()
+        assert loaded.is_seen("1")
+        assert loaded.is_seen("2")
+        assert not loaded.is_seen("3")
+
+    def test_horizon(self, tmp_path: Path):
+        store = SeenEventStore(str(tmp_path / "seen.csv"), horizon=60)
+        store.add(["1"])
+        store.entries["1"] -= 61
+        assert not store.is_seen("1")
+        store.add(["2"])
+        assert list(store.entries) == ["2"]
+
+    def test_max_entries(self, tmp_path: Path):
+        store = SeenEventStore(str(tmp_path / "seen.csv"), horizon=60, max_entries=3)
+        store.add(["1", "2", "3", "4"])
+        assert list(store.entries) == ["2", "3", "4"]
+
+    def test_file_is_rewritten(self, tmp_path: Path):
+        store = SeenEventStore(str(tmp_path / "seen.csv"), horizon=60, max_entries=10)
+        for i in range(300):
+            store.add([str(j) for j in range(i * 10, i * 10 + 10)])
+        lines = (tmp_path / "seen.csv").read_text().splitlines()
+        assert len(lines) <= 2000
+
+        loaded = SeenEventStore(str(tmp_path / "seen.csv"), horizon=60, max_entries=10)
+        loaded.load()
+        assert list(loaded.entries) == [str(j) for j in range(2990, 3000)]
+
+    def test_torn_write(self, tmp_path: Path):
+        (tmp_path / "seen.csv").write_text("1.5,a\n2.5,b\n3")
+        store = SeenEventStore(str(tmp_path / "seen.csv"), horizon=10 ** 10)
+        store.load()
+        assert list(store.entries) == ["a", "b"]
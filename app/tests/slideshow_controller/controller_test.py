@@ -0,0 +1,185 @@
+import threading
+import time
+from pathlib import Path
+
+import pytest
+
+from app.slideshow_controller.client import SlideshowClient
+from app.slideshow_controller.controller import ControllerServer, SlideshowController
+from app.tests.slideshow_controller.framebuffer_test import new_framebuffer
+
+class FakeFramebuffer:
+    """
+    Framebuffer that records the frames written to it. Each image decodes to a frame filled with the byte in its name.
+    """
+    def __init__(self, fb):
+        self.fb = fb
+        self.frames: list[bytes] = []
+        self.decoded: list[str] = []
+        self.written = threading.Condition()
+
+    def __getattr__(self, name):
+        return getattr(self.fb, name)
+
+    def open(self):
+        pass
+
+    def close(self):
+        pass
+
+    def decode(self, image_path: str) -> bytes | None:
+        self.decoded.append(image_path)
+        name = Path(image_path).stem
+        if not name.isdigit():
+            return None
+        return bytes([int(name)]) * self.fb.frame_size
+
+    def write(self, frame: bytes):
+        with self.written:
+            self.frames.append(frame)
+            self.written.notify_all()
+
+    def clear(self):
+        self.write(bytes(self.fb.frame_size))
+
+    def wait_for(self, value: int, timeout: float = 5) -> bool:
+        """
+        Waits until the last frame written is filled with `value`.
+        """
+        with self.written:
+            return self.written.wait_for(lambda: self.frames and self.frames[-1][0] == value, timeout)
+
+@pytest.fixture
+def controller(tmp_path: Path):
+    framebuffer = FakeFramebuffer(new_framebuffer(tmp_path, 4, 2, 32))
+    controller = SlideshowController(framebuffer)
+    controller.start()
+    yield controller
+    controller.stop()
+
+def write_playlist(tmp_path: Path, images: list[int], name: str = "active_slideshow.txt") -> str:
+    path = tmp_path / name
+    path.write_text('\n'.join(f"/albums/Shared/{i}.jpg" for i in images))
+    return str(path)
+
+class TestSlideshowController:
+    def test_play(self, controller: SlideshowController, tmp_path: Path):
+        response = controller.handle({"command": "play", "playlist": write_playlist(tmp_path, [1, 2, 3]), "speed": 60, "blend": 0})
+        assert response["status"] == "ok"
+        assert controller.framebuffer.wait_for(1)
+
+        status = controller.handle({"command": "status"})
+        assert (status["image"], status["position"], status["count"]) == ("/albums/Shared/1.jpg", 0, 3)
+        # The next image is decoded ahead.
+        time.sleep(0.05)
+        assert "/albums/Shared/2.jpg" in controller.framebuffer.decoded
+
+    def test_skip(self, controller: SlideshowController, tmp_path: Path):
+        controller.handle({"command": "play", "playlist": write_playlist(tmp_path, [1, 2, 3]), "speed": 60, "blend": 0})
+        assert controller.framebuffer.wait_for(1)
+        controller.handle({"command": "skip"})
+        assert controller.framebuffer.wait_for(2)
+        controller.handle({"command": "skip", "count": -2})
+        assert controller.framebuffer.wait_for(3)
+
+    def test_blend(self, controller: SlideshowController, tmp_path: Path):
+        controller.handle({"command": "play", "playlist": write_playlist(tmp_path, [0, 64]), "speed": 1, "blend": 80})
+        assert controller.framebuffer.wait_for(0)
+        assert controller.framebuffer.wait_for(64)
+        # Two blended frames between the images, weighted 11/32 and 21/32 of the next image.
+        assert [frame[0] for frame in controller.framebuffer.frames[-4:]] == [0, 22, 42, 64]
+
+    def test_load_keeps_current_image(self, controller: SlideshowController, tmp_path: Path):
+        controller.handle({"command": "play", "playlist": write_playlist(tmp_path, [1, 2, 3]), "speed": 60, "blend": 0})
+        assert controller.framebuffer.wait_for(1)
+        controller.handle({"command": "skip"})
+        assert controller.framebuffer.wait_for(2)
+        written = len(controller.framebuffer.frames)
+
+        status = controller.handle({"command": "load", "playlist": write_playlist(tmp_path, [3, 2, 1])})
+        assert (status["image"], status["position"]) == ("/albums/Shared/2.jpg", 1)
+        time.sleep(0.05)
+        assert len(controller.framebuffer.frames) == written
+
+        # Removed from the playlist, goes on from the image after it.
+        status = controller.handle({"command": "load", "playlist": write_playlist(tmp_path, [3, 1])})
+        assert status["position"] == 0
+        controller.handle({"command": "skip"})
+        assert controller.framebuffer.wait_for(1)
+
+    def test_load_advance(self, controller: SlideshowController, tmp_path: Path):
+        controller.handle({"command": "play", "playlist": write_playlist(tmp_path, [1, 2, 3]), "speed": 60, "blend": 0})
+        assert controller.framebuffer.wait_for(1)
+        controller.handle({"command": "load", "playlist": write_playlist(tmp_path, [4, 5]), "advance": True})
+        assert controller.framebuffer.wait_for(4)
+
+    def test_settings(self, controller: SlideshowController, tmp_path: Path):
+        controller.handle({"command": "play", "playlist": write_playlist(tmp_path, [1, 2]), "speed": 60, "blend": 0})
+        assert controller.framebuffer.wait_for(1)
+        status = controller.handle({"command": "settings", "speed": 1, "blend": 500})
+        assert (status["speed"], status["blend"]) == (1, 500)
+        assert controller.framebuffer.wait_for(2)
+
+    def test_pause_resume(self, controller: SlideshowController, tmp_path: Path):
+        controller.handle({"command": "play", "playlist": write_playlist(tmp_path, [1, 2]), "speed": 1, "blend": 0})
+        assert controller.framebuffer.wait_for(1)
+        assert controller.handle({"command": "pause"})["paused"]
+        assert not controller.framebuffer.wait_for(2, timeout=1.5)
+        assert not controller.handle({"command": "resume"})["paused"]
+        assert controller.framebuffer.wait_for(2)
+
+    def test_prefetch_stats(self, controller: SlideshowController, tmp_path: Path):
+        controller.handle({"command": "play", "playlist": write_playlist(tmp_path, [1, 2]), "speed": 60, "blend": 0})
+        assert controller.framebuffer.wait_for(1)
+        # Lets the next image be decoded ahead.
+        time.sleep(0.05)
+        controller.handle({"command": "skip"})
+        assert controller.framebuffer.wait_for(2)
+
+        status = controller.handle({"command": "status"})
+        # The first image wasn't prefetched nor decoded ahead, the second one was. The first one is still decoded.
+        assert status["prefetch"] == {
+            "depth": 4, "hits": 1, "misses": 1, "decodeAhead": 1, "decodeHits": 1, "decodeMisses": 1
+        }
+
+    def test_skips_images_that_fail_to_decode(self, controller: SlideshowController, tmp_path: Path):
+        playlist = tmp_path / "active_slideshow.txt"
+        playlist.write_text("/albums/Shared/corrupt.jpg\n/albums/Shared/2.jpg")
+        controller.handle({"command": "play", "playlist": str(playlist), "speed": 60, "blend": 0})
+        assert controller.framebuffer.wait_for(2)
+
+    def test_stop_blanks_the_screen(self, controller: SlideshowController, tmp_path: Path):
+        controller.handle({"command": "play", "playlist": write_playlist(tmp_path, [1]), "speed": 60, "blend": 0})
+        assert controller.framebuffer.wait_for(1)
+        assert not controller.handle({"command": "stop"})["playing"]
+        assert controller.framebuffer.wait_for(0)
+
+    def test_invalid_commands(self, controller: SlideshowController, tmp_path: Path):
+        assert controller.handle({"command": "rewind"})["status"] == "error"
+        assert controller.handle({"command": "play"})["status"] == "error"
+        assert controller.handle({"command": "load", "playlist": str(tmp_path / "missing.txt")})["status"] == "error"
+        assert controller.handle({"command": "settings", "speed": "fast"})["status"] == "error"
+
+    def test_socket(self, controller: SlideshowController, tmp_path: Path):
+        socket_path = str(tmp_path / "slideshow.sock")
+        server = ControllerServer(socket_path, controller)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        client = SlideshowClient(socket_path)
+        try:
+            response = client.send("play", playlist=write_playlist(tmp_path, [1, 2]), speed=60, blend=0)
+            assert response["status"] == "ok"
+            assert controller.framebuffer.wait_for(1)
+
+            start = time.monotonic()
+            client.send("skip")
+            assert controller.framebuffer.wait_for(2)
+            assert time.monotonic() - start < 0.1
+            assert client.send("status")["image"] == "/albums/Shared/2.jpg"
+        finally:
+            client.close()
+            server.shutdown()
+            server.server_close()
+
+    def test_client_without_controller(self, tmp_path: Path):
+        client = SlideshowClient(str(tmp_path / "missing.sock"))
+        assert client.send("status") is None
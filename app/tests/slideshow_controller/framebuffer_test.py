@@ -0,0 +1,119 @@
+import os
+import random
+from pathlib import Path
+from unittest.mock import patch, MagicMock
+
+import pytest
+
+from app.slideshow_controller.framebuffer import Framebuffer, KDSETMODE, KD_GRAPHICS, KD_TEXT
+
+def new_framebuffer(tmp_path: Path, width: int, height: int, bits_per_pixel: int, stride: int | None = None) -> Framebuffer:
+    sysfs_dir = tmp_path / "sysfs"
+    os.makedirs(sysfs_dir, exist_ok=True)
+    (sysfs_dir / "virtual_size").write_text(f"{width},{height}\n")
+    (sysfs_dir / "bits_per_pixel").write_text(f"{bits_per_pixel}\n")
+    if stride is not None:
+        (sysfs_dir / "stride").write_text(f"{stride}\n")
+    (tmp_path / "fb0").write_bytes(b"")
+    return Framebuffer(str(tmp_path / "fb0"), str(sysfs_dir))
+
+class TestFramebuffer:
+    def test_geometry(self, tmp_path: Path):
+        fb = new_framebuffer(tmp_path, 4, 2, 32)
+        assert (fb.width, fb.height, fb.stride, fb.frame_size) == (4, 2, 16, 32)
+
+    def test_unsupported_depth(self, tmp_path: Path):
+        with pytest.raises(ValueError):
+            new_framebuffer(tmp_path, 4, 2, 8)
+
+    def test_write_and_clear(self, tmp_path: Path):
+        fb = new_framebuffer(tmp_path, 4, 2, 16)
+        fb.open()
+        fb.write(b"\x01" * fb.frame_size)
+        assert (tmp_path / "fb0").read_bytes() == b"\x01" * fb.frame_size
+        fb.clear()
+        fb.close()
+        assert (tmp_path / "fb0").read_bytes() == bytes(fb.frame_size)
+
+    @patch("app.slideshow_controller.framebuffer.fcntl.ioctl")
+    def test_console_graphics_mode(self, mock_ioctl, tmp_path: Path):
+        fb = new_framebuffer(tmp_path, 4, 2, 16)
+        fb.tty = str(tmp_path / "tty1")
+        (tmp_path / "tty1").write_bytes(b"")
+        fb.open()
+        mock_ioctl.assert_called_once_with(fb.tty_fd, KDSETMODE, KD_GRAPHICS)
+        tty_fd = fb.tty_fd
+        fb.close()
+        mock_ioctl.assert_called_with(tty_fd, KDSETMODE, KD_TEXT)
+        assert fb.tty_fd is None
+
+    @patch("app.slideshow_controller.framebuffer.fcntl.ioctl", side_effect=OSError("Operation not permitted"))
+    def test_console_graphics_mode_not_permitted(self, mock_ioctl, tmp_path: Path):
+        fb = new_framebuffer(tmp_path, 4, 2, 16)
+        fb.tty = str(tmp_path / "tty1")
+        (tmp_path / "tty1").write_bytes(b"")
+        # The frames are still written.
+        fb.open()
+        fb.write(b"\x01" * fb.frame_size)
+        fb.close()
+        assert (tmp_path / "fb0").read_bytes() == b"\x01" * fb.frame_size
+
+    def test_to_frame_rgb565(self, tmp_path: Path):
+        fb = new_framebuffer(tmp_path, 2, 2, 16)
+        # Red, green, blue, white.
+        pixels = bytes([255, 0, 0, 0, 255, 0, 0, 0, 255, 255, 255, 255])
+        assert fb.to_frame(pixels) == bytes.fromhex("00f8" "e007" "1f00" "ffff")
+
+    def test_to_frame_pads_rows(self, tmp_path: Path):
+        fb = new_framebuffer(tmp_path, 2, 2, 32, stride=12)
+        frame = fb.to_frame(bytes(range(16)))
+        assert frame == bytes(range(8)) + bytes(4) + bytes(range(8, 16)) + bytes(4)
+        assert len(frame) == fb.frame_size
+
+    def test_to_frame_wrong_size(self, tmp_path: Path):
+        fb = new_framebuffer(tmp_path, 2, 2, 32)
+        with pytest.raises(ValueError):
+            fb.to_frame(bytes(15))
+
+    @pytest.mark.parametrize("bits_per_pixel, fields", [
+        (16, [(11, 0x1F), (5, 0x3F), (0, 0x1F)]),
+        (24, [(0, 0xFF), (8, 0xFF), (16, 0xFF)]),
+        (32, [(0, 0xFF), (8, 0xFF), (16, 0xFF), (24, 0xFF)]),
+    ])
+    def test_blend(self, tmp_path: Path, bits_per_pixel: int, fields: list[tuple[int, int]]):
+        fb = new_framebuffer(tmp_path, 16, 8, bits_per_pixel)
+        rng = random.Random(0)
+        frame, next_frame = rng.randbytes(fb.frame_size), rng.randbytes(fb.frame_size)
+        # Max values, to check that the channels don't spill into each other.
+        frame = b"\xff" * 8 + frame[8:]
+
+        steps = fb.blend(frame, next_frame, 3)
+        assert len(steps) == 3
+        pixel_size = bits_per_pixel // 8
+        for step, blended in enumerate(steps, 1):
+            weight = round(32 * step / 4)
+            for i in range(0, fb.frame_size, pixel_size):
+                a, b, mixed = (int.from_bytes(f[i:i + pixel_size], 'little') for f in (frame, next_frame, blended))
+                for shift, mask in fields:
+                    a_channel, b_channel = (a >> shift) & mask, (b >> shift) & mask
+                    assert (mixed >> shift) & mask == (a_channel * (32 - weight) + b_channel * weight) >> 5
+
+    def test_blend_without_steps(self, tmp_path: Path):
+        fb = new_framebuffer(tmp_path, 4, 2, 16)
+        assert fb.blend(bytes(fb.frame_size), bytes(fb.frame_size), 0) == []
+
+    @patch("app.slideshow_controller.framebuffer.subprocess.run")
+    def test_decode(self, mock_run, tmp_path: Path):
+        fb = new_framebuffer(tmp_path, 2, 1, 32)
+        mock_run.return_value = MagicMock(returncode=0, stdout=bytes(range(8)))
+        assert fb.decode("a.jpg") == bytes(range(8))
+        args = mock_run.call_args[0][0]
+        assert args[0] == "convert"
+        assert args[-1] == "bgra:-"
+        assert "2x1" in args
+
+    @patch("app.slideshow_controller.framebuffer.subprocess.run")
+    def test_decode_failed(self, mock_run, tmp_path: Path):
+        fb = new_framebuffer(tmp_path, 2, 1, 32)
+        mock_run.return_value = MagicMock(returncode=1, stderr=b"corrupt image")
+        assert fb.decode("a.jpg") is None
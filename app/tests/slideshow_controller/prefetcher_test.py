@@ -0,0 +1,63 @@
+import os
+from pathlib import Path
+from unittest.mock import patch, call
+
+from app.slideshow_controller.prefetcher import Prefetcher
+
+IMAGES = [f"/albums/Shared/{i}.jpg" for i in range(5)]
+
+class TestPrefetcher:
+    @patch("app.slideshow_controller.prefetcher._advise")
+    def test_update(self, mock_advise):
+        prefetcher = Prefetcher(2)
+        prefetcher.update(IMAGES, 0)
+        assert sorted(mock_advise.call_args_list) == [
+            call(IMAGES[1], os.POSIX_FADV_WILLNEED), call(IMAGES[2], os.POSIX_FADV_WILLNEED)
+        ]
+
+        # Only the image coming into the window is prefetched, the one behind the cursor is dropped.
+        mock_advise.reset_mock()
+        prefetcher.update(IMAGES, 1)
+        assert sorted(mock_advise.call_args_list) == [
+            call(IMAGES[1], os.POSIX_FADV_DONTNEED), call(IMAGES[3], os.POSIX_FADV_WILLNEED)
+        ]
+
+        # Wraps around the end of the playlist.
+        prefetcher.update(IMAGES, 4)
+        assert prefetcher.prefetched == {IMAGES[0], IMAGES[1]}
+
+    @patch("app.slideshow_controller.prefetcher._advise")
+    def test_depth_larger_than_playlist(self, mock_advise):
+        prefetcher = Prefetcher(10)
+        prefetcher.update(IMAGES[:2], 0)
+        assert prefetcher.prefetched == {IMAGES[0], IMAGES[1]}
+        prefetcher.update([], -1)
+        assert prefetcher.prefetched == set()
+
+    @patch("app.slideshow_controller.prefetcher._advise")
+    def test_read_counts_hits_and_misses(self, mock_advise):
+        prefetcher = Prefetcher(1)
+        prefetcher.update(IMAGES, 0)
+        prefetcher.read(IMAGES[1])
+        prefetcher.read(IMAGES[3])
+        assert prefetcher.stats() == {"depth": 1, "hits": 1, "misses": 1}
+
+    @patch("app.slideshow_controller.prefetcher._advise")
+    def test_drop(self, mock_advise):
+        prefetcher = Prefetcher(1)
+        prefetcher.update(IMAGES, 0)
+        mock_advise.reset_mock()
+        # Coming up next, kept in the page cache.
+        prefetcher.drop(IMAGES[1])
+        mock_advise.assert_not_called()
+        prefetcher.drop(IMAGES[3])
+        mock_advise.assert_called_once_with(IMAGES[3], os.POSIX_FADV_DONTNEED)
+
+    def test_advise_files(self, tmp_path: Path):
+        image = tmp_path / "1.jpg"
+        image.write_bytes(b"\xff\xd8")
+        prefetcher = Prefetcher(2)
+        # A missing image is ignored.
+        prefetcher.update([str(tmp_path / "0.jpg"), str(image), str(tmp_path / "missing.jpg")], 0)
+        prefetcher.update([str(image)], 0)
+        assert prefetcher.prefetched == {str(image)}
@@ -2,46 +2,106 @@ import os
 import time
 import random
 from pathlib import Path
-from unittest.mock import patch, MagicMock
+from unittest.mock import patch
 
 from app import slideshow
 from app.config import config
+from app.playlist import Playlist
 from app.tests import utils
 
 class TestSlideshow:
-    @patch("app.slideshow.subprocess.Popen")
-    def test_start_slideshow(self, mock_popen):
-        c = {"paths": {"active_slideshow_file": "base/active_slideshow.txt"}}
+    @patch("app.slideshow.slideshow_client")
+    @patch("app.slideshow.render_cache")
+    @patch("app.slideshow.PlaylistDaemon")
+    @patch("app.slideshow.playlist")
+    def test_start_slideshow(self, mock_playlist, mock_daemon, mock_renders, mock_client, tmp_path: Path):
+        c = {
+            "paths": {"active_slideshow_file": "base/active_slideshow.txt"},
+            "slideshow": {"batch_delay": 2, "max_batch_delay": 10}
+        }
         config.load_config(c)
 
-        script_path = os.path.join(os.path.dirname(os.path.abspath(Path(__file__).parent)), "display_slideshow.sh")
-        album = "a/b/test_album"
+        album = str(tmp_path)
+        mock_playlist.return_value.album = album
+        mock_daemon.return_value.album = album
         blend = 500
         speed = 5
         slideshow.start_slideshow(album, blend, speed)
 
-        mock_popen.assert_called_once()
-        args = mock_popen.call_args[0][0]  # Get the first positional argument (the command list)
-        assert args[0] == script_path
-        assert args[1] == album
-        assert args[2] == str(speed)
-        assert args[3] == str(blend)
-        assert args[4] == c["paths"]["active_slideshow_file"]
-
-    @patch("app.slideshow.os.system")
-    @patch("app.slideshow.slideshow_proc", create=True)
-    def test_stop_slideshow(self, mock_slideshow_proc, mock_os_system):
-        # Simulate a running process
-        mock_process = MagicMock()
-        mock_slideshow_proc.terminate = mock_process.terminate
-        mock_slideshow_proc.wait = mock_process.wait
+        # Plays the renditions at the resolution of the display, and renders the missing ones.
+        mock_playlist().write.assert_called_once_with(
+            c["paths"]["active_slideshow_file"], mock_renders().rendition
+        )
+        mock_renders().generate_async.assert_called_once_with(mock_playlist().images())
+        mock_client().send.assert_called_once_with(
+            "play", playlist=c["paths"]["active_slideshow_file"], speed=speed, blend=blend, advance=False
+        )
+
+        mock_daemon.assert_called_once()
+        daemon_args = mock_daemon.call_args[0]
+        assert daemon_args[:3] == (album, mock_playlist.return_value, c["paths"]["active_slideshow_file"])
+        mock_daemon.return_value.start.assert_called_once()
+
+        # The controller reloads the playlist after the daemon updates it.
+        daemon_args[3]()
+        mock_client().send.assert_called_with("load", playlist=c["paths"]["active_slideshow_file"])
+
+        # Settings changes are sent to the running slideshow, the daemon keeps running.
+        slideshow.start_slideshow(album, 0, 10, advance=True)
+        mock_daemon.assert_called_once()
+        mock_client().send.assert_called_with(
+            "play", playlist=c["paths"]["active_slideshow_file"], speed=10, blend=0, advance=True
+        )
+        slideshow.stop_slideshow()
+
+    @patch("app.slideshow.slideshow_client")
+    @patch("app.slideshow.render_cache")
+    @patch("app.slideshow.PlaylistDaemon")
+    @patch("app.slideshow.album_images")
+    @patch("app.slideshow.playlist")
+    def test_start_slideshow_without_saved_playlist(
+        self, mock_playlist, mock_album_images, mock_daemon, mock_renders, mock_client, tmp_path: Path
+    ):
+        c = {
+            "paths": {"active_slideshow_file": str(tmp_path / "active_slideshow.txt")},
+            "slideshow": {"batch_delay": 2, "max_batch_delay": 10}
+        }
+        config.load_config(c)
+        album = tmp_path / "albums" / "Shared"
+        os.makedirs(album)
+        images = []
+        for i in range(3):
+            image = album / f"{i}.jpg"
+            image.write_bytes(b"")
+            os.utime(image, ns=(i, i))
+            images.append(str(image))
+        mock_album_images.return_value = images
+        # Fresh install, no playlist.json.
+        mock_playlist.return_value = Playlist(str(tmp_path / "playlist.json"))
+        mock_renders.return_value.rendition = lambda path: path
+
+        slideshow.start_slideshow(str(album), 500, 5)
+
+        mock_album_images.assert_called_once_with(str(album))
+        assert mock_playlist().album == str(album)
+        with open(c["paths"]["active_slideshow_file"]) as f:
+            assert f.read().split('\n') == images
+        assert Playlist(str(tmp_path / "playlist.json")).load()
+        slideshow.stop_slideshow()
+
+    @patch("app.slideshow.slideshow_client")
+    def test_start_slideshow_missing_album(self, mock_client, tmp_path: Path):
+        slideshow.start_slideshow(str(tmp_path / "missing"), 500, 5)
+        mock_client().send.assert_not_called()
 
+    @patch("app.slideshow.slideshow_client")
+    @patch("app.slideshow.playlist_daemon")
+    def test_stop_slideshow(self, mock_playlist_daemon, mock_client):
         slideshow.stop_slideshow()
 
-        mock_os_system.assert_any_call("pkill -15 -f display_slideshow.sh")
-        mock_os_system.assert_any_call("pkill -15 -f fbi")
-        mock_process.terminate.assert_called_once()
-        mock_process.wait.assert_called_once()
+        mock_playlist_daemon.stop.assert_called_once()
+        mock_client().send.assert_called_once_with("stop")
+        assert slideshow.playlist_daemon is None
 
     def test_load_default_settings(self):
         c = {
@@ -0,0 +1,180 @@
+import json
+import os
+from pathlib import Path
+from unittest.mock import patch, MagicMock
+
+from app.album_index import AlbumIndex
+from app.config import config
+from app.sync import SyncManifest, Resyncer
+from app.tests import utils
+
+def fake_get_bulk(image_paths, image_keys):
+    """
+    Writes the key of each image as its content, except for keys containing "fail".
+    """
+    success, failure = [], []
+    for image_path, image_key in zip(image_paths, image_keys):
+        if "fail" in image_key:
+            failure.append(image_key)
+            continue
+        os.makedirs(os.path.dirname(image_path), exist_ok=True)
+        Path(image_path).write_text(image_key)
+        success.append(image_key)
+    return success, failure
+
+@patch("app.sync.blob_store")
+@patch("app.sync.event_announcer")
+@patch("app.sync.thumbnail_cache")
+@patch("app.sync.album_index")
+@patch("app.sync.cloud_client")
+class TestResyncer:
+    def setup(self, tmp_path: Path, mock_cloud: MagicMock, mock_index: MagicMock, fs: dict):
+        config.load_config({
+            "paths": {
+                "base_dir": str(tmp_path),
+                "offline_events_file": str(tmp_path / "config" / "events.csv"),
+            },
+            "files": {"allowed_prefixes": {"Shared"}},
+        })
+        utils.create_fs(tmp_path, fs)
+        index = AlbumIndex(str(tmp_path / "albums"))
+        index.build()
+        mock_index.return_value = index
+        mock_cloud().get_bulk.side_effect = fake_get_bulk
+
+        manifest = SyncManifest(str(tmp_path / "config" / "sync_manifest.json"))
+        manifest.load()
+        return Resyncer(manifest, str(tmp_path / "config" / "resync_checkpoint.json"), batch_size=2)
+
+    def cloud(self, *objects: tuple[str, int, str]):
+        return [{"key": key, "size": size, "etag": etag} for key, size, etag in objects]
+
+    def downloaded(self, mock_cloud: MagicMock):
+        return [key for call in mock_cloud().get_bulk.call_args_list for key in call.args[1]]
+
+    def test_first_resync(self, mock_cloud, mock_index, mock_thumbnails, mock_announcer, mock_blob_store, tmp_path: Path):
+        resyncer = self.setup(tmp_path, mock_cloud, mock_index, {"albums": {"Shared": {"same.jpg": "", "local.jpg": ""}}})
+        mock_cloud().list_objects.return_value = self.cloud(
+            ("albums/Shared/same.jpg", 0, "e1"),
+            ("albums/Shared/new.jpg", 10, "e2"),
+        )
+
+        job = resyncer.plan()
+        assert [obj["key"] for obj in job["download"]] == ["albums/Shared/new.jpg"]
+        assert job["delete"] == ["albums/Shared/local.jpg"]
+
+        resyncer.sync(job)
+        assert (tmp_path / "albums" / "Shared" / "new.jpg").exists()
+        mock_blob_store().add.assert_called_once_with(str(tmp_path / "albums" / "Shared" / "new.jpg"))
+        assert not (tmp_path / "albums" / "Shared" / "local.jpg").exists()
+        assert sorted(resyncer.manifest.keys()) == ["albums/Shared/new.jpg", "albums/Shared/same.jpg"]
+        assert not os.path.exists(resyncer.checkpoint_file)
+
+    def test_only_changed_images_are_downloaded(self, mock_cloud, mock_index, mock_thumbnails, mock_announcer, mock_blob_store, tmp_path: Path):
+        resyncer = self.setup(tmp_path, mock_cloud, mock_index, {"albums": {"Shared": {}}})
+        mock_cloud().list_objects.return_value = self.cloud(
+            ("albums/Shared/a.jpg", 10, "e1"),
+            ("albums/Shared/b.jpg", 10, "e2"),
+        )
+        resyncer.sync(resyncer.plan())
+        assert sorted(self.downloaded(mock_cloud)) == ["albums/Shared/a.jpg", "albums/Shared/b.jpg"]
+
+        # b.jpg changed in the cloud, with the same size.
+        mock_cloud().get_bulk.reset_mock()
+        mock_cloud().list_objects.return_value = self.cloud(
+            ("albums/Shared/a.jpg", 10, "e1"),
+            ("albums/Shared/b.jpg", 10, "e3"),
+        )
+        resyncer.sync(resyncer.plan())
+        assert self.downloaded(mock_cloud) == ["albums/Shared/b.jpg"]
+        assert resyncer.manifest.get("albums/Shared/b.jpg")["etag"] == "e3"
+
+    def test_offline_events(self, mock_cloud, mock_index, mock_thumbnails, mock_announcer, mock_blob_store, tmp_path: Path):
+        resyncer = self.setup(tmp_path, mock_cloud, mock_index, {"albums": {"Shared": {"offline.jpg": ""}}})
+        os.makedirs(tmp_path / "config")
+        (tmp_path / "config" / "events.csv").write_text(
+            f"2025-01-01 00:00:00+00:00,PUT,{tmp_path}/albums/Shared/offline.jpg\n"
+            "2025-01-01 00:00:00+00:00,DELETE,albums/Shared/deleted.jpg\n"
+        )
+        mock_cloud().list_objects.return_value = self.cloud(("albums/Shared/deleted.jpg", 10, "e1"))
+
+        job = resyncer.plan()
+        assert job["download"] == []
+        assert job["delete"] == []
+        assert job["events"] == [
+            {"event": "DELETE", "path": "albums/Shared/deleted.jpg"},
+            {"event": "PUT", "path": "albums/Shared/offline.jpg"},
+        ]
+        resyncer.sync(job)
+        message = json.loads(mock_cloud().insert_queue.call_args.args[0])
+        assert message["events"] == job["events"]
+
+    def test_offline_events_are_compacted(self, mock_cloud, mock_index, mock_thumbnails, mock_announcer, mock_blob_store, tmp_path: Path):
+        resyncer = self.setup(tmp_path, mock_cloud, mock_index, {"albums": {"Shared": {"c.jpg": ""}}})
+        os.makedirs(tmp_path / "config")
+        (tmp_path / "config" / "events.csv").write_text(
+            f"2025-01-01 00:00:00+00:00,PUT,{tmp_path}/albums/Shared/a.jpg\n"
+            "2025-01-01 00:00:01+00:00,MOVE,albums/Shared/a.jpg,albums/Shared/b.jpg\n"
+            "2025-01-01 00:00:02+00:00,MOVE,albums/Shared/b.jpg,albums/Shared/c.jpg\n"
+        )
+        mock_cloud().list_objects.return_value = []
+
+        job = resyncer.plan()
+        # a didn't exist before the events, b may have.
+        assert job["events"] == [
+            {"event": "DELETE", "path": "albums/Shared/b.jpg"},
+            {"event": "PUT", "path": "albums/Shared/c.jpg"},
+        ]
+        assert job["delete"] == []
+
+    def test_resume_from_checkpoint(self, mock_cloud, mock_index, mock_thumbnails, mock_announcer, mock_blob_store, tmp_path: Path):
+        resyncer = self.setup(tmp_path, mock_cloud, mock_index, {"albums": {"Shared": {}}})
+        mock_cloud().list_objects.return_value = self.cloud(
+            *[(f"albums/Shared/{i}.jpg", 10, f"e{i}") for i in range(5)]
+        )
+        job = resyncer.plan()
+        resyncer._save_checkpoint(job)
+
+        # Simulate a restart after the first batch: only the first 2 images were downloaded.
+        mock_cloud().get_bulk.side_effect = [fake_get_bulk(
+            [str(tmp_path / obj["key"]) for obj in job["download"][:2]],
+            [obj["key"] for obj in job["download"][:2]]
+        ), KeyboardInterrupt()]
+        try:
+            resyncer.sync(job)
+        except KeyboardInterrupt:
+            pass
+        with open(resyncer.checkpoint_file) as f:
+            assert [obj["key"] for obj in json.load(f)["download"]] == [f"albums/Shared/{i}.jpg" for i in range(2, 5)]
+
+        mock_cloud().get_bulk.reset_mock()
+        mock_cloud().get_bulk.side_effect = fake_get_bulk
+        resyncer._run()
+        mock_cloud().list_objects.assert_called_once() # Not planned again.
+        assert self.downloaded(mock_cloud) == [f"albums/Shared/{i}.jpg" for i in range(2, 5)]
+        assert sorted(os.listdir(tmp_path / "albums" / "Shared")) == [f"{i}.jpg" for i in range(5)]
+        assert not os.path.exists(resyncer.checkpoint_file)
+
+    def test_failed_downloads(self, mock_cloud, mock_index, mock_thumbnails, mock_announcer, mock_blob_store, tmp_path: Path):
+        resyncer = self.setup(tmp_path, mock_cloud, mock_index, {"albums": {"Shared": {}}})
+        mock_cloud().list_objects.return_value = self.cloud(("albums/Shared/fail.jpg", 10, "e1"))
+        resyncer.sync(resyncer.plan())
+        assert resyncer.manifest.get("albums/Shared/fail.jpg") is None
+
+        # Retried on the next resync.
+        assert [obj["key"] for obj in resyncer.plan()["download"]] == ["albums/Shared/fail.jpg"]
+
+class TestSyncManifest:
+    def test_save_load(self, tmp_path: Path):
+        manifest = SyncManifest(str(tmp_path / "manifest.json"))
+        manifest.record("albums/Shared/a.jpg", 10, "e1", 123, 1.5)
+        manifest.save()
+
+        loaded = SyncManifest(str(tmp_path / "manifest.json"))
+        loaded.load()
+        assert loaded.get("albums/Shared/a.jpg") == {"size": 10, "etag": "e1", "mtime": 123, "lastSeen": 1.5}
+
+    def test_load_missing(self, tmp_path: Path):
+        manifest = SyncManifest(str(tmp_path / "manifest.json"))
+        manifest.load()
+        assert manifest.keys() == []
@@ -0,0 +1,139 @@
+import hashlib
+import os
+import shutil
+from pathlib import Path
+from unittest.mock import patch, MagicMock
+
+from app.thumbnails import ThumbnailCache
+
+def fake_resize_image(image_path, out_path, size, quality):
+    """
+    Writes `size` bytes to the output instead of running `convert`.
+    """
+    os.makedirs(os.path.dirname(out_path), exist_ok=True)
+    with open(out_path, 'wb') as f:
+        f.write(b"x" * size)
+    proc = MagicMock()
+    proc.wait.return_value = 0
+    return proc
+
+@patch("app.thumbnails.utils.resize_image", side_effect=fake_resize_image)
+class TestThumbnailCache:
+    def create_image(self, path: Path, content: bytes = b"image"):
+        os.makedirs(path.parent, exist_ok=True)
+        path.write_bytes(content)
+        return str(path)
+
+    def new_cache(self, tmp_path: Path, max_bytes=1000):
+        cache = ThumbnailCache(str(tmp_path / "cache"), {"small": 10, "medium": 100}, max_bytes)
+        cache.load()
+        return cache
+
+    def test_content_digest(self, mock_resize, tmp_path: Path):
+        cache = self.new_cache(tmp_path)
+        image = self.create_image(tmp_path / "albums" / "a.jpg")
+        assert cache.content_digest(image) == hashlib.sha256(b"image").hexdigest()
+
+    def test_content_digest_changes_with_content(self, mock_resize, tmp_path: Path):
+        cache = self.new_cache(tmp_path)
+        image = self.create_image(tmp_path / "albums" / "a.jpg")
+        cache.content_digest(image)
+        self.create_image(tmp_path / "albums" / "a.jpg", b"rotated image")
+        assert cache.content_digest(image) == hashlib.sha256(b"rotated image").hexdigest()
+
+    def test_get_generates_once(self, mock_resize, tmp_path: Path):
+        cache = self.new_cache(tmp_path)
+        image = self.create_image(tmp_path / "albums" / "a.jpg")
+
+        thumbnail = cache.get(image, "small")
+        assert thumbnail is not None and os.path.exists(thumbnail)
+        assert cache.get(image, "small") == thumbnail
+        assert mock_resize.call_count == 1
+
+        assert cache.get(image, "medium") != thumbnail
+        assert mock_resize.call_count == 2
+
+    def test_copies_share_thumbnails(self, mock_resize, tmp_path: Path):
+        cache = self.new_cache(tmp_path)
+        image = self.create_image(tmp_path / "albums" / "a.jpg")
+        copy = self.create_image(tmp_path / "albums" / "b" / "a.jpg")
+        assert cache.get(image, "small") == cache.get(copy, "small")
+        assert mock_resize.call_count == 1
+
+    def test_get_failed(self, mock_resize, tmp_path: Path):
+        proc = MagicMock()
+        proc.wait.return_value = 1
+        mock_resize.side_effect = None
+        mock_resize.return_value = proc
+
+        cache = self.new_cache(tmp_path)
+        image = self.create_image(tmp_path / "albums" / "a.jpg")
+        assert cache.get(image, "small") is None
+
+    def test_lru_eviction(self, mock_resize, tmp_path: Path):
+        cache = self.new_cache(tmp_path, max_bytes=25)
+        images = [self.create_image(tmp_path / "albums" / f"{i}.jpg", str(i).encode()) for i in range(3)]
+
+        thumbnails = [cache.get(image, "small") for image in images[:2]]
+        # Use the first thumbnail so that the second one is the least recently used.
+        cache.get(images[0], "small")
+        cache.get(images[2], "small")
+
+        assert os.path.exists(thumbnails[0])
+        assert not os.path.exists(thumbnails[1])
+        assert cache.total_bytes == 20
+
+    def test_load_existing(self, mock_resize, tmp_path: Path):
+        cache = self.new_cache(tmp_path)
+        image = self.create_image(tmp_path / "albums" / "a.jpg")
+        thumbnail = cache.get(image, "medium")
+
+        reloaded = self.new_cache(tmp_path)
+        assert reloaded.total_bytes == 100
+        assert reloaded.get(image, "medium") == thumbnail
+        assert mock_resize.call_count == 1
+
+    def test_invalidate(self, mock_resize, tmp_path: Path):
+        cache = self.new_cache(tmp_path)
+        image = self.create_image(tmp_path / "albums" / "a.jpg")
+        thumbnails = [cache.get(image, "small"), cache.get(image, "medium")]
+
+        cache.invalidate(image)
+        assert all(not os.path.exists(t) for t in thumbnails)
+        assert cache.total_bytes == 0
+
+    def test_invalidate_keeps_linked_thumbnails(self, mock_resize, tmp_path: Path):
+        cache = self.new_cache(tmp_path)
+        image = self.create_image(tmp_path / "albums" / "a.jpg")
+        # E.g. the copy of the image in another album, linked to the same blob.
+        copy = str(tmp_path / "albums" / "b.jpg")
+        os.link(image, copy)
+        thumbnail = cache.get(image, "small")
+
+        cache.invalidate(image)
+        os.remove(image)
+        assert cache.get(copy, "small") == thumbnail
+        assert mock_resize.call_count == 1
+
+        cache.invalidate(copy)
+        assert not os.path.exists(thumbnail)
+
+    def test_invalidate_digest(self, mock_resize, tmp_path: Path):
+        cache = self.new_cache(tmp_path)
+        image = self.create_image(tmp_path / "albums" / "a.jpg")
+        thumbnails = [cache.get(image, "small"), cache.get(image, "medium")]
+
+        cache.invalidate_digest(cache.content_digest(image))
+        assert all(not os.path.exists(t) for t in thumbnails)
+        assert cache.total_bytes == 0
+
+    def test_move_keeps_thumbnails(self, mock_resize, tmp_path: Path):
+        cache = self.new_cache(tmp_path)
+        image = self.create_image(tmp_path / "albums" / "a.jpg")
+        thumbnail = cache.get(image, "small")
+
+        new_image = str(tmp_path / "albums" / "b.jpg")
+        cache.forget(image)
+        shutil.move(image, new_image)
+        assert cache.get(new_image, "small") == thumbnail
+        assert mock_resize.call_count == 1
@@ -0,0 +1,82 @@
+import random
+
+from app.utils import events
+
+def put(path):
+    return {"event": "PUT", "path": path}
+
+def delete(path):
+    return {"event": "DELETE", "path": path}
+
+def move(path, new_path):
+    return {"event": "MOVE", "path": path, "newPath": new_path}
+
+def apply(fs: dict[str, str], evts: list[dict]) -> dict[str, str]:
+    """
+    Applies events to a filesystem of path -> content. A PUT file has the content "cloud".
+    """
+    fs = dict(fs)
+    for evt in evts:
+        match evt["event"]:
+            case "PUT":
+                fs[evt["path"]] = "cloud"
+            case "DELETE":
+                fs.pop(evt["path"], None)
+            case "MOVE":
+                fs[evt["newPath"]] = fs.pop(evt["path"])
+    return fs
+
+class TestEvents:
+    def test_chain(self):
+        # b may have existed before the events.
+        assert events.compact_events([put("a"), move("a", "b"), move("b", "c")]) == [delete("b"), put("c")]
+        assert events.compact_events([put("a"), move("b", "c"), move("a", "b")]) == [move("b", "c"), put("b")]
+
+    def test_put_then_delete(self):
+        assert events.compact_events([put("a"), delete("a")]) == []
+        assert events.compact_events([put("a"), move("a", "b")]) == [put("b")]
+        # a existed before the events, its first event isn't a PUT.
+        assert events.compact_events([delete("a"), put("a"), delete("a")]) == [delete("a")]
+
+    def test_move_back(self):
+        assert events.compact_events([move("a", "b"), move("b", "a")]) == [delete("b")]
+
+    def test_moves_are_ordered(self):
+        assert events.compact_events([move("b", "c"), move("a", "b")]) == [move("b", "c"), move("a", "b")]
+
+    def test_swap(self):
+        # a and b are swapped through a temporary path.
+        compacted = events.compact_events([move("a", "t"), move("b", "a"), move("t", "b")])
+        assert compacted == [delete("a"), delete("t"), move("b", "a"), put("b")]
+
+    def test_move_deleted_file(self):
+        assert events.compact_events([delete("a"), move("a", "b")]) == [delete("a"), put("b")]
+
+    def test_other_keys_are_dropped(self):
+        evt = {"event": "PUT", "path": "a", "timestamp": 1745101204, "id": "142b9797"}
+        assert events.compact_events([evt]) == [put("a")]
+
+    def test_same_result(self):
+        rng = random.Random(0)
+        paths = [f"albums/Shared/{i}.jpg" for i in range(6)]
+        for _ in range(500):
+            fs = {path: f"local {path}" for path in rng.sample(paths, 3)}
+            evts = []
+            curr = dict(fs)
+            seen = set()
+            for _ in range(rng.randint(1, 12)):
+                kind = rng.choice(["PUT", "DELETE", "MOVE"])
+                if kind == "MOVE" and curr:
+                    evt = move(rng.choice(sorted(curr)), rng.choice(paths))
+                elif kind == "DELETE":
+                    evt = delete(rng.choice(paths))
+                else:
+                    # A path first PUT by the events didn't exist before them.
+                    evt = put(rng.choice([path for path in paths if path not in fs or path in seen]))
+                seen.update([evt["path"], evt.get("newPath", evt["path"])])
+                evts.append(evt)
+                curr = apply(curr, [evt])
+
+            compacted = events.compact_events(evts)
+            assert apply(fs, compacted) == apply(fs, evts), evts
+            assert len(compacted) <= len(set(paths)) * 2
@@ -1,4 +1,7 @@
+import errno
+import os
 from pathlib import Path
+from unittest.mock import patch
 
 from app.config import config
 from app.utils import filesystem
@@ -153,4 +156,66 @@ class TestFilesystem:
             filesystem.remove_dirs(str(base_dir / "albums"), path)
             assert filesystem.get_file_structure(str(base_dir))[str(i)]== expected_fs
 
-
+    @patch("app.utils.filesystem._reflink", return_value=False)
+    def test_copy_file(self, mock_reflink, tmp_path: Path):
+        src = tmp_path / "a.jpg"
+        src.write_bytes(b"image")
+
+        assert filesystem.copy_file(str(src), str(tmp_path / "link.jpg")) == filesystem.HARDLINK
+        assert os.path.samefile(src, tmp_path / "link.jpg")
+
+        method = filesystem.copy_file(str(src), str(tmp_path / "copy.jpg"), hardlink=False)
+        assert method in {filesystem.COPY_FILE_RANGE, filesystem.COPY}
+        assert (tmp_path / "copy.jpg").read_bytes() == b"image"
+        assert not os.path.samefile(src, tmp_path / "copy.jpg")
+        # Only the copies are left, not their temporary files.
+        assert sorted(os.listdir(tmp_path)) == ["a.jpg", "copy.jpg", "link.jpg"]
+
+    @patch("app.utils.filesystem.os.copy_file_range", side_effect=OSError(errno.EXDEV, "Cross-device link"))
+    @patch("app.utils.filesystem._reflink", return_value=False)
+    def test_copy_file_fallback(self, mock_reflink, mock_copy_file_range, tmp_path: Path):
+        src = tmp_path / "a.jpg"
+        src.write_bytes(b"image")
+        assert filesystem.copy_file(str(src), str(tmp_path / "copy.jpg"), hardlink=False) == filesystem.COPY
+        assert (tmp_path / "copy.jpg").read_bytes() == b"image"
+
+    @patch("app.utils.filesystem.fcntl.ioctl")
+    def test_copy_file_reflink(self, mock_ioctl, tmp_path: Path):
+        src = tmp_path / "a.jpg"
+        src.write_bytes(b"image")
+        assert filesystem.copy_file(str(src), str(tmp_path / "copy.jpg")) == filesystem.REFLINK
+        assert mock_ioctl.call_args.args[1] == filesystem.FICLONE
+
+    def test_move_file(self, tmp_path: Path):
+        src = tmp_path / "a.jpg"
+        src.write_bytes(b"image")
+        assert filesystem.move_file(str(src), str(tmp_path / "b.jpg")) == filesystem.RENAME
+        assert not src.exists()
+        assert (tmp_path / "b.jpg").read_bytes() == b"image"
+
+    @patch("app.utils.filesystem._reflink", return_value=False)
+    def test_move_file_across_filesystems(self, mock_reflink, tmp_path: Path):
+        src = tmp_path / "a.jpg"
+        src.write_bytes(b"image")
+        os.utime(src, ns=(1_000_000_000, 1_000_000_000))
+        with patch("app.utils.filesystem.os.rename", side_effect=OSError(errno.EXDEV, "Cross-device link")):
+            method = filesystem.move_file(str(src), str(tmp_path / "b.jpg"))
+        assert method in {filesystem.COPY_FILE_RANGE, filesystem.COPY}
+        assert not src.exists()
+        assert (tmp_path / "b.jpg").read_bytes() == b"image"
+        assert os.stat(tmp_path / "b.jpg").st_mtime_ns == 1_000_000_000
+
+    def test_copy_files(self, tmp_path: Path):
+        src = tmp_path / "a.jpg"
+        src.write_bytes(b"image")
+        pairs = [
+            (str(src), str(tmp_path / "b" / "c" / "a.jpg")),
+            (str(src), str(tmp_path / "b" / "c" / "a2.jpg")),
+            (str(tmp_path / "missing.jpg"), str(tmp_path / "b" / "missing.jpg")),
+        ]
+        with patch("app.utils.filesystem.os.makedirs", wraps=os.makedirs) as mock_makedirs:
+            methods, failure = filesystem.copy_files(pairs)
+        assert [call.args[0] for call in mock_makedirs.call_args_list] == [str(tmp_path / "b"), str(tmp_path / "b" / "c")]
+        assert set(methods) == {pairs[0][1], pairs[1][1]}
+        assert failure == [pairs[2][1]]
+        assert (tmp_path / "b" / "c" / "a2.jpg").read_bytes() == b"image"
@@ -187,4 +187,32 @@ class TestOffline:
         return self.times_approx_equal(timestamp, now, rel)
 
     def times_approx_equal(self, t1: datetime, t2: datetime, rel=0.1):
-        return pytest.approx(t1.timestamp(), rel) == t2.timestamp()
\ No newline at end of file
+        return pytest.approx(t1.timestamp(), rel) == t2.timestamp()
+
+    def test_compact_offline_events(self, tmp_path: Path):
+        c = {"paths": {"base_dir": str(tmp_path)}}
+        config.load_config(c)
+        events_file = str(tmp_path / "events.csv")
+        offline.save_offline_events(events_file, [
+            offline.create_offline_event('PUT', f"{tmp_path}/albums/Shared/a.jpg"),
+            offline.create_offline_event('MOVE', "albums/Shared/a.jpg", "albums/Shared/b.jpg"),
+            offline.create_offline_event('PUT', f"{tmp_path}/albums/Shared/c.jpg"),
+            offline.create_offline_event('DELETE', "albums/Shared/c.jpg"),
+        ])
+
+        # a and c didn't exist before the events, so aren't deleted.
+        assert offline.compact_offline_events(events_file) == (4, 1)
+        events = [{k: v for k, v in e.items() if k != 'timestamp'} for e in offline.get_offline_events(events_file)]
+        assert events == [{'event': 'PUT', 'path': 'albums/Shared/b.jpg'}]
+
+        # New events are appended after the compacted ones.
+        offline.save_offline_events(events_file, [
+            offline.create_offline_event('DELETE', "albums/Shared/d.jpg"),
+            offline.create_offline_event('DELETE', "albums/Shared/b.jpg"),
+        ])
+        assert offline.compact_offline_events(events_file) == (3, 1)
+        events = [{k: v for k, v in e.items() if k != 'timestamp'} for e in offline.get_offline_events(events_file)]
+        assert events == [{'event': 'DELETE', 'path': 'albums/Shared/d.jpg'}]
+
+    def test_compact_offline_events_empty(self, tmp_path: Path):
+        assert offline.compact_offline_events(str(tmp_path / "events.csv")) == (0, 0)
@@ -1,5 +1,7 @@
+import concurrent.futures
 import os
 import subprocess
+import time
 import shutil
 from pathlib import Path
 from werkzeug.datastructures import FileStorage
@@ -68,6 +70,40 @@ class TestUtils:
             assert not os.path.exists(heif_path)
             assert os.path.exists(jpg_path)
 
+    def test_run_bounded(self):
+        commands = [(str(i), lambda i=i: subprocess.Popen(["sh", "-c", f"sleep 0.2; exit {i}"])) for i in range(4)]
+        reported = []
+        start = time.monotonic()
+        results = utils.run_bounded(commands, max_workers=2, on_result=reported.append)
+        elapsed = time.monotonic() - start
+
+        # 4 commands of 0.2s with 2 workers must take at least 2 rounds.
+        assert elapsed >= 0.4
+        assert [r.path for r in results] == ["0", "1", "2", "3"]
+        assert [r.exit_code for r in results] == [0, 1, 2, 3]
+        assert all(r.duration >= 0.2 for r in results)
+        assert sorted(r.path for r in reported) == ["0", "1", "2", "3"]
+
+    def test_run_bounded_launch_failure(self):
+        commands = [("missing", lambda: subprocess.Popen(["pi-photo-album-nonexistent-command"]))]
+        results = utils.run_bounded(commands, max_workers=1)
+        assert results[0].exit_code == -1
+
+    def test_byte_budget(self):
+        budget = utils.ByteBudget(10)
+        peaks = []
+
+        def transfer(num_bytes: int):
+            with budget.reserve(num_bytes):
+                peaks.append((num_bytes, budget.in_flight))
+                time.sleep(0.05)
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=4) as executor:
+            list(executor.map(transfer, [6, 6, 4, 4, 25]))
+        assert all(in_flight <= 10 for num_bytes, in_flight in peaks if num_bytes <= 10)
+        assert (25, 25) in peaks # A reservation larger than the budget runs on its own.
+        assert budget.in_flight == 0
+
     def test_rotate_jpg(self, tmp_path: Path):
         test_img = Path(__file__).parent.parent / "images" / "rotate_90_cw.jpg"
         tmp_img = tmp_path / "image.jpg"
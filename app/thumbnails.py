@@ -0,0 +1,255 @@
+import collections
+import concurrent.futures
+import hashlib
+import os
+import threading
+import uuid
+
+from app.utils import filesystem, utils
+
+DIGEST_XATTR = "user.pi-photo-album.sha256"
+
+class ThumbnailCache:
+    """
+    On-disk cache of scaled down copies (thumbnails) of the album images.
+
+    Thumbnails are content-addressed: they are stored as `<cache_dir>/<digest[:2]>/<digest>_<px>.jpg`,
+    where `digest` is the SHA-256 of the source image. The digest of an image is cached in an xattr on the image
+    (so it survives restarts and follows the image when it's moved) and in memory.
+
+    The cache is bounded by `max_bytes`, evicting the least recently used thumbnails first.
+
+    A size is the max width/height of the thumbnails in px, or a `(width, height)` box, e.g. the resolution of a
+    display. See `RenderCache`.
+    """
+    def __init__(
+        self,
+        cache_dir: str,
+        sizes: dict[str, int | tuple[int, int]],
+        max_bytes: int,
+        quality: int = 80,
+        max_workers: int = 2,
+        name: str = "thumbnails"
+    ):
+        self.cache_dir = cache_dir
+        self.sizes = sizes
+        self.max_bytes = max_bytes
+        self.quality = quality
+
+        self.lock = threading.Lock()
+        # LRU of thumbnail paths -> size in bytes. Most recently used last.
+        self.entries: collections.OrderedDict[str, int] = collections.OrderedDict()
+        self.total_bytes = 0
+        # abs image path -> (signature, digest)
+        self.digests: dict[str, tuple[str, str]] = {}
+
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+
+    def load(self):
+        """
+        Loads the thumbnails already on disk into the LRU, ordered by last use.
+        """
+        os.makedirs(self.cache_dir, exist_ok=True)
+        found = []
+        for root, _, files in os.walk(self.cache_dir):
+            for file in files:
+                path = os.path.join(root, file)
+                if file.endswith('.tmp'):
+                    filesystem.silentremove(path)
+                    continue
+                st = os.stat(path)
+                found.append((st.st_mtime, path, st.st_size))
+
+        with self.lock:
+            self.entries.clear()
+            self.total_bytes = 0
+            for _, path, size in sorted(found):
+                self.entries[path] = size
+                self.total_bytes += size
+        self._evict()
+
+    def get(self, image_path: str, size_name: str) -> str | None:
+        """
+        Returns the path to the thumbnail of `image_path`, generating it if it isn't cached.
+        Returns None if the thumbnail couldn't be generated.
+
+        Raises KeyError if `size_name` isn't one of the configured sizes.
+        """
+        size = self.sizes[size_name]
+        digest = self.content_digest(image_path)
+        thumbnail_path = self._thumbnail_path(digest, size)
+
+        with self.lock:
+            if thumbnail_path in self.entries:
+                self.entries.move_to_end(thumbnail_path)
+                hit = True
+            else:
+                hit = False
+        if hit and os.path.exists(thumbnail_path):
+            # mtime is used as the last use time when the cache is reloaded.
+            os.utime(thumbnail_path)
+            return thumbnail_path
+
+        return self._generate(image_path, thumbnail_path, size)
+
+    def cached_path(self, image_path: str, size_name: str) -> str | None:
+        """
+        Returns the path to the thumbnail of `image_path` if it's cached, without generating it or hashing the image.
+        """
+        digest = self._cached_digest(image_path)
+        if digest is None:
+            return None
+        thumbnail_path = self._thumbnail_path(digest, self.sizes[size_name])
+        with self.lock:
+            return thumbnail_path if thumbnail_path in self.entries else None
+
+    def generate_async(self, image_paths: list[str]):
+        """
+        Generates all sizes of thumbnails for the images in the background.
+        """
+        for image_path in image_paths:
+            for size_name in self.sizes:
+                self.executor.submit(self._get_quietly, image_path, size_name)
+
+    def forget(self, image_path: str):
+        """
+        Forgets the cached digest of an image. Use when the image is moved, the thumbnails stay valid for the new path.
+        """
+        with self.lock:
+            self.digests.pop(image_path, None)
+
+    def invalidate(self, image_path: str):
+        """
+        Deletes the thumbnails of an image. Use before the image is deleted or its content changes.
+
+        The thumbnails are kept if the content is still linked from elsewhere, e.g. from a copy of the image in another
+        album or from its blob (see `BlobStore`). They're deleted once the blob is, see `invalidate_digest()`.
+        """
+        digest = self._cached_digest(image_path)
+        self.forget(image_path)
+        if digest is None:
+            return
+        try:
+            if os.stat(image_path).st_nlink > 1:
+                return
+        except OSError:
+            pass # Already deleted, no other entry links to it.
+        self.invalidate_digest(digest)
+
+    def invalidate_digest(self, digest: str):
+        """
+        Deletes the thumbnails of a content, e.g. once no image has it anymore.
+        """
+        for size in set(self.sizes.values()):
+            thumbnail_path = self._thumbnail_path(digest, size)
+            with self.lock:
+                if thumbnail_path in self.entries:
+                    self.total_bytes -= self.entries.pop(thumbnail_path)
+            filesystem.silentremove(thumbnail_path)
+
+    def content_digest(self, image_path: str) -> str:
+        """
+        Returns the SHA-256 digest of the image content, hashing the image only if it changed since it was last hashed.
+        """
+        digest = self._cached_digest(image_path)
+        if digest is not None:
+            return digest
+
+        st = os.stat(image_path)
+        sha256 = hashlib.sha256()
+        with open(image_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                sha256.update(chunk)
+        digest = sha256.hexdigest()
+
+        signature = self._signature(st)
+        with self.lock:
+            self.digests[image_path] = (signature, digest)
+        try:
+            os.setxattr(image_path, DIGEST_XATTR, f"{signature}:{digest}".encode())
+        except OSError:
+            pass # xattrs aren't supported by the filesystem, fall back to the in memory cache.
+        return digest
+
+    def _cached_digest(self, image_path: str) -> str | None:
+        try:
+            st = os.stat(image_path)
+        except FileNotFoundError:
+            with self.lock:
+                cached = self.digests.get(image_path)
+            return cached[1] if cached else None
+
+        signature = self._signature(st)
+        with self.lock:
+            cached = self.digests.get(image_path)
+        if cached and cached[0] == signature:
+            return cached[1]
+
+        try:
+            xattr_signature, digest = os.getxattr(image_path, DIGEST_XATTR).decode().rsplit(':', 1)
+        except (OSError, ValueError):
+            return None
+        if xattr_signature != signature:
+            return None
+        with self.lock:
+            self.digests[image_path] = (signature, digest)
+        return digest
+
+    def _generate(self, image_path: str, thumbnail_path: str, size: int | tuple[int, int]) -> str | None:
+        tmp_path = f"{thumbnail_path}.{uuid.uuid4()}.tmp"
+        try:
+            exit_code = utils.resize_image(image_path, tmp_path, size, self.quality).wait()
+        except OSError as e:
+            print(f"Error running image resize: {e}")
+            exit_code = -1
+        if exit_code != 0 or not os.path.exists(tmp_path):
+            filesystem.silentremove(tmp_path)
+            print(f"Failed to generate thumbnail for {image_path}")
+            return None
+        os.replace(tmp_path, thumbnail_path)
+
+        file_size = os.path.getsize(thumbnail_path)
+        with self.lock:
+            self.total_bytes += file_size - self.entries.pop(thumbnail_path, 0)
+            self.entries[thumbnail_path] = file_size
+        self._evict()
+        return thumbnail_path
+
+    def _get_quietly(self, image_path: str, size_name: str):
+        try:
+            self.get(image_path, size_name)
+        except Exception as e:
+            print(f"Error generating thumbnail for {image_path}: {e}")
+
+    def _evict(self):
+        evicted = []
+        with self.lock:
+            # Always keep the most recently used thumbnail, even if it's larger than the cache.
+            while self.total_bytes > self.max_bytes and len(self.entries) > 1:
+                path, size = self.entries.popitem(last=False)
+                self.total_bytes -= size
+                evicted.append(path)
+        for path in evicted:
+            filesystem.silentremove(path)
+
+    def _thumbnail_path(self, digest: str, size: int | tuple[int, int]) -> str:
+        if isinstance(size, tuple):
+            return f"{self.cache_dir}/{digest[:2]}/{digest}_{size[0]}x{size[1]}.jpg"
+        return f"{self.cache_dir}/{digest[:2]}/{digest}_{size}.jpg"
+
+    def _signature(self, st: os.stat_result) -> str:
+        return f"{st.st_mtime_ns}-{st.st_size}"
+
+_THUMBNAIL_CACHE = None
+
+def init_thumbnail_cache(cache_dir: str, sizes: dict[str, int], max_bytes: int, quality: int = 80):
+    global _THUMBNAIL_CACHE
+    if _THUMBNAIL_CACHE is not None:
+        return # Already initialized
+    _THUMBNAIL_CACHE = ThumbnailCache(cache_dir, sizes, max_bytes, quality)
+    _THUMBNAIL_CACHE.load()
+
+def thumbnail_cache():
+    if _THUMBNAIL_CACHE is None:
+        raise RuntimeError("Thumbnail cache not initialized. Run init_thumbnail_cache() first.")
+    return _THUMBNAIL_CACHE
@@ -41,9 +41,9 @@ def _get_aws_credentials(aws_role_arn, session_name):
             'expiry_time': assumed_role_object['Credentials']['Expiration'].isoformat()
         }
 
-def ping(url: str):
+def ping(url: str, session: requests.Session = None, timeout: float = 1.5):
     try:
-        resp = requests.get(url, timeout=1.5)
+        resp = (session or requests).get(url, timeout=timeout)
         if resp.status_code != 200:
             print(f"{resp.status_code} {url}")
             return False
@@ -0,0 +1,96 @@
+"""
+Utilities for handling file system events (PUT, DELETE, MOVE).
+"""
+
+def compact_events(events: list[dict]) -> list[dict]:
+    """
+    Folds an ordered list of events into the minimal set of events with the same end result.
+    E.g. PUT a -> MOVE a b becomes PUT b, and PUT a -> DELETE a becomes nothing.
+    A path whose first event is a PUT is taken to not exist before the events (e.g. a new upload), so it isn't deleted.
+    Other paths may have existed, e.g. the destination of a MOVE, so they're deleted once vacated: PUT a -> MOVE a b
+    -> MOVE b c becomes DELETE b, PUT c.
+
+    The result is ordered so that it can be applied safely, and so that its PUTs can be applied in parallel:
+    1. DELETEs
+    2. MOVEs, each one after the MOVE that vacates its destination. In a cycle of MOVEs (e.g. a swap), one of the
+       MOVEs becomes a DELETE of its source and a PUT of its destination.
+    3. PUTs
+
+    Event format: `{"event": "PUT" | "DELETE" | "MOVE", "path": str[, "newPath": str]}`. Other keys are dropped.
+    """
+    # Current path -> where its content comes from: None if it's PUT, else the path it had before the events.
+    state: dict[str, str | None] = {}
+    # Paths that were deleted or moved away, so no longer have the file they had before the events.
+    vacated: set[str] = set()
+    # Paths that didn't exist before the events, so don't need to be deleted once vacated.
+    created: set[str] = set()
+    seen: set[str] = set()
+
+    for event in events:
+        if event["path"] not in seen and event["event"] == "PUT":
+            created.add(event["path"])
+        seen.add(event["path"])
+        seen.add(event.get("newPath", event["path"]))
+        match event["event"]:
+            case "PUT":
+                state[event["path"]] = None
+            case "DELETE":
+                state.pop(event["path"], None)
+                vacated.add(event["path"])
+            case "MOVE":
+                src, dest = event["path"], event["newPath"]
+                if src == dest:
+                    continue
+                if src in state:
+                    origin = state.pop(src)
+                elif src in vacated:
+                    origin = None # The source is already gone, get the file from the cloud instead.
+                else:
+                    origin = src
+                vacated.add(src)
+                state[dest] = origin
+
+    moves = {origin: dest for dest, origin in state.items() if origin is not None and origin != dest}
+    puts = [dest for dest, origin in state.items() if origin is None]
+    # The sources of the moves are vacated by the moves, and a path whose file is moved back is unchanged.
+    deletes = [
+        path for path in vacated
+        if path not in moves and path not in created and (path not in state or state[path] != path)
+    ]
+
+    # Order the moves so that each destination is vacated before it's moved into.
+    # Every path is the source and the destination of at most one move, so the moves form chains and cycles.
+    sources = {dest: src for src, dest in moves.items()}
+    ordered_moves = []
+    done: set[str] = set()
+    for head in moves:
+        if head in sources:
+            continue # Not the head of a chain.
+        chain = []
+        src = head
+        while src in moves:
+            done.add(src)
+            chain.append((src, moves[src]))
+            src = moves[src]
+        # The end of the chain moves into a path that isn't moved into, so it's done first.
+        ordered_moves.extend(reversed(chain))
+    for start in moves:
+        if start in done:
+            continue
+        cycle = []
+        src = start
+        while src not in done:
+            done.add(src)
+            cycle.append((src, moves[src]))
+            src = moves[src]
+        # Break the cycle: the move into `start` becomes a DELETE of its source and a PUT of `start`.
+        src, dest = cycle.pop()
+        deletes.append(src)
+        puts.append(dest)
+        ordered_moves.extend(reversed(cycle))
+
+    return [
+        *[{"event": "DELETE", "path": path} for path in sorted(deletes)],
+        *[{"event": "MOVE", "path": src, "newPath": dest} for src, dest in ordered_moves],
+        *[{"event": "PUT", "path": path} for path in sorted(puts)],
+    ]
@@ -1,7 +1,22 @@
+import errno
+import fcntl
 import os
+import shutil
+import uuid
 
 from app.config.config import config
 
+# ioctl cloning a file: the clone shares the blocks of the file until either is modified (btrfs, xfs).
+FICLONE = 0x40049409
+COPY_CHUNK_SIZE = 64 * 1024 * 1024
+
+# How a file was copied or moved, see `copy_file` and `move_file`.
+REFLINK = "reflink"
+HARDLINK = "hardlink"
+RENAME = "rename"
+COPY_FILE_RANGE = "copy_file_range"
+COPY = "copy"
+
 def get_default_file_structure(username: str):
     return {
         "albums": {
@@ -92,3 +107,113 @@ def remove_dirs(base: str, path: str):
         except Exception:
             break
         dirs.pop()
+
+def copy_file(src_path: str, dest_path: str, hardlink: bool = True) -> str:
+    """
+    Copies a file with the cheapest primitive the filesystem supports, and returns the one used:
+    1. `REFLINK`: the copy shares the blocks of the file until either is modified.
+    2. `HARDLINK`: the copy is the same file. Only if `hardlink`, for files that are never modified in place.
+    3. `COPY_FILE_RANGE`: the kernel copies the blocks, without a round trip through user space.
+    4. `COPY`: a streaming copy.
+
+    The copy is written to a temporary file next to `dest_path` first, so `dest_path` never holds a partial copy.
+    The directory of `dest_path` must exist.
+    """
+    tmp_path = f"{os.path.dirname(dest_path)}/.{uuid.uuid4()}.copy"
+    try:
+        method = _copy_to_new_file(src_path, tmp_path, hardlink)
+        os.replace(tmp_path, dest_path)
+    except BaseException:
+        silentremove(tmp_path)
+        raise
+    return method
+
+def move_file(src_path: str, dest_path: str) -> str:
+    """
+    Moves a file, renaming it if it stays on the same filesystem. Otherwise, it's copied (see `copy_file`) with its
+    metadata, then removed. Returns the primitive used. The directory of `dest_path` must exist.
+    """
+    try:
+        os.rename(src_path, dest_path)
+        return RENAME
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+    method = copy_file(src_path, dest_path, hardlink=False)
+    shutil.copystat(src_path, dest_path)
+    os.remove(src_path)
+    return method
+
+def copy_files(path_pairs: list[tuple[str, str]], hardlink: bool = True) -> tuple[dict[str, str], list[str]]:
+    """
+    Copies the files, see `copy_file`. Each destination directory is created once.
+
+    Returns the primitive used for each copied file, by destination path, and the destination paths that failed.
+    """
+    return _bulk(lambda src_path, dest_path: copy_file(src_path, dest_path, hardlink), path_pairs, "copying")
+
+def move_files(path_pairs: list[tuple[str, str]]) -> tuple[dict[str, str], list[str]]:
+    """
+    Moves the files, see `move_file`. Each destination directory is created once.
+
+    Returns the primitive used for each moved file, by destination path, and the destination paths that failed.
+    """
+    return _bulk(move_file, path_pairs, "moving")
+
+def _bulk(op, path_pairs: list[tuple[str, str]], action: str) -> tuple[dict[str, str], list[str]]:
+    # Parents before their subdirectories, so each one is created once.
+    for dest_dir in sorted({os.path.dirname(dest_path) for _, dest_path in path_pairs}):
+        os.makedirs(dest_dir, exist_ok=True)
+
+    methods = {}
+    failure = []
+    for src_path, dest_path in path_pairs:
+        try:
+            methods[dest_path] = op(src_path, dest_path)
+        except OSError as e:
+            print(f"Error {action} {src_path} to {dest_path}: {e}")
+            failure.append(dest_path)
+    return methods, failure
+
+def _copy_to_new_file(src_path: str, dest_path: str, hardlink: bool) -> str:
+    if _reflink(src_path, dest_path):
+        return REFLINK
+    if hardlink:
+        try:
+            os.link(src_path, dest_path)
+            return HARDLINK
+        except OSError:
+            pass # E.g. not supported by the filesystem, or too many links.
+    with open(src_path, 'rb') as fsrc, open(dest_path, 'wb') as fdst:
+        if _copy_file_range(fsrc.fileno(), fdst.fileno()):
+            return COPY_FILE_RANGE
+    shutil.copyfile(src_path, dest_path)
+    return COPY
+
+def _reflink(src_path: str, dest_path: str) -> bool:
+    try:
+        with open(src_path, 'rb') as fsrc, open(dest_path, 'wb') as fdst:
+            fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+        return True
+    except OSError:
+        # Not supported by the filesystem, or across filesystems.
+        silentremove(dest_path)
+        return False
+
+def _copy_file_range(src_fd: int, dest_fd: int) -> bool:
+    """
+    Returns False if nothing was copied because the kernel or the filesystems don't support `copy_file_range`.
+    """
+    if not hasattr(os, 'copy_file_range'):
+        return False
+    copied = 0
+    while True:
+        try:
+            n = os.copy_file_range(src_fd, dest_fd, COPY_CHUNK_SIZE)
+        except OSError as e:
+            if copied == 0 and e.errno in {errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP, errno.EPERM}:
+                return False
+            raise
+        if n == 0:
+            return True
+        copied += n
@@ -5,10 +5,15 @@ Utilities for handling when the app goes offline.
 import os
 import json
 import csv
+import threading
+import time
 from datetime import datetime, timezone, timedelta
 
 from app.config.config import config
-from app.utils import offline, filesystem
+from app.utils import offline, filesystem, events
+
+# Guards the offline events file. Reentrant, so a reader can hold it across get -> clear.
+events_lock = threading.RLock()
 
 def write_poll_time():
     """
@@ -79,30 +84,77 @@ def create_offline_event(event: str, path: str, new_path = ''):
     return f"{timestamp},{event},{path}"
 
 def save_offline_events(events_file: str, events: list[str]):
-    with open(events_file, 'a') as f:
-        for event in events:
-            f.write(event + "\n")
+    with events_lock:
+        with open(events_file, 'a') as f:
+            for event in events:
+                f.write(event + "\n")
 
 def get_offline_events(events_file: str):
     events: list[dict[str, str]] = []
-    if not os.path.exists(events_file):
-        return events
-
-    with open(events_file, 'r') as f:
-        csv_file = csv.reader(f)
-        for line in csv_file:
-            if len(line) < 3:
-                continue
-            event = {'timestamp': line[0], 'event': line[1], 'path': line[2]}
-            if line[1] == 'MOVE':
-                event['newPath'] = line[3]
-            events.append(event)
+    with events_lock:
+        if not os.path.exists(events_file):
+            return events
+
+        with open(events_file, 'r') as f:
+            csv_file = csv.reader(f)
+            for line in csv_file:
+                if len(line) < 3:
+                    continue
+                event = {'timestamp': line[0], 'event': line[1], 'path': line[2]}
+                if line[1] == 'MOVE':
+                    event['newPath'] = line[3]
+                events.append(event)
     return events
 
 def clear_offline_events(events_file: str):
-    if os.path.exists(events_file):
-        with open(events_file, 'w') as file:
-            pass
+    with events_lock:
+        if os.path.exists(events_file):
+            with open(events_file, 'w') as file:
+                pass
+
+def compact_offline_events(events_file: str):
+    """
+    Rewrites the offline events as the minimal set of events with the same end result. See `events.compact_events`.
+    Paths are stored as keys ("albums/...").
+
+    Returns the number of events before and after the compaction.
+    """
+    with events_lock:
+        offline_events = get_offline_events(events_file)
+        if not offline_events:
+            return 0, 0
+        for evt in offline_events:
+            evt["path"] = filesystem.strip_base_dir(evt["path"])
+            if evt["event"] == "MOVE":
+                evt["newPath"] = filesystem.strip_base_dir(evt["newPath"])
+        compacted = events.compact_events(offline_events)
+
+        tmp_file = f'{events_file}.tmp'
+        with open(tmp_file, 'w') as f:
+            for evt in compacted:
+                f.write(create_offline_event(evt["event"], evt["path"], evt.get("newPath", '')) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_file, events_file)
+    return len(offline_events), len(compacted)
+
+def start_offline_events_compaction(events_file: str, interval: float):
+    """
+    Compacts the offline events every `interval` seconds in the background, so the log stays small during long outages.
+    """
+    def run():
+        while True:
+            time.sleep(interval)
+            try:
+                before, after = compact_offline_events(events_file)
+                if before != after:
+                    print(f"Compacted offline events: {before} -> {after}")
+            except Exception as e:
+                print(f"Error compacting offline events: {e}")
+
+    thread = threading.Thread(target=run, name="offline-events-compaction", daemon=True)
+    thread.start()
+    return thread
 
 def get_snapshot_time():
     """
@@ -1,6 +1,11 @@
+import concurrent.futures
+import contextlib
 import subprocess
 import os
+import threading
+import time
 import uuid
+from typing import Callable
 from dotenv import load_dotenv
 from werkzeug.datastructures import FileStorage
 from werkzeug.utils import secure_filename
@@ -41,6 +46,78 @@ def handle_duplicate_file(folder: str, name: str):
         loc = f"{folder}/{name_parts[0]}_{count}.{name_parts[1]}"
     return loc
 
+class CommandResult:
+    """The result of a command run by `run_bounded`."""
+    def __init__(self, path: str, exit_code: int, duration: float):
+        # The file the command was run on.
+        self.path = path
+        self.exit_code = exit_code
+        # Wall time in seconds, from starting the command to it exiting.
+        self.duration = duration
+
+    def __repr__(self):
+        return f"CommandResult({self.path}, exit_code={self.exit_code}, duration={self.duration:.2f}s)"
+
+def run_bounded(
+    commands: list[tuple[str, Callable[[], subprocess.Popen]]],
+    max_workers: int | None = None,
+    on_result: Callable[[CommandResult], None] | None = None
+) -> list[CommandResult]:
+    """
+    Run commands with at most `max_workers` of them running at the same time (defaults to the number of CPU cores).
+    The rest wait in a queue and are started in order as running commands exit.
+
+    commands: List of (path, start) where `path` is the file the command is for and `start()` launches the command.
+    on_result: Called (from a worker thread) with the result of each command as soon as it exits.
+
+    Returns the results in the same order as `commands`. A command that fails to launch has an exit code of -1.
+    """
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+
+    def run(path: str, start: Callable[[], subprocess.Popen]):
+        start_time = time.monotonic()
+        try:
+            exit_code = start().wait()
+        except OSError as e:
+            print(f"Error running command for {path}: {e}")
+            exit_code = -1
+        result = CommandResult(path, exit_code, time.monotonic() - start_time)
+        if on_result:
+            on_result(result)
+        return result
+
+    if not commands:
+        return []
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        futures = [executor.submit(run, path, start) for path, start in commands]
+        return [future.result() for future in futures]
+
+class ByteBudget:
+    """
+    Caps the number of bytes in flight at the same time, e.g. the bytes of the downloads in progress.
+    A reservation larger than the whole budget is allowed once nothing else is reserved, so it never blocks forever.
+    """
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.in_flight = 0
+        self.cond = threading.Condition()
+
+    @contextlib.contextmanager
+    def reserve(self, num_bytes: int):
+        """
+        Blocks until `num_bytes` fit in the budget, and releases them on exit.
+        """
+        with self.cond:
+            self.cond.wait_for(lambda: self.in_flight == 0 or self.in_flight + num_bytes <= self.max_bytes)
+            self.in_flight += num_bytes
+        try:
+            yield
+        finally:
+            with self.cond:
+                self.in_flight -= num_bytes
+                self.cond.notify_all()
+
 def heif_to_jpg(heif_path, jpg_path, quality:int):
     """
     Convert a HEIF/HEIC file to JPG using the `heif-convert` command.
@@ -52,16 +129,26 @@ def heif_to_jpg(heif_path, jpg_path, quality:int):
     proc = subprocess.Popen(["heif-convert", "-q", str(quality), heif_path, jpg_path_new])
     return proc
 
-def heifs_to_jpgs(heif_paths: list[str], jpg_paths: list[str], quality: int, cleanup: bool):
+def heifs_to_jpgs(
+    heif_paths: list[str],
+    jpg_paths: list[str],
+    quality: int,
+    cleanup: bool,
+    max_workers: int | None = None,
+    on_result: Callable[[CommandResult], None] | None = None
+):
     """
-    Convert multiple HEIF/HEIC files to JPG in parallel.
+    Convert multiple HEIF/HEIC files to JPG in parallel, running at most `max_workers` conversions at a time.
+    See `run_bounded`.
     """
-    procs: list[subprocess.Popen[bytes]] = []
-
-    for heif_path, jpg_path in zip(heif_paths, jpg_paths):
-        proc = heif_to_jpg(heif_path, jpg_path, quality)
-        procs.append(proc)
-    exit_codes = [proc.wait() for proc in procs]
+    commands = [
+        (heif_path, lambda heif_path=heif_path, jpg_path=jpg_path: heif_to_jpg(heif_path, jpg_path, quality))
+        for heif_path, jpg_path in zip(heif_paths, jpg_paths)
+    ]
+    results = run_bounded(commands, max_workers, on_result)
+    for result in results:
+        print(f"heif-convert {result.path}: exit code {result.exit_code} in {result.duration:.2f}s")
+    exit_codes = [result.exit_code for result in results]
 
     if cleanup:
         for heif_path in heif_paths:
@@ -77,16 +164,18 @@ def rotate_jpg(jpg_path):
     proc = subprocess.Popen(["exiftran", "-i", "-a", jpg_path])
     return proc
 
-def rotate_jpgs(jpg_paths: list[str]):
+def rotate_jpgs(
+    jpg_paths: list[str],
+    max_workers: int | None = None,
+    on_result: Callable[[CommandResult], None] | None = None
+):
     """
-    Rotate JPG files in parallel.
+    Rotate JPG files in parallel, running at most `max_workers` rotations at a time.
+    See `run_bounded`.
     """
-    procs = []
-    for jpg_path in jpg_paths:
-        proc = rotate_jpg(jpg_path)
-        procs.append(proc)
-    exit_codes = [proc.wait() for proc in procs]
-    return exit_codes
+    commands = [(jpg_path, lambda jpg_path=jpg_path: rotate_jpg(jpg_path)) for jpg_path in jpg_paths]
+    results = run_bounded(commands, max_workers, on_result)
+    return [result.exit_code for result in results]
 
 def rotate_jpg_by_degree(jpg_path: str, degree: int):
     """
@@ -111,6 +200,29 @@ def rotate_jpg_by_degree(jpg_path: str, degree: int):
     exit_code = proc.wait()
     return exit_code
 
+def resize_image(image_path: str, out_path: str, size: int | tuple[int, int], quality: int):
+    """
+    Scale an image down to fit in a `size`x`size` box (or a `width`x`height` box if `size` is a tuple) and save it as a
+    baseline JPG, using ImageMagick's `convert` command.
+
+    The EXIF orientation is applied and metadata is stripped. Images smaller than the box aren't upscaled.
+    """
+    width, height = size if isinstance(size, tuple) else (size, size)
+    os.makedirs(os.path.dirname(out_path), exist_ok=True)
+    proc = subprocess.Popen([
+        "convert",
+        # Lets the JPG decoder downscale while decoding, which is much faster for large images.
+        "-define", f"jpeg:size={width * 2}x{height * 2}",
+        f"{image_path}[0]",
+        "-auto-orient",
+        "-thumbnail", f"{width}x{height}>",
+        "-background", "white", "-flatten",
+        "-quality", str(quality),
+        "-interlace", "none",
+        f"jpg:{out_path}"
+    ])
+    return proc
+
 def save_image_to_disk(album_path: str, image_name: str, image: FileStorage, handle_duplicates: bool) -> str:
     loc = f"{album_path}/{image_name}"
     if handle_duplicates:
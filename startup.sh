@@ -8,11 +8,11 @@ echo $PYTHON_PATH
 cleanup() {
   echo "Stopping services..."
 
-  echo "Killing slideshow"
-  killall -15 fbi || true
-
-  echo "Killing display_slideshow.sh"
-  pkill -15 -f display_slideshow.sh || true
+  if [[ -n "$SLIDESHOW_PID" ]]; then
+    echo "Killing slideshow controller (PID: $SLIDESHOW_PID)"
+    kill -TERM "$SLIDESHOW_PID" || true
+    wait "$SLIDESHOW_PID" || true
+  fi
 
   if [[ -n "$EVENT_CONSUMER_PID" ]]; then
     echo "Killing event consumer (PID: $EVENT_CONSUMER_PID)"
@@ -34,6 +34,11 @@ cleanup() {
 # Trap signals
 trap cleanup SIGINT SIGTERM
 
+# start slideshow controller, which owns the display
+echo "Starting slideshow controller"
+PYTHONPATH=/usr/local/bin/pi-photo-album "$PYTHON_PATH" -m app.slideshow_controller.main &
+SLIDESHOW_PID=$!
+
 # start event consumer
 echo "Starting event consumer service"
 PYTHONPATH=/usr/local/bin/pi-photo-album "$PYTHON_PATH" -m app.event_consumer.main &